@@ -12,6 +12,7 @@ from route import routes
 from setting import settings
 from utils.log import LOG
 from utils.db import DB, REDIS
+from service.imagehub.build import ImageBuildService
 from constant import TORNADO_MAX_BODY_SIZE
 
 
@@ -37,6 +38,7 @@ class Application(tornado.web.Application):
 def main():
     try:
         app = Application()
+        ImageBuildService().recover()
         app.listen(address=options.address, port=options.port, max_body_size=TORNADO_MAX_BODY_SIZE)
         LOG.info('Sever Listen {port}...'.format(port=options.port))
         tornado.ioloop.IOLoop.instance().start()
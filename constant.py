@@ -44,6 +44,11 @@ EMPLOYEE_TO_ADMIN = 1
 ADMIN_TO_EMPLOYEE = 2
 SERVERS_REPORT_INFO = 'servers_report_info'
 INSTANCE_STATUS = 'instance_status'
+CONTAINER_INVENTORY = 'container_inventory'  # hash, 各主机agent上报的容器列表及inspect摘要, 以public_ip为key
+CONTAINER_INVENTORY_TTL = 120  # 超过该时间(秒)未上报时, 容器列表/详情改用ssh查询
+INSTANCE_SYNC_STATS = 'instance_sync_stats'  # hash, 实例同步各job(云:地域)的执行次数/耗时
+INSTANCE_REFRESH_QUEUE = 'instance_refresh_queue'  # zset, 待单独刷新的实例, score为下次刷新的时间
+INSTANCE_REFRESH_DEADLINE = 'instance_refresh_deadline'  # hash, 待刷新实例的截止时间
 #################################################################################################
 # 错误代码及信息
 #################################################################################################
@@ -92,24 +97,43 @@ ERR_TIP = {
 # ssh相关
 #################################################################################################
 SSH_CONNECT_TIMEOUT = 30
+# ssh连接池: 每台主机同时打开的channel数(sshd的MaxSessions默认为10) | 空闲多久后关闭连接 | 空闲多久后使用前检查连接, 单位秒
+SSH_MAX_SESSIONS_PER_HOST = 8
+SSH_POOL_IDLE_TIMEOUT = 300
+SSH_POOL_CHECK_INTERVAL = 30
+# ssh命令调度: 线程数 | 每台主机同时执行的命令数, 命令默认不超时, 需要时由调用方传入timeout
+SSH_POOL_COUNT = 30
+SSH_MAX_CONCURRENCY_PER_HOST = 4
+SSH_OUTPUT_MAX_LINES = 2000  # exec_rt返回(及写入数据库log字段)的输出只保留最后的行数
 SERVER_URL = settings['server_url']
 base_url = 'http://192.168.56.1:8010'
 MONITOR_CMD = 'curl -sSL {server_url}/supermonitor/install.sh | sh -s {server_url} {debug}'.format(server_url=SERVER_URL, debug=settings['debug'])
 UNINSTALL_CMD = 'curl -sSL {server_url}/supermonitor/uninstall.sh | sh '.format(server_url=SERVER_URL)
+SERVER_UNINSTALL_CONCURRENCY = 10  # 批量删除主机时同时卸载agent的主机数
 CREATE_IMAGE_CMD = 'curl -sSL {server_url}/supermonitor/scripts/create-image.sh | sh -s '.format(server_url=SERVER_URL)
 IMAGE_INFO_CMD = 'docker images %s --format "{{.Tag}},{{.CreatedAt}}" | sed -n 1,3p'
 REPOS_DOMAIN = '47.75.159.100:5000'
 DEPLOY_CMD = 'echo {password} | docker login {repository} -u {username} --password-stdin && docker pull {image_name} && docker run {portmap} -d --name {container_name} {image_name} '
+# 多台主机部署: all同时部署所有主机, batch每批batch_size台, canary逐台部署; 任一台失败则不再部署后续批次
+DEPLOY_ROLLOUT = ('all', 'batch', 'canary')
+DEPLOY_ROLLOUT_DEFAULT = 'batch'
+DEPLOY_BATCH_SIZE = 5
 LIST_CONTAINERS_CMD = 'docker ps -a --format "{{.ID}},{{.Names}},{{.Status}},{{.CreatedAt}}"'
 CONTAINER_INFO_CMD = 'docker inspect --format "{{json .}}" %s'
 START_CONTAINER_CMD = 'docker start {container_id}'
 STOP_CONTAINER_CMD = 'docker stop {container_id}'
 DEL_CONTAINER_CMD = STOP_CONTAINER_CMD + ' && docker rm {container_id}'
+RESTART_CONTAINER_CMD = 'docker restart {container_id}'
+# 批量操作容器: 同一主机的操作合成一条命令, 每个操作的输出前后打上标记, 按标记拆分出各自的结果
+CONTAINER_BATCH_CMD = {'start': START_CONTAINER_CMD, 'stop': STOP_CONTAINER_CMD, 'reboot': RESTART_CONTAINER_CMD,
+                       'delete': DEL_CONTAINER_CMD}
+CONTAINER_BATCH_MARK = '#TC_CONTAINER_OP#'
+CONTAINER_BATCH_MAX_ITEMS = 500
 LOAD_IMAGE_FILE = 'docker load --input {filename}'
 LOAD_IMAGE = """|tail -1|cut -d ' ' -f 3|awk '{b="docker tag "$0" hub.10.com/library/"$0; system(b); c="docker push hub.10.com/library/"$0; system(c)}'"""
 
 CLOUD_DOWNLOAD_IMAGE = 'wget -b -c --tries=3 --directory-prefix={store_path} {image_url}'
-K8S_APPLY_CMD = 'kubectl apply -f {server_url}/yaml/'.format(server_url=SERVER_URL)
+K8S_APPLY_CMD = 'kubectl apply -f -'  # yaml通过ssh的标准输入传入
 K8S_DELETE_CMD = 'kubectl delete '
 
 #################################################################################################
@@ -396,10 +420,39 @@ TENCLOUD_PROVIDER_LIST = {
 }
 TENCLOUD_PROVIDER_NAME = dict(zip(TENCLOUD_PROVIDER_LIST.values(), TENCLOUD_PROVIDER_LIST.keys()))
 
+# 同步实例时, 各云详情接口(镜像/磁盘)的最大并发数及每秒请求数
+CLOUD_API_LIMIT = {
+    ALIYUN_NAME: {'concurrency': 10, 'rate': 20},
+    QCLOUD_NAME: {'concurrency': 10, 'rate': 20},
+    ZCLOUD_NAME: {'concurrency': 10, 'rate': 20},
+}
+# 同步实例时镜像信息及各地域磁盘列表的缓存时间(秒), 镜像基本不会变化
+CLOUD_IMAGE_CACHE_TTL = 86400
+CLOUD_DISK_CACHE_TTL = 300
+# 实例全量同步(对账)的间隔(秒) | 接口出错时重试的初始间隔, 按指数退避 | 退避的上限
+INSTANCE_SYNC_INTERVAL = 600
+INSTANCE_SYNC_RETRY_INTERVAL = 15
+INSTANCE_SYNC_MAX_BACKOFF = 600
+# 开关机/重启后单独刷新实例: 首次刷新的延迟 | 状态未稳定时再次刷新的间隔 | 超过该时间不再刷新, 由全量同步处理
+INSTANCE_REFRESH_DELAY = 2
+INSTANCE_REFRESH_INTERVAL = 3
+INSTANCE_REFRESH_TIMEOUT = 300
+# 开机/重启后等待公网ip变化(亚马逊云): 首次轮询间隔 | 最大轮询间隔 | 最长等待时间, 单位秒
+CLOUD_IP_POLL_INTERVAL = 1
+CLOUD_IP_POLL_MAX_INTERVAL = 16
+CLOUD_IP_WAIT_TIMEOUT = 300
+CLOUD_BATCH_SIZE = 100  # 批量开关机/重启时每次请求的实例数
+# 用云账号密钥查询所有地域实例时的并发线程数, 及查询结果按账号缓存的时间(秒)
+CLOUD_SCAN_POOL_COUNT = 20
+CLOUD_CREDENTIAL_SCAN_TTL = 60
+
 #################################################################################################
 # http相关
 #################################################################################################
 HTTP_TIMEOUT = 20
+HTTP_POOL_SIZE = 20  # 每个云接口域名保持的连接数
+CLOUD_API_TIMEOUT = (5, HTTP_TIMEOUT)  # 云接口的(连接超时, 读取超时)
+CLOUD_API_PAGE_SIZE = 100  # 云接口分页获取时每页条数, 阿里云/腾讯云的上限均为100
 USER_AGENTS = [
     'Mozilla/5.0 (Linux; U; Android 2.3.6; en-us; Nexus S Build/GRK39F) AppleWebKit/533.1 (KHTML, like Gecko) Version/4.0 Mobile Safari/533.1',
     'Avant Browser/1.2.789rel1 (http://www.avantbrowser.com)',
@@ -491,6 +544,11 @@ SESSION_TIMEOUT = 1209600 # 二周
 # 其他
 #################################################################################################
 POOL_COUNT = 10
+WS_WORKER_COUNT = 20  # websocket中构建镜像/部署等耗时操作的线程数
+# websocket输出合并: 最长间隔(秒) | 达到该大小(字符)立即发送 | 客户端较慢时最多缓存的字符数, 超过则丢弃最早的行
+WS_OUTPUT_FLUSH_INTERVAL = 0.2
+WS_OUTPUT_FLUSH_SIZE = 16384
+WS_OUTPUT_MAX_BUFFER = 1048576
 AES_KEY = '01234^!@#$%56789'
 QINIU_POLICY = {
     "returnBody":
@@ -511,6 +569,45 @@ FORM_COMPANY = 2
 
 DEFAULT_PAGE_NUM = 20
 
+#################################################################################################
+# 监控数据保留策略
+# raw: 原始上报数据, docker: 容器原始上报数据(不归档), hour: 时平均, day: 天平均
+# keep_days 保留天数, span_days 每个分区的天数, rollup 删除前必须已完成汇总/归档的层级
+#################################################################################################
+METRIC_RETENTION = {
+    'raw': {
+        'tables': {'cpu': 'created_time', 'memory': 'created_time', 'disk': 'created_time', 'net': 'created_time'},
+        'keep_days': 7,
+        'span_days': 1,
+        'rollup': ['hour', 'day', 'archive']
+    },
+    'docker': {
+        'tables': {'docker_stat': 'created_time'},
+        'keep_days': 7,
+        'span_days': 1,
+        'rollup': ['hour', 'day']
+    },
+    'hour': {
+        'tables': {'server_log_hour': 'start_time', 'container_log_hour': 'start_time'},
+        'keep_days': 30,
+        'span_days': 7,
+        'rollup': ['day']
+    },
+    'day': {
+        'tables': {'server_log_day': 'start_time', 'container_log_day': 'start_time'},
+        'keep_days': 365,
+        'span_days': 30,
+        'rollup': []
+    }
+}
+METRIC_ROLLUP_SECONDS = {'hour': 3600, 'day': 86400, 'archive': 86400}
+METRIC_PARTITION_AHEAD = 3  # 提前创建的分区个数
+
+# 进程内缓存的最近监控数据, agent每30秒上报一次, 120条即最近一小时
+RECENT_METRIC_SIZE = 120
+RECENT_METRIC_MAX_HOSTS = 5000
+RECENT_METRIC_MAX_CONTAINERS = 5000
+
 #################################################################################################
 # Tornado
 #################################################################################################
@@ -602,6 +699,23 @@ IMAGE_STATUS['initial'] = 0
 IMAGE_STATUS['success'] = 1
 IMAGE_STATUS['failure'] = 2
 
+#################################################################################################
+# 镜像构建任务
+# 0 排队中, 1 构建中, 2 成功, 3 失败
+#################################################################################################
+IMAGE_BUILD_STATUS = dict()
+IMAGE_BUILD_STATUS['queued'] = 0
+IMAGE_BUILD_STATUS['running'] = 1
+IMAGE_BUILD_STATUS['success'] = 2
+IMAGE_BUILD_STATUS['failure'] = 3
+IMAGE_BUILD_PER_HOST = 2  # 每台构建主机同时构建的任务数, 构建线程数为构建主机数 * IMAGE_BUILD_PER_HOST
+IMAGE_BUILD_TIMEOUT = 3600  # 单个构建任务的超时(秒), 超时则中断构建并标记为失败
+IMAGE_BUILD_LOG = 'image_build_log:{}'  # redis list, 构建任务的输出, 每行一个元素
+IMAGE_BUILD_LOG_MAX_LINES = 10000
+IMAGE_BUILD_LOG_TTL = 604800  # 一周
+IMAGE_BUILD_LOG_FLUSH_INTERVAL = 0.5  # 构建输出写入redis的间隔(秒)
+IMAGE_BUILD_TAIL_INTERVAL = 0.5  # websocket读取构建输出的间隔(秒)
+
 #################################################################################################
 # 文件下载
 #################################################################################################
@@ -638,6 +752,7 @@ SERVER_OPERATE_STATUS['start'] = 0
 SERVER_OPERATE_STATUS['stop'] = 1
 SERVER_OPERATE_STATUS['reboot'] = 2
 SERVER_OPERATE_STATUS['change'] = 3
+SERVER_OPERATE_STATUS['delete'] = 4
 
 #################################################################################################
 # 容器操作行为码
@@ -1,6 +1,14 @@
 __author__ = 'Jon'
 
 '''获取各种云的实例,并更新数据库
+
+* 一个进程同步所有云的所有地域, 每个地域为一个job, 按INSTANCE_SYNC_INTERVAL全量同步(对账)
+* 开关机/重启的实例由ServerService写入INSTANCE_REFRESH_QUEUE, 这里只刷新这些实例, 状态未稳定时继续刷新
+* 接口出错时退避, 各job的耗时写入redis的INSTANCE_SYNC_STATS
+
+Usage::
+    python crontab/instance.py                  # 所有云
+    python crontab/instance.py --cloud=aliyun   # 只同步阿里云, 可以指定多个
 '''
 import sys
 import argparse
@@ -8,6 +16,7 @@ import time
 import traceback
 import logging
 import json
+import hashlib
 
 logging.basicConfig(stream=sys.stdout, level=logging.WARN)
 
@@ -20,9 +29,15 @@ from utils.datetool import seconds_to_human
 from utils.general import get_formats, get_in_formats
 from constant import ALIYUN_NAME, QCLOUD_NAME, ALIYUN_REGION_NAME, QCLOUD_REGION_NAME, ZCLOUD_REGION_LIST, \
     ZCLOUD_TYPE, ZCLOUD_NAME, ZCLOUD_REGION_NAME, TCLOUD_STATUS_MAKER, TCLOUD_STATUS, TENCLOUD_DISK_TYPE, \
-    TENCLOUD_INTERNET_PAID,TENCLOUD_INSTANCE_PAID, ALIYUN_INSTANCE_PAID, ALIYUN_INTERNET_PAID, INSTANCE_STATUS
+    TENCLOUD_INTERNET_PAID,TENCLOUD_INSTANCE_PAID, ALIYUN_INSTANCE_PAID, ALIYUN_INTERNET_PAID, INSTANCE_STATUS, \
+    CLOUD_API_LIMIT, CLOUD_IMAGE_CACHE_TTL, CLOUD_DISK_CACHE_TTL, ALIYUN_REGION_LIST, QCLOUD_REGION_LIST, \
+    INSTANCE_SYNC_INTERVAL, INSTANCE_SYNC_RETRY_INTERVAL, INSTANCE_SYNC_MAX_BACKOFF, INSTANCE_SYNC_STATS
+from utils import instance_refresh
+from utils.ratelimit import RateLimiter
+from utils.cache import TTLCache, MISSING
 from setting import settings
-from concurrent.futures import ThreadPoolExecutor, wait
+from threading import BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
 from DBUtils.PooledDB import PooledDB
 
 
@@ -38,25 +53,123 @@ DB = pool.connection()
 
 MAX_WORKERS = 20
 
+# 获取实例详情(镜像/磁盘)的线程池, 每个云另有并发数及频率限制
+DETAIL_POOL = ThreadPoolExecutor(MAX_WORKERS)
+API_LIMIT = {k: (BoundedSemaphore(v['concurrency']), RateLimiter(v['rate'])) for k, v in CLOUD_API_LIMIT.items()}
+
+# 跨轮次的缓存, 镜像以(provider, region, ImageId)为key, 磁盘以(provider, region)为key, 值为{InstanceId: [disk, ...]}
+IMAGE_CACHE = TTLCache(CLOUD_IMAGE_CACHE_TTL)
+DISK_CACHE = TTLCache(CLOUD_DISK_CACHE_TTL)
+
 
 class Instance:
-    def __init__(self):
+    def __init__(self, region=None, instance_ids=None):
+        '''
+        :param region: 只同步该地域, 为None时同步所有地域
+        :param instance_ids: 只刷新该地域的这些实例, 须同时指定region
+        '''
         self.provider = ''
+        self.region = region
+        self.instance_ids = instance_ids
         self.data = {}
         self.db_data = {}
         self.db = DB
         self.cur = ''
         self.redis = REDIS
+        self.operating = {}  # redis中的过渡状态 {public_ip: status}
+        self.expired_status = []
+        self.metrics = {}
+
+    def _call_api(self, func, arg):
+        ''' 在线程池中执行, 返回 (结果, 排队等待时间, 请求耗时) '''
+        semaphore, limiter = API_LIMIT[self.provider]
+        queued_at = time.time()
+        with semaphore:
+            limiter.acquire()
+            start = time.time()
+            result = func(arg)
+        return result, start - queued_at, time.time() - start
+
+    def fetch_details(self, jobs):
+        ''' 并发请求, 按完成顺序收集, 任何一个失败则整轮失败(避免用空数据覆盖数据库)
+        :param jobs: {key: (func, arg)}, 如 {(provider, region, image_id): (Aliyun.describe_images, i)}
+        :return: {key: func(arg)}
+        '''
+        start = time.time()
+        details = {}
+        futures = {DETAIL_POOL.submit(self._call_api, func, arg): key for key, (func, arg) in jobs.items()}
+
+        waited, costs = 0, []
+        try:
+            for f in as_completed(futures):
+                details[futures[f]], wait_time, cost = f.result()
+                waited += wait_time
+                costs.append(cost)
+        except Exception:
+            for f in futures:
+                f.cancel()
+            raise
+
+        self.metrics.update({
+            'detail_calls': self.metrics.get('detail_calls', 0) + len(costs),
+            'detail_cost': self.metrics.get('detail_cost', 0) + time.time() - start,
+            'detail_wait': self.metrics.get('detail_wait', 0) + waited,
+            'detail_max': max(costs + [self.metrics.get('detail_max', 0)]),
+        })
+        return details
+
+    def cached_details(self, jobs):
+        ''' 只请求缓存中没有的
+        :param jobs: {key: (cache, func, arg)}
+        :return: ({key: value}, 本次新请求的key集合)
+        '''
+        data = {key: cache.get(key, MISSING) for key, (cache, _, _) in jobs.items()}
+        missing = {key: jobs[key][1:] for key, v in data.items() if v is MISSING}
+
+        for key, v in self.fetch_details(missing).items():
+            jobs[key][0].set(key, v)
+            data[key] = v
+
+        self.metrics['cache_hits'] = self.metrics.get('cache_hits', 0) + len(data) - len(missing)
+        return data, set(missing)
+
+    def get_details(self, instances, describe_image, describe_region_disks=None):
+        ''' 获取实例的镜像及磁盘信息, 相同镜像只请求一次, 磁盘每个地域只请求一次
+        :param instances: [(instance_id, region_id, image_arg)], image_arg为传给describe_image的参数, 须包含ImageId
+        :return: {instance_id: (images, disks)}, 没有describe_region_disks时disks为None
+        '''
+        jobs = {}
+        for _, region_id, arg in instances:
+            jobs[(self.provider, region_id, arg.get('ImageId', ''))] = (IMAGE_CACHE, describe_image, arg)
+            if describe_region_disks:
+                jobs[(self.provider, region_id)] = (DISK_CACHE, describe_region_disks, region_id)
+
+        data, fresh = self.cached_details(jobs)
+
+        # 缓存的磁盘列表中找不到某个实例(新建的实例或磁盘有变化), 则该地域的缓存失效, 重新获取
+        if describe_region_disks:
+            stale = {(self.provider, r) for i, r, _ in instances if i not in data[(self.provider, r)]} - fresh
+            for key in stale:
+                DISK_CACHE.invalidate(key)
+            if stale:
+                data.update(self.cached_details({key: jobs[key] for key in stale})[0])
+
+        return {i: (data[(self.provider, r, arg.get('ImageId', ''))],
+                    data[(self.provider, r)].get(i, []) if describe_region_disks else None)
+                for i, r, arg in instances}
 
     def get_aliyun(self):
         self.provider = ALIYUN_NAME
 
-        instances = Aliyun.describe_instances()
-        if not len(instances):
-            return
+        if self.instance_ids:
+            instances = Aliyun.describe_instances_by_id(self.region, self.instance_ids)
+        else:
+            instances = Aliyun.describe_instances([self.region] if self.region else None)
+
+        details = self.get_details([(i['InstanceId'], i['region_id'], i) for i in instances],
+                                   Aliyun.describe_images, Aliyun.describe_region_disks)
         for i in instances:
-            disks = Aliyun.describe_disks(i)
-            images = Aliyun.describe_images(i)
+            images, disks = details[i['InstanceId']]
             status = TCLOUD_STATUS_MAKER.get(i.get('Status', ''), i.get('Status', ''))
             charge_type = i.get('InstanceChargeType', '')
             internet_charge_type = i.get('InternetChargeType', '')
@@ -94,9 +207,15 @@ class Instance:
     def get_qcloud(self):
         self.provider = QCLOUD_NAME
 
-        instances = Qcloud.describe_instances()
+        if self.instance_ids:
+            instances = Qcloud.describe_instances_by_id(self.region, self.instance_ids)
+        else:
+            instances = Qcloud.describe_instances([self.region] if self.region else None)
+
+        details = self.get_details([(i['InstanceId'], i['region_id'], i) for i in instances], Qcloud.describe_images)
         for i in instances:
-            status = TCLOUD_STATUS_MAKER.get(Qcloud.instance_status(i))
+            # 2017-03-12版本的DescribeInstances已返回InstanceState, 不必逐台调用DescribeInstancesStatus
+            status = TCLOUD_STATUS_MAKER.get(i.get('InstanceState'))
             system_disk_type = i.get('SystemDisk', {}).get('DiskType')
             disks = [
                 {
@@ -116,7 +235,7 @@ class Instance:
                         }
                     )
                     disks.append(d)
-            images = Qcloud.describe_images(i)
+            images, _ = details[i['InstanceId']]
 
             # 当购买出带宽小于10Mbps， 入带宽为10Mbps,大于10Mbps时，与出带宽一样
             out_bandwidth = i.get('InternetAccessible', {}).get('InternetMaxBandwidthOut', '')
@@ -163,21 +282,26 @@ class Instance:
     def get_zcloud(self):
         self.provider = ZCLOUD_NAME
 
-        pool = ThreadPoolExecutor(MAX_WORKERS)
+        region_list = [self.region] if self.region else list(ZCLOUD_REGION_LIST)
         futures = []
 
-        for region in ZCLOUD_REGION_LIST:
-            futures.append(pool.submit(Zcloud.get_instances, region))
+        for region in region_list:
+            if self.instance_ids:
+                futures.append(DETAIL_POOL.submit(Zcloud.describe_instances_by_id, region, self.instance_ids))
+            else:
+                futures.append(DETAIL_POOL.submit(Zcloud.get_instances, region))
 
         wait(futures)
 
-        for f, region in zip(futures, ZCLOUD_REGION_LIST):
-            r = f.result()
+        regions = [(f.result(), region) for f, region in zip(futures, region_list)]
+        details = self.get_details([(j.get('InstanceId'), region, {'region_id': region, 'ImageId': j.get('ImageId', '')})
+                                    for r, region in regions for j in r],
+                                   Zcloud.describe_image, Zcloud.describe_region_disks)
 
+        for r, region in regions:
             for j in r:
                 status = TCLOUD_STATUS_MAKER.get(j.get('State', {}).get('Name'), '')
-                images = Zcloud.describe_image({'region_id': region, 'ImageId': j.get('ImageId', '')})
-                disks = Zcloud.describe_disk({'region_id': region})
+                images, disks = details[j.get('InstanceId')]
 
                 self.data[j.get('InstanceId')] = {
                     'instance_id': j.get('InstanceId'),
@@ -208,26 +332,55 @@ class Instance:
                 }
 
     def save(self):
+        ''' 只读取content_hash比较, 删除/新增/更新在同一个事务中批量执行
+        '''
         self.cur = self.db.cursor()
 
         sql = '''
-            SELECT * FROM instance WHERE provider = %s
+            SELECT instance_id, content_hash FROM instance WHERE provider = %s
         '''
-        self.cur.execute(sql, self.provider)
+        arg = [self.provider]
+        if self.region:
+            sql += ' AND region_id = %s'
+            arg.append(self.region)
+        if self.instance_ids:
+            sql += ' AND ' + get_in_formats('instance_id', self.instance_ids)
+            arg.extend(self.instance_ids)
+        self.cur.execute(sql, arg)
         result = self.cur.fetchall()
 
         self.db_data = self._change_format(result)
+        hashes = {k: self._hash(v) for k, v in self.data.items()}
 
         instances_in_db = set(self.db_data.keys())
         instances_latest = set(self.data.keys())
 
-        del_instances = list(instances_in_db - instances_latest)
+        # 正在开关机/重启的实例, 每轮都需要根据redis中的状态重新判断; 一次读取整个hash, 后续只在内存中判断
+        self.operating = self.redis.hgetall(INSTANCE_STATUS)
+        self.expired_status = []
+
+        # 单独刷新时接口没有返回的实例不删除, 由全量同步确认
+        del_instances = [] if self.instance_ids else list(instances_in_db - instances_latest)
         add_instances = list(instances_latest - instances_in_db)
-        update_instances = list(instances_latest & instances_in_db)
+        update_instances = [i for i in instances_latest & instances_in_db
+                            if hashes[i] != self.db_data[i] or self.data[i]['public_ip'] in self.operating]
+
+        self.db.begin()
+        try:
+            if del_instances: self._to_del(del_instances)
+            if add_instances: self._to_add(add_instances, hashes)
+            if update_instances: self._to_update(update_instances, hashes)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        # 事务提交后再一次删除已失效的状态, 回滚时保留redis中的状态
+        if self.expired_status:
+            self.redis.hdel(INSTANCE_STATUS, *self.expired_status)
 
-        if del_instances: self._to_del(del_instances)
-        if add_instances: self._to_add(add_instances)
-        if update_instances: self._to_update(update_instances)
+        self.metrics.update({'deleted': len(del_instances), 'added': len(add_instances), 'updated': len(update_instances),
+                             'expired_status': len(self.expired_status)})
 
     def _to_del(self, instances):
         for table in ['server', 'instance']:
@@ -235,83 +388,213 @@ class Instance:
 
             self.cur.execute(sql, instances)
 
-    def _to_add(self, instances):
-        for instance in instances:
-            keys = self.data[instance].keys()
-            values = [self.data[instance][k] for k in keys]
+    def _rows(self, instances, hashes):
+        keys = list(self.data[instances[0]].keys()) + ['content_hash']
+        rows = [[self.data[i][k] for k in keys[:-1]] + [hashes[i]] for i in instances]
+        return keys, rows
 
-            sql = 'INSERT INTO instance( ' + ','.join(keys) + ')' + ' VALUES ('
-            sql += get_formats(values) + ')'
-            self.cur.execute(sql, values)
+    def _to_add(self, instances, hashes):
+        keys, rows = self._rows(instances, hashes)
 
-    def _remove_invalid_status(self, instance):
-        old_status = self.redis.hget(INSTANCE_STATUS, instance['public_ip'])
-        if old_status is None:
-            old_status = instance['status']
-        new_status = instance['status']
-        old_bool = (old_status == TCLOUD_STATUS[7]) or (old_status == TCLOUD_STATUS[8]) or (old_status == TCLOUD_STATUS[9])
-        if old_bool and (new_status == TCLOUD_STATUS[2]):
-            return old_status
-        self.redis.hdel(INSTANCE_STATUS, instance['public_ip'])
-        return new_status
+        sql = 'INSERT INTO instance( ' + ','.join(keys) + ')' + ' VALUES ('
+        sql += get_formats(keys) + ')'
+        self.cur.executemany(sql, rows)
 
-    def _to_update(self, instances):
-        real_update = []
+    @staticmethod
+    def _resolve_status(old_status, new_status):
+        '''
+        :param old_status: redis中记录的过渡状态, 没有时为None
+        :return: (写入数据库的状态, redis中的状态是否已失效)
+        '''
+        if old_status is None:
+            return new_status, False
+        # 正在启动/停止/重启时, 云接口可能仍返回运行中, 保留过渡状态
+        if old_status in (TCLOUD_STATUS[7], TCLOUD_STATUS[8], TCLOUD_STATUS[9]) and new_status == TCLOUD_STATUS[2]:
+            return old_status, False
+        return new_status, True
 
+    def _to_update(self, instances, hashes):
         for instance in instances:
-            for k, v in self.data[instance].items():
-                if v != self.db_data[instance][k]:
-                    real_update.append(self.data[instance])
-                    break
-
-        for i in real_update:
-            s, data = [], []
+            data = self.data[instance]
+            data['status'], expired = self._resolve_status(self.operating.get(data['public_ip']), data['status'])
+            if expired:
+                self.expired_status.append(data['public_ip'])
 
-            i['status'] = self._remove_invalid_status(i)
-            for k, v in i.items():
-                s.append('{}=%s'.format(k))
-                data.append(v)
+        keys, rows = self._rows(instances, hashes)
 
-            data.append(i['instance_id'])
+        # 批量UPDATE, 不能用ON DUPLICATE KEY UPDATE: public_ip也是唯一键, 公网IP被分配给其他实例时会覆盖那一行
+        sets = [k for k in keys if k != 'instance_id']
+        idx = keys.index('instance_id')
+        sql = 'UPDATE instance SET ' + ','.join('{}=%s'.format(k) for k in sets) + ' WHERE instance_id=%s'
+        self.cur.executemany(sql, [[v for n, v in enumerate(row) if n != idx] + [row[idx]] for row in rows])
 
-            sql = 'UPDATE instance SET ' + ','.join(s) + ' WHERE instance_id = %s'
-
-            self.cur.execute(sql, data)
+    @staticmethod
+    def _hash(data):
+        return hashlib.md5(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
 
     def _change_format(self, result):
-        return {i['instance_id']: i for i in result}
+        return {i['instance_id']: i['content_hash'] for i in result}
+
+
+class SyncJob:
+    ''' 一个云的一个地域 '''
+
+    def __init__(self, cloud, region):
+        self.cloud = cloud
+        self.region = region
+        self.name = '{}:{}'.format(cloud, region)
+        self.next_run = 0
+        self.failures = 0
+        self.stats = {'runs': 0, 'errors': 0, 'last_run': 0, 'last_cost': 0, 'total_cost': 0}
+
+    def interval(self):
+        ''' 出错时指数退避, 否则按全量同步的间隔 '''
+        if self.failures:
+            return min(INSTANCE_SYNC_RETRY_INTERVAL * 2 ** self.failures, INSTANCE_SYNC_MAX_BACKOFF)
+        return INSTANCE_SYNC_INTERVAL
+
+
+class SyncDaemon:
+    ''' 所有云所有地域的实例同步, 每个地域为一个job, 按各自的间隔执行, 共用一个数据库连接
+        开关机/重启的实例在两次全量同步之间单独刷新
+    '''
+    regions = {
+        'aliyun': ALIYUN_REGION_LIST,
+        'qcloud': QCLOUD_REGION_LIST,
+        'zcloud': ZCLOUD_REGION_LIST
+    }
 
+    providers = {
+        ALIYUN_NAME: 'aliyun',
+        QCLOUD_NAME: 'qcloud',
+        ZCLOUD_NAME: 'zcloud'
+    }
 
-def main():
-    parser = argparse.ArgumentParser(description='Different clouds')
-    parser.add_argument('--cloud', choices=['aliyun', 'qcloud', 'zcloud'], help='which cloud to play')
-    args = parser.parse_args()
+    # 云接口中的过渡状态, 刷新到这些状态时继续刷新
+    transitional = {TCLOUD_STATUS[7], TCLOUD_STATUS[8], TCLOUD_STATUS[9]}
 
-    obj = Instance()
+    def __init__(self, clouds):
+        self.jobs = [SyncJob(cloud, region) for cloud in clouds for region in self.regions[cloud]]
+        self.clouds = clouds
+        self.redis = REDIS
+        self.refresh_stats = {'runs': 0, 'errors': 0, 'instances': 0, 'total_cost': 0}
 
-    cloud_func = {
-        'aliyun': obj.get_aliyun,
-        'qcloud': obj.get_qcloud,
-        'zcloud': obj.get_zcloud
-    }
+    @staticmethod
+    def _cloud_func(obj, cloud):
+        return {
+            'aliyun': obj.get_aliyun,
+            'qcloud': obj.get_qcloud,
+            'zcloud': obj.get_zcloud
+        }[cloud]
+
+    def run_job(self, job):
+        obj = Instance(job.region)
 
-    while True:
         start_time = time.time()
-        logging.warning('{:>12}: {}'.format('Start ' + args.cloud, seconds_to_human(start_time)))
         try:
-            cloud_func[args.cloud]()
+            self._cloud_func(obj, job.cloud)()
             obj.save()
+            job.failures = 0
         except Exception:
-            logging.error(traceback.format_exc())
+            job.failures += 1
+            job.stats['errors'] += 1
+            logging.error('{}\n{}'.format(job.name, traceback.format_exc()))
         finally:
             if obj.cur:
                 obj.cur.close()
 
-        end_time = time.time()
-        logging.warning('{:>12}: {}'.format('End ' + args.cloud, seconds_to_human(end_time)))
-        logging.warning('{:>12}: {}s'.format('Cost', end_time - start_time))
-        time.sleep(1.5)
+        cost = time.time() - start_time
+        job.stats.update({
+            'runs': job.stats['runs'] + 1,
+            'last_run': int(start_time),
+            'last_cost': round(cost, 3),
+            'total_cost': round(job.stats['total_cost'] + cost, 3),
+            'failures': job.failures,
+        })
+        job.stats.update(obj.metrics)
+        self.redis.hset(INSTANCE_SYNC_STATS, job.name, json.dumps(job.stats))
+
+        logging.warning('{:>24}: {:.2f}s {}'.format(job.name, cost, ' '.join(
+            '{}={}'.format(k, round(v, 2) if isinstance(v, float) else v) for k, v in sorted(obj.metrics.items()))))
+
+    def _settled(self, obj, instance_id):
+        ''' 实例的状态已稳定: 接口没有返回该实例(由全量同步处理), 或redis中的过渡状态已清除且云接口不在过渡状态 '''
+        data = obj.data.get(instance_id)
+        if data is None:
+            return True
+        waiting = data['public_ip'] in obj.operating and data['public_ip'] not in obj.expired_status
+        return not waiting and data['status'] not in self.transitional
+
+    def run_refresh(self):
+        ''' 刷新队列中已到时间的实例, 同一云同一地域的实例请求一次 '''
+        items = instance_refresh.pop_due(self.redis, [p for p, c in self.providers.items() if c in self.clouds])
+        if not items:
+            return
+
+        groups = {}
+        for provider, region_id, instance_id in items:
+            groups.setdefault((provider, region_id), []).append(instance_id)
+
+        for (provider, region_id), instance_ids in groups.items():
+            name = '{}:{}'.format(self.providers[provider], region_id)
+            group = [(provider, region_id, i) for i in instance_ids]
+            obj = Instance(region_id, instance_ids)
+
+            start_time = time.time()
+            try:
+                self._cloud_func(obj, self.providers[provider])()
+                obj.save()
+            except Exception:
+                self.refresh_stats['errors'] += 1
+                logging.error('refresh {}\n{}'.format(name, traceback.format_exc()))
+                instance_refresh.retry(self.redis, group)
+                continue
+            finally:
+                if obj.cur:
+                    obj.cur.close()
+
+            settled = [i for i in group if self._settled(obj, i[2])]
+            instance_refresh.done(self.redis, settled)
+            instance_refresh.retry(self.redis, [i for i in group if i not in settled])
+
+            cost = time.time() - start_time
+            self.refresh_stats.update({
+                'runs': self.refresh_stats['runs'] + 1,
+                'instances': self.refresh_stats['instances'] + len(group),
+                'total_cost': round(self.refresh_stats['total_cost'] + cost, 3),
+                'last_run': int(start_time),
+            })
+            logging.warning('{:>24}: {:.2f}s refreshed={} settled={}'.format(name, cost, len(group), len(settled)))
+
+        self.redis.hset(INSTANCE_SYNC_STATS, 'refresh', json.dumps(self.refresh_stats))
+
+    def run_forever(self):
+        while True:
+            self.run_refresh()
+
+            now = time.time()
+            due = [job for job in self.jobs if job.next_run <= now]
+            for job in sorted(due, key=lambda j: j.next_run):
+                self.run_job(job)
+                job.next_run = time.time() + job.interval()
+
+                # 全量同步耗时较长, 每个job之间处理一次刷新队列
+                self.run_refresh()
+
+            if not due:
+                time.sleep(min(max(min(j.next_run for j in self.jobs) - time.time(), 0.1), 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Different clouds')
+    parser.add_argument('--cloud', choices=['aliyun', 'qcloud', 'zcloud'], action='append',
+                        help='which cloud to play, all clouds by default')
+    args = parser.parse_args()
+
+    clouds = args.cloud or ['aliyun', 'qcloud', 'zcloud']
+    logging.warning('{:>12}: {}'.format('Start ' + ','.join(clouds), seconds_to_human(time.time())))
+    SyncDaemon(clouds).run_forever()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
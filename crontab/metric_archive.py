@@ -0,0 +1,110 @@
+'''将原始监控数据(cpu/memory/disk/net)按主机按天归档为列式segment文件
+
+* 在sync_server_log.py day之后执行, 默认归档前一天
+* 归档完成后写入metric_rollup(tier='archive'), metric_retention.py以此判断原始数据可否删除
+
+* metric_retention.py prune不会删除没有归档记录的原始数据分区, 上线前的历史数据需先用--from补齐
+
+Usage::
+    python crontab/metric_archive.py                     # 归档昨天
+    python crontab/metric_archive.py 2018-10-01          # 归档指定日期
+    python crontab/metric_archive.py --from 2018-10-01   # 归档从指定日期到昨天的每一天
+'''
+import os
+import sys
+import json
+import datetime
+import pymysql.cursors
+from setting import settings
+from utils.metric_archive import ARCHIVE_FIELDS, write_segment, segment_path, day_range
+
+db = pymysql.connect(host=settings['mysql_host'],
+                     user=settings['mysql_user'],
+                     password=settings['mysql_password'],
+                     db=settings['mysql_database'],
+                     charset=settings['mysql_charset'],
+                     cursorclass=pymysql.cursors.DictCursor)
+
+
+class MetricArchive:
+
+    table_rollup = 'metric_rollup'
+
+    def __init__(self, day):
+        self.db = db
+        self.day = day
+        self.start_time, self.end_time = day_range(day)
+        self.root = settings['metric_archive_path']
+        if not os.path.isabs(self.root):
+            raise ValueError("settings['metric_archive_path']必须为绝对路径")
+
+    def get_public_ip(self):
+        with self.db.cursor() as cur:
+            cur.execute('SELECT public_ip FROM server')
+            ips = cur.fetchall()
+        return [x['public_ip'] for x in ips]
+
+    def archive_ip(self, ip):
+        ''' 逐行读取一天的数据, 写成一个segment, 返回行数 '''
+        times = []
+        columns = {'{}.{}'.format(t, f): [] for t, fields in ARCHIVE_FIELDS.items() for f in fields}
+
+        with self.db.cursor(pymysql.cursors.SSDictCursor) as cur:
+            sql = """
+                SELECT c.created_time AS created_time, c.content AS cpu, d.content AS disk, m.content AS memory, n.content AS net
+                FROM cpu AS c
+                JOIN disk AS d ON c.public_ip=d.public_ip AND c.created_time=d.created_time
+                JOIN memory AS m ON c.public_ip=m.public_ip AND c.created_time=m.created_time
+                JOIN net AS n ON c.public_ip=n.public_ip AND c.created_time=n.created_time
+                WHERE c.public_ip=%s AND c.created_time>=%s AND c.created_time<%s
+                ORDER BY c.created_time
+                """
+            cur.execute(sql, [ip, self.start_time, self.end_time])
+            for row in cur:
+                times.append(row['created_time'])
+                for table, fields in ARCHIVE_FIELDS.items():
+                    content = json.loads(row[table])
+                    for f in fields:
+                        columns['{}.{}'.format(table, f)].append(content.get(f) or 0)
+
+        if times:
+            write_segment(segment_path(self.root, ip, self.day), times, columns)
+
+        return len(times)
+
+    def save_rollup(self):
+        with self.db.cursor() as cur:
+            sql = """
+                    INSERT INTO {table} (tier, start_time, end_time) VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE end_time=%s
+                """.format(table=self.table_rollup)
+            cur.execute(sql, ['archive', self.start_time, self.end_time, self.end_time])
+        self.db.commit()
+
+    def run(self):
+        for ip in self.get_public_ip():
+            num = self.archive_ip(ip)
+            print('%s %s rows' % (ip, num))
+        self.save_rollup()
+
+
+def parse_day(s):
+    return datetime.datetime.strptime(s, '%Y-%m-%d').date()
+
+
+if __name__ == '__main__':
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+
+    if len(sys.argv) > 2 and sys.argv[1] == '--from':
+        start = parse_day(sys.argv[2])
+        days = [start + datetime.timedelta(days=n) for n in range((yesterday - start).days + 1)]
+    elif len(sys.argv) > 1:
+        days = [parse_day(sys.argv[1])]
+    else:
+        days = [yesterday]
+
+    for day in days:
+        print("#### start archive %s ####" % day)
+        MetricArchive(day).run()
+        print("#### end archive %s ####" % day)
+    db.close()
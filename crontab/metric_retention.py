@@ -0,0 +1,207 @@
+'''监控数据的保留与清理
+
+* 各个监控表按时间做RANGE分区, 清理时直接DROP PARTITION, 不需要逐行DELETE
+* 只有对应时间段的汇总(metric_rollup表)已经写入, 才会删除该分区
+* metric_rollup是在汇总任务上线后才开始写入的, migrate时不回补历史汇总记录;
+  早于某层级第一条汇总记录的数据视为该层级已完成, 否则迁移前的历史分区永远无法删除.
+  某层级一条汇总记录都没有时(汇总任务尚未运行), 不删除任何分区
+* archive层级除外: 未归档的原始数据删除后无法恢复, 缺少归档记录的分区一律保留,
+  历史数据需先用metric_archive.py --from补齐归档
+* 策略见constant.METRIC_RETENTION
+
+Usage::
+    python crontab/metric_retention.py migrate   # 将已有的表转换为分区表, 只需执行一次
+    python crontab/metric_retention.py prune     # 创建新分区并删除过期分区, 每天执行
+'''
+import sys
+import time
+import datetime
+import pymysql.cursors
+from setting import settings
+from constant import METRIC_RETENTION, METRIC_ROLLUP_SECONDS, METRIC_PARTITION_AHEAD
+
+db = pymysql.connect(host=settings['mysql_host'],
+                     user=settings['mysql_user'],
+                     password=settings['mysql_password'],
+                     db=settings['mysql_database'],
+                     charset=settings['mysql_charset'],
+                     cursorclass=pymysql.cursors.DictCursor,
+                     autocommit=True)
+
+PARTITION_PREFIX = 'p'
+PARTITION_MAX = 'pmax'
+STRICT_TIERS = ('archive',)  # 不适用"早于第一条汇总记录视为已完成"的层级
+
+
+def day_start(timestamp):
+    ''' timestamp所在日期的零点 '''
+    return int(time.mktime(datetime.date.fromtimestamp(timestamp).timetuple()))
+
+
+def add_days(timestamp, days):
+    d = datetime.date.fromtimestamp(timestamp) + datetime.timedelta(days=days)
+    return int(time.mktime(d.timetuple()))
+
+
+def partition_name(lower):
+    return PARTITION_PREFIX + datetime.date.fromtimestamp(lower).strftime('%Y%m%d')
+
+
+def partition_lower(name):
+    return int(time.mktime(datetime.datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m%d').timetuple()))
+
+
+class MetricRetention:
+
+    table_rollup = 'metric_rollup'
+
+    def __init__(self):
+        self.db = db
+        self.now = int(time.time())
+        self._first_rollup = {}
+
+    def _execute(self, sql, arg=None):
+        with self.db.cursor() as cur:
+            cur.execute(sql, arg)
+            return cur.fetchall()
+
+    def get_partitions(self, table):
+        ''' 按顺序返回分区 [{'name': 'p20181019', 'upper': int}, ...], pmax的upper为None
+        '''
+        sql = """
+            SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS upper
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+            """
+        data = self._execute(sql, [settings['mysql_database'], table])
+        for i in data:
+            i['upper'] = None if i['name'] == PARTITION_MAX else int(i['upper'])
+        return data
+
+    def _partition_defs(self, lower, until, span_days):
+        ''' 生成[lower, until)之间的分区定义 '''
+        defs = []
+        while lower < until:
+            upper = add_days(lower, span_days)
+            defs.append('PARTITION {name} VALUES LESS THAN ({upper})'.format(name=partition_name(lower), upper=upper))
+            lower = upper
+        return defs
+
+    def _ahead(self, span_days):
+        return add_days(day_start(self.now), span_days * METRIC_PARTITION_AHEAD)
+
+    ############################################################################################
+    # 迁移
+    ############################################################################################
+    def migrate_table(self, table, column, span_days):
+        if self.get_partitions(table):
+            print('%s already partitioned' % table)
+            return
+
+        # 分区字段必须包含在主键中
+        self._execute('ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column})'.format(table=table, column=column))
+
+        data = self._execute('SELECT MIN({column}) AS min_time FROM {table}'.format(table=table, column=column))
+        min_time = data[0]['min_time'] or self.now
+
+        defs = self._partition_defs(day_start(min_time), self._ahead(span_days), span_days)
+        defs.append('PARTITION {name} VALUES LESS THAN MAXVALUE'.format(name=PARTITION_MAX))
+
+        sql = 'ALTER TABLE {table} PARTITION BY RANGE ({column}) ({defs})'.format(table=table, column=column,
+                                                                                  defs=', '.join(defs))
+        self._execute(sql)
+        print('%s partitioned by %s, %s partitions' % (table, column, len(defs)))
+
+    def migrate(self):
+        for policy in METRIC_RETENTION.values():
+            for table, column in policy['tables'].items():
+                self.migrate_table(table, column, policy['span_days'])
+
+    ############################################################################################
+    # 清理
+    ############################################################################################
+    def add_partitions(self, table, span_days):
+        ''' 从pmax中拆出新的分区, 保证未来几个周期的分区存在 '''
+        partitions = self.get_partitions(table)
+        uppers = [i['upper'] for i in partitions if i['upper'] is not None]
+        if not uppers:
+            return
+
+        defs = self._partition_defs(uppers[-1], self._ahead(span_days), span_days)
+        if not defs:
+            return
+
+        defs.append('PARTITION {name} VALUES LESS THAN MAXVALUE'.format(name=PARTITION_MAX))
+        sql = 'ALTER TABLE {table} REORGANIZE PARTITION {pmax} INTO ({defs})'.format(table=table, pmax=PARTITION_MAX,
+                                                                                     defs=', '.join(defs))
+        self._execute(sql)
+
+    def is_empty(self, table, partition):
+        data = self._execute('SELECT 1 FROM {table} PARTITION ({partition}) LIMIT 1'.format(table=table, partition=partition))
+        return not data
+
+    def first_rollup(self, tier):
+        ''' 该层级第一条汇总记录的开始时间, 没有记录时返回None '''
+        if tier not in self._first_rollup:
+            sql = 'SELECT MIN(start_time) AS start_time FROM {table} WHERE tier=%s'.format(table=self.table_rollup)
+            data = self._execute(sql, [tier])
+            self._first_rollup[tier] = data[0]['start_time']
+        return self._first_rollup[tier]
+
+    def is_rolled_up(self, lower, upper, tiers):
+        ''' [lower, upper)内每个汇总周期的记录都已写入, 早于第一条汇总记录的部分视为已完成 '''
+        for tier in tiers:
+            first = self.first_rollup(tier)
+            if first is None:
+                return False
+
+            start = lower if tier in STRICT_TIERS else max(lower, first)
+            if start >= upper:
+                continue
+
+            sql = """
+                SELECT COUNT(*) AS num FROM {table}
+                WHERE tier=%s AND start_time>=%s AND end_time<=%s
+                """.format(table=self.table_rollup)
+            data = self._execute(sql, [tier, start, upper])
+            if data[0]['num'] < (upper - start) // METRIC_ROLLUP_SECONDS[tier]:
+                return False
+        return True
+
+    def prune_table(self, table, policy):
+        self.add_partitions(table, policy['span_days'])
+
+        cutoff = add_days(day_start(self.now), -policy['keep_days'])
+        to_drop = []
+
+        for p in self.get_partitions(table):
+            if p['upper'] is None or p['upper'] > cutoff:
+                continue
+
+            if self.is_empty(table, p['name']) or self.is_rolled_up(partition_lower(p['name']), p['upper'], policy['rollup']):
+                to_drop.append(p['name'])
+            else:
+                print('%s %s skipped, rollup not finished' % (table, p['name']))
+
+        if to_drop:
+            self._execute('ALTER TABLE {table} DROP PARTITION {names}'.format(table=table, names=','.join(to_drop)))
+            print('%s dropped %s' % (table, ','.join(to_drop)))
+
+    def prune(self):
+        for policy in METRIC_RETENTION.values():
+            for table in policy['tables']:
+                self.prune_table(table, policy)
+
+
+if __name__ == '__main__':
+    retention = MetricRetention()
+    if sys.argv[1] == 'migrate':
+        print("#### start migrate metric tables ####")
+        retention.migrate()
+        print("#### end migrate metric tables ####")
+    elif sys.argv[1] == 'prune':
+        print("#### start prune metric tables ####")
+        retention.prune()
+        print("#### end prune metric tables ####")
+    retention.db.close()
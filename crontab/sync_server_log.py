@@ -1,8 +1,8 @@
 import json
 import time
-import statistics
 import sys
 import datetime
+import resource
 import pymysql.cursors
 from setting import settings
 
@@ -14,12 +14,30 @@ db = pymysql.connect(host=settings['mysql_host'],
                      cursorclass=pymysql.cursors.DictCursor)
 
 
+class Avg:
+    ''' 单遍累加求平均, 只保存和与个数, 内存与数据行数无关
+    '''
+    __slots__ = ('total', 'count')
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value):
+        self.total += float(value)
+        self.count += 1
+
+    def value(self):
+        return "%.2f" % (self.total / self.count) if self.count else ''
+
+
 class ServerLog:
 
     table_hour = 'server_log_hour'
     table_day = 'server_log_day'
     table_container_hour = 'container_log_hour'
     table_container_day = 'container_log_day'
+    table_rollup = 'metric_rollup'
 
     def __init__(self):
         self.data = []
@@ -52,7 +70,10 @@ class ServerLog:
         return [x['public_ip'] for x in ips]
 
     def get_data(self, ip, table, fields):
-        with self.db.cursor() as cur:
+        ''' 使用无缓冲的SSDictCursor逐行读取, 不会一次性把整段时间的数据加载到内存
+            必须把生成器迭代完, 才能在同一连接上执行下一条sql
+        '''
+        with self.db.cursor(pymysql.cursors.SSDictCursor) as cur:
             arg = [
                 ip,
                 self.start_time,
@@ -64,123 +85,71 @@ class ServerLog:
                 WHERE public_ip = %s AND created_time >= %s AND created_time < %s
                 """.format(table=table, fields=fields)
             cur.execute(sql, arg)
-            data = cur.fetchall()
-        return data
+            for row in cur:
+                yield row
 
     def cal_container_performance(self, ip):
-        resp = self.get_data(ip=ip, table='docker_stat', fields='container_name, content')
-        if not resp:
-            return {}
+        fields = {
+            'cpu': 'cpu',
+            'block_input': 'block_input',
+            'block_output': 'block_output',
+            'memory_limit': 'mem_limit',
+            'memory_usage': 'mem_usage',
+            'memory_percent': 'mem_percent',
+            'net_input': 'net_input',
+            'net_output': 'net_output'
+        }
         containers, data = dict(), dict()
-        for i in resp:
+        for i in self.get_data(ip=ip, table='docker_stat', fields='container_name, content'):
             name = i['container_name']
             if name not in containers:
-                containers[name] = {
-                                    'cpu': [],
-                                    'block_input': [],
-                                    'block_output': [],
-                                    'memory_usage': [],
-                                    'memory_limit': [],
-                                    'memory_percent': [],
-                                    'net_input': [],
-                                    'net_output': []
-                                    }
+                containers[name] = {k: Avg() for k in fields}
             content = json.loads(i['content'])
-            containers[name]['cpu'].append(float(content['cpu']))
-            containers[name]['block_input'].append(float(content['block_input']))
-            containers[name]['block_output'].append(float(content['block_output']))
-            containers[name]['memory_limit'].append(float(content['mem_limit']))
-            containers[name]['memory_usage'].append(float(content['mem_usage']))
-            containers[name]['memory_percent'].append(float(content['mem_percent']))
-            containers[name]['net_input'].append(float(content['net_input']))
-            containers[name]['net_output'].append(float(content['net_output']))
-
-        for name in containers:
-            if name not in data:
-                data[name] = {
-                    'cpu': {},
-                    'block': {},
-                    'memory': {},
-                    'net': {}
+            for k, v in fields.items():
+                containers[name][k].add(content[v])
+
+        for name, avg in containers.items():
+            data[name] = {
+                'cpu': {'percent': avg['cpu'].value()},
+                'block': {
+                    'block_input': avg['block_input'].value(),
+                    'block_output': avg['block_output'].value(),
+                },
+                'memory': {
+                    'memory_limit': avg['memory_limit'].value(),
+                    'memory_usage': avg['memory_usage'].value(),
+                    'memory_percent': avg['memory_percent'].value()
+                },
+                'net': {
+                    'net_input': avg['net_input'].value(),
+                    'net_output': avg['net_output'].value()
                 }
-            data[name]['cpu'] = {'percent': "%.2f" % (statistics.mean(containers[name]['cpu']))}
-            data[name]['block'] = {
-                'block_input': "%.2f" % (statistics.mean(containers[name]['block_input'])),
-                'block_output': "%.2f" % (statistics.mean(containers[name]['block_output'])),
-            }
-            data[name]['memory'] = {
-                'memory_limit': "%.2f" % (statistics.mean(containers[name]['memory_limit'])),
-                'memory_usage': "%.2f" % (statistics.mean(containers[name]['memory_usage'])),
-                'memory_percent': "%.2f" % (statistics.mean(containers[name]['memory_percent']))
-            }
-            data[name]['net'] = {
-                'net_input': "%.2f" % (statistics.mean(containers[name]['net_input'])),
-                'net_output': "%.2f" % (statistics.mean(containers[name]['net_output']))
             }
 
         return data
 
+    def _cal_avg(self, ip, table, fields):
+        ''' 对table中content的各个字段求平均
+        :param fields: dict, 返回的字段名: content中的字段名
+        '''
+        avg = {k: Avg() for k in fields}
+        for x in self.get_data(ip=ip, table=table, fields='content'):
+            content = json.loads(x['content'])
+            for k, v in fields.items():
+                avg[k].add(content[v])
+        return {k: v.value() for k, v in avg.items()}
+
     def cal_cpu(self, ip):
-        data, avg = [], ''
-        resp = self.get_data(ip=ip, table='cpu', fields='content')
-        if resp:
-            for x in resp:
-                content = json.loads(x['content'])
-                data.append(content['percent'])
-            avg = "%.2f" % (statistics.mean(data))
-        return {'percent': avg}
+        return self._cal_avg(ip, 'cpu', {'percent': 'percent'})
 
     def cal_disk(self, ip):
-        total, free, percent, util = [], [], [], []
-        total_avg, free_avg, percent_avg, util_avg = '', '', '', ''
-        resp = self.get_data(ip=ip, table='disk', fields='content')
-        if resp:
-            for x in resp:
-                content = json.loads(x['content'])
-                total.append(content['total'])
-                free.append(content['free'])
-                percent.append(content['percent'])
-                util.append(content['utilize'])
-            total_avg = "%.2f" % (statistics.mean(total))
-            free_avg = "%.2f" % (statistics.mean(free))
-            percent_avg = "%.2f" % (statistics.mean(percent))
-            util_avg = ".2f" % (statistics.mean(util))
-        return {'total': total_avg, 'free': free_avg, 'percent': percent_avg, 'utilize': util_avg}
+        return self._cal_avg(ip, 'disk', {'total': 'total', 'free': 'free', 'percent': 'percent', 'utilize': 'utilize'})
 
     def cal_memory(self, ip):
-        total, free, percent, avaible = [], [], [], []
-        total_avg, free_avg, percent_avg, avaible_avg = '', '', '', ''
-        resp = self.get_data(ip=ip, table='memory', fields='content')
-        if resp:
-            for x in resp:
-                content = json.loads(x['content'])
-                total.append(content['total'])
-                free.append(content['free'])
-                percent.append(content['percent'])
-                avaible.append(content['available'])
-            total_avg = "%.2f" % (statistics.mean(total))
-            free_avg = "%.2f" % (statistics.mean(free))
-            percent_avg = "%.2f" % (statistics.mean(percent))
-            avaible_avg = "%.2f" % (statistics.mean(avaible))
-        return {
-            'total': total_avg,
-            'free': free_avg,
-            'percent': percent_avg,
-            'available': avaible_avg
-        }
+        return self._cal_avg(ip, 'memory', {'total': 'total', 'free': 'free', 'percent': 'percent', 'available': 'available'})
 
     def cal_net(self, ip):
-        recv, send = [], []
-        recv_avg, send_avg = '', ''
-        resp = self.get_data(ip=ip, table='net', fields='content')
-        if resp:
-            for x in resp:
-                content = json.loads(x['content'])
-                recv.append(content['input'])
-                send.append(content['output'])
-            recv_avg = "%.2f" % (statistics.mean(recv))
-            send_avg = "%.2f" % (statistics.mean(send))
-        return {'input': recv_avg, 'output': send_avg}
+        return self._cal_avg(ip, 'net', {'input': 'input', 'output': 'output'})
 
     def cal(self):
         for ip in self.ips:
@@ -238,10 +207,21 @@ class ServerLog:
                     """.format(table=table)
                 cursor.execute(sql, arg)
 
+    def _save_rollup(self, tier):
+        ''' 记录该时间段已汇总完成, 数据清理(metric_retention.py)以此为准
+        '''
+        with self.db.cursor() as cursor:
+            sql = """
+                    INSERT INTO {table} (tier, start_time, end_time) VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE end_time=%s
+                """.format(table=self.table_rollup)
+            cursor.execute(sql, [tier, self.start_time, self.end_time, self.end_time])
+
     def save_hour(self):
         for ip in self.data:
             self._save(params=ip, table=self.table_hour)
             self._save_container(params=ip,table=self.table_container_hour)
+        self._save_rollup('hour')
         self.db.commit()
         self.db.close()
 
@@ -249,10 +229,17 @@ class ServerLog:
         for ip in self.data:
             self._save(params=ip, table=self.table_day)
             self._save_container(params=ip,table=self.table_container_day)
+        self._save_rollup('day')
         self.db.commit()
         self.db.close()
 
 
+def peak_rss():
+    ''' 当前进程的内存峰值, 单位MB (linux下ru_maxrss单位为KB)
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
 def avg_hour():
     server = ServerLog()
     server.time_hour()
@@ -261,6 +248,7 @@ def avg_hour():
     print("#### start sync hour ####")
     server.save_hour()
     print("#### end sync hour ####")
+    print("#### peak rss: %.2fMB ####" % peak_rss())
     print("#### end sync server performance log ####")
 
 
@@ -271,6 +259,7 @@ def avg_day():
     print("#### start sync day ####")
     server.save_day()
     print("#### end sync day ####")
+    print("#### peak rss: %.2fMB ####" % peak_rss())
     print("#### end sync server performance log ####")
 
 
@@ -48,6 +48,11 @@ const (
 	format  = "--format"
 	pattern = "{{.Name}},{{.Container}},{{.PIDs}},{{.CPUPerc}},{{.MemPerc}},{{.MemUsage}},{{.BlockIO}},{{.NetIO}}"
 
+	ps        = "ps"
+	psAll     = "-a"
+	psPattern = "{{.ID}},{{.Names}},{{.Status}},{{.CreatedAt}}"
+	inspect   = "inspect"
+
 	cat    = "/bin/cat"
 	uptime = "/proc/uptime"
 )
@@ -86,6 +91,7 @@ type Stat struct {
 	Net        *NetStat               `json:"net"`
 	SystemLoad *SystemLoad            `json:"system_load"`
 	Docker     map[string]*DockerStat `json:"docker"`
+	Containers []*ContainerInfo       `json:"containers"`
 	K8sNode    string                 `json:"k8s_node"`
 	K8sDeploy  string                 `json:"k8s_deployment"`
 	K8sRS      string                 `json:"k8s_replicaset"`
@@ -363,6 +369,80 @@ func (a *agent) getDocketStat() (map[string]*DockerStat, error) {
 	return resp, nil
 }
 
+// ContainerInfo 容器列表, 与docker ps -a的输出一致, 附带inspect摘要, 服务端据此返回容器列表/详情, 不再ssh
+type ContainerInfo struct {
+	ID        string            `json:"id"`
+	Name      string            `json:"name"`
+	Status    string            `json:"status"`
+	CreatedAt string            `json:"created_at"`
+	Inspect   *ContainerInspect `json:"inspect,omitempty"`
+}
+
+// ContainerInspect docker inspect的摘要, 只保留服务端使用的字段, 字段名与docker inspect一致
+type ContainerInspect struct {
+	ID      string `json:"Id"`
+	Name    string `json:"Name"`
+	Created string `json:"Created"`
+	State   struct {
+		Status string `json:"Status"`
+	} `json:"State"`
+	Config struct {
+		ExposedPorts map[string]interface{} `json:"ExposedPorts,omitempty"`
+		WorkingDir   string                 `json:"WorkingDir"`
+		Cmd          []string               `json:"Cmd"`
+		Volumes      map[string]interface{} `json:"Volumes"`
+	} `json:"Config"`
+	HostConfig struct {
+		VolumesFrom []string `json:"VolumesFrom"`
+		Dns         []string `json:"Dns"`
+		Links       []string `json:"Links"`
+	} `json:"HostConfig"`
+	NetworkSettings struct {
+		Ports map[string]interface{} `json:"Ports"`
+	} `json:"NetworkSettings"`
+}
+
+func (a *agent) getContainers() ([]*ContainerInfo, error) {
+	out, err := exec.Command(docker, ps, psAll, format, psPattern).Output()
+	if err != nil {
+		return nil, err
+	}
+	resp := []*ContainerInfo{}
+	ids := []string{inspect}
+	for _, v := range strings.Split(string(out), "\n") {
+		fields := strings.SplitN(v, ",", 4)
+		if len(fields) != 4 {
+			continue
+		}
+		resp = append(resp, &ContainerInfo{ID: fields[0], Name: fields[1], Status: fields[2], CreatedAt: fields[3]})
+		ids = append(ids, fields[0])
+	}
+	if len(resp) == 0 {
+		return resp, nil
+	}
+
+	// 所有容器一次inspect, 期间被删除的容器会使命令返回错误, 其余容器的输出照常使用
+	out, err = exec.Command(docker, ids...).Output()
+	if err != nil && len(out) == 0 {
+		a.logger.Println(err)
+		return resp, nil
+	}
+	var inspects []*ContainerInspect
+	if err := json.Unmarshal(out, &inspects); err != nil {
+		a.logger.Println(err)
+		return resp, nil
+	}
+	for _, c := range resp {
+		for _, i := range inspects {
+			if strings.HasPrefix(i.ID, c.ID) {
+				c.Inspect = i
+				break
+			}
+		}
+	}
+	return resp, nil
+}
+
 type SystemLoad struct {
 	SystemDate  string  `json:"date"`
 	Runtime     string  `json:"run_time"`
@@ -506,6 +586,11 @@ func (a *agent) postData() {
 		a.logger.Println(err)
 		docker = map[string]*DockerStat{}
 	}
+	// 获取失败时不上报(null), 服务端的容器列表过期后改用ssh
+	containers, err := a.getContainers()
+	if err != nil {
+		a.logger.Println(err)
+	}
 	k8s_node, err := a.getK8sNodeInfo()
 	if err != nil {
 		a.logger.Println(err)
@@ -557,6 +642,7 @@ func (a *agent) postData() {
 		Net:        net,
 		SystemLoad: load,
 		Docker:     docker,
+		Containers: containers,
 		K8sNode:    k8s_node,
 		K8sDeploy:  k8s_deployment,
 		K8sRS:      k8s_replicaset,
@@ -5,16 +5,15 @@ import json
 import os
 
 from tornado.gen import coroutine
-from tornado.ioloop import IOLoop
 from handler.base import BaseHandler, WebSocketBaseHandler
 from utils.decorator import is_login, require
 from utils.context import catch
 from utils.general import validate_application_name, validate_image_name
 from setting import settings
 from handler.user import user
-from constant import SUCCESS, FAILURE, OPERATION_OBJECT_STYPE, OPERATE_STATUS, LABEL_TYPE, PROJECT_OPERATE_STATUS, \
+from constant import FAILURE, OPERATION_OBJECT_STYPE, OPERATE_STATUS, LABEL_TYPE, PROJECT_OPERATE_STATUS, \
                      RIGHT, SERVICE, FORM_COMPANY, FORM_PERSON, MSG_PAGE_NUM, APPLICATION_STATE, DEPLOYMENT_STATUS, \
-                     SERVICE_STATUS, IMAGE_STATUS, REPOS_DOMAIN
+                     SERVICE_STATUS
 
 
 class ApplicationNewHandler(BaseHandler):
@@ -361,7 +360,7 @@ class ApplicationSummaryHandler(BaseHandler):
 
 
 class ImageCreationHandler(WebSocketBaseHandler):
-    def on_message(self, message):
+    def process_message(self, message):
         self.params.update(json.loads(message))
 
         try:
@@ -370,45 +369,27 @@ class ImageCreationHandler(WebSocketBaseHandler):
             self.guarantee(*args)
             validate_image_name(self.params.get('image_name'))
 
-            # 记录用户操作应用开始构建的动作
+            # 记录用户操作应用开始构建的动作, 构建成功后由构建任务更新
             log_params = {
                 'user_id': self.current_user['id'],
                 'object_id': self.params['app_id'],
                 'object_type': OPERATION_OBJECT_STYPE['application'],
             }
-            IOLoop.current().spawn_callback(callback=self.init_operation_log, params=log_params)
+            self.main_loop.spawn_callback(callback=self.init_operation_log, params=log_params)
 
             # 生成dockerfile文件
             self.save_dockerfile(self.params['image_name'], self.params['app_name'], self.params['dockerfile'])
-            # 获取构建服务器的信息并进行构建
-            login_info = self.application_service.sync_fetch_ssh_login_info({'public_ip': settings['ip_for_image_creation']})
-            self.params.update(login_info)
-            out, err = self.application_service.create_image(params=self.params, out_func=self.write_message)
-
-            # 生成镜像数据
-            log = {"out": out, "err": err}
-            arg = {'name': self.params['image_name'], 'version': self.params['version'], 'app_id': self.params['app_id'],
-                   'url': REPOS_DOMAIN + '/' + self.params['app_name'] + '/' + self.params['image_name'] + ':' + self.params['version'],
-                   'dockerfile': self.params['dockerfile'], 'log': json.dumps(log)}
-            arg.update(self.get_lord())
-            self.application_service.add_image_data(arg)
-
-            # 构建成功或失败错误，刷新应用的状态（正常或异常）
-            if err:
-                self.application_service.sync_update({'status': APPLICATION_STATE['abnormal']}, {'id': self.params.get('app_id')})
-                self.image_service.sync_update({'state': IMAGE_STATUS['failure']}, {'name': self.params['image_name'], 'version': self.params['version']})
-            else:
-                IOLoop.current().spawn_callback(callback=self.finish_operation_log, params=log_params)
-                self.application_service.sync_update({'status': APPLICATION_STATE['normal']}, {'id': self.params.get('app_id')})
-                self.image_service.sync_update({'state': IMAGE_STATUS['success']}, {'name': self.params['image_name'], 'version': self.params['version']})
 
-            self.write_message(FAILURE if err else SUCCESS)
+            # 提交构建任务, 连接断开后构建照常进行, 可通过任务ID重新查看输出
+            job_id = self.image_build_service.submit(kind='application', params=self.params,
+                                                     user_id=self.current_user['id'], lord=self.get_lord())
+            self.send('构建任务ID: {}'.format(job_id))
+            self.main_loop.add_callback(self.tail_build, job_id)
         except Exception as e:
             self.log.error(traceback.format_exc())
-            self.write_message(str(e))
-            self.write_message(FAILURE)
-        finally:
-            self.close()
+            self.send(str(e))
+            self.send(FAILURE)
+            self.close_later()
 
     @coroutine
     def init_operation_log(self, log_params):
@@ -420,17 +401,6 @@ class ImageCreationHandler(WebSocketBaseHandler):
             'operation_status': OPERATE_STATUS['fail'],
         })
 
-    @coroutine
-    def finish_operation_log(self, log_params):
-        yield self.server_operation_service.update(
-            sets={'operation_status': OPERATE_STATUS['success']},
-            conds={
-                'user_id': log_params['user_id'],
-                'object_id': log_params['object_id'],
-                'object_type': log_params['object_type']
-            }
-        )
-
     def save_dockerfile(self, image_name, app_name, dockerfile=''):
         if not dockerfile:
             raise ValueError('请输入Dockerfile内容')
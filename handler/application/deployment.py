@@ -4,7 +4,6 @@ import os
 import yaml
 
 from tornado.gen import coroutine
-from tornado.ioloop import IOLoop
 from handler.base import BaseHandler, WebSocketBaseHandler
 from utils.decorator import is_login, require
 from utils.context import catch
@@ -37,7 +36,7 @@ class K8sDeploymentHandler(WebSocketBaseHandler):
         self.deployment_service.sync_delete({'id': params['deployment_id']})
         return out, err
 
-    def on_message(self, message):
+    def process_message(self, message):
         self.params.update(json.loads(message))
 
         try:
@@ -66,19 +65,15 @@ class K8sDeploymentHandler(WebSocketBaseHandler):
                 'object_id': self.params['app_id'],
                 'object_type': OPERATION_OBJECT_STYPE['deployment'],
             }
-            IOLoop.current().spawn_callback(callback=self.init_operation_log, params=log_params)
-
-            # 生成yaml文件并归档到服务器yaml目录下
-            filename = self.save_yaml(self.params['app_name'], self.params['deployment_name'], 'deployment', self.params['yaml'])
+            self.main_loop.spawn_callback(callback=self.init_operation_log, params=log_params)
 
             # 获取集群master的信息并进行部署
             login_info = self.application_service.sync_fetch_ssh_login_info({'public_ip': server_info['public_ip']})
-            login_info.update({'filename': filename})
             if self.params.get('deployment_id') and duplicate.get('name', '') != self.params['deployment_name']:
                 login_info['deployment_id'] = self.params.get('deployment_id')
                 login_info['app_name'] = self.params['app_name']
-                self.delete_deployment(params=login_info, out_func=self.write_message)
-            out, err = self.k8s_apply(params=login_info, out_func=self.write_message)
+                self.delete_deployment(params=login_info, out_func=self.send_output)
+            out, err = self.k8s_apply(params=login_info, manifests=self.params['yaml'], out_func=self.send_output)
 
             # 生成部署数据
             log = {"out": out, "err": err}
@@ -87,7 +82,7 @@ class K8sDeploymentHandler(WebSocketBaseHandler):
                    'yaml': self.params['yaml'], 'log': json.dumps(log), 'server_id': self.params['server_id']}
             arg.update(self.get_lord())
             res = self.deployment_service.add_deployment(arg)
-            self.write_message('deployment ID:' + str(res.get('id', 0)))
+            self.send('deployment ID:' + str(res.get('id', 0)))
 
             if err:
                 self.application_service.sync_update({'status': APPLICATION_STATE['abnormal']}, {'id': self.params.get('app_id')})
@@ -95,14 +90,14 @@ class K8sDeploymentHandler(WebSocketBaseHandler):
                 self.application_service.sync_update({'status': APPLICATION_STATE['normal']}, {'id': self.params.get('app_id')})
 
             # 反馈结果
-            self.write_message(FAILURE if err else SUCCESS)
+            self.send(FAILURE if err else SUCCESS)
 
         except Exception as e:
             self.log.error(traceback.format_exc())
-            self.write_message(str(e))
-            self.write_message(FAILURE)
+            self.send(str(e))
+            self.send(FAILURE)
         finally:
-            self.close()
+            self.close_later()
 
 
 class K8sDeploymentNameCheckHandler(BaseHandler):
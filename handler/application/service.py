@@ -1,10 +1,8 @@
 import traceback
 import json
-import os
 import yaml
 
 from tornado.gen import coroutine
-from tornado.ioloop import IOLoop
 from handler.base import BaseHandler, WebSocketBaseHandler
 from utils.decorator import is_login, require
 from utils.context import catch
@@ -114,7 +112,7 @@ class K8sServiceHandler(WebSocketBaseHandler):
         self.service_service.sync_delete({'id': params['service_id']})
         return out, err
 
-    def on_message(self, message):
+    def process_message(self, message):
         self.params.update(json.loads(message))
 
         try:
@@ -139,17 +137,12 @@ class K8sServiceHandler(WebSocketBaseHandler):
             # 记录用户操作应用开始构建的动作
 
 
-            # 生成yaml文件并归档到服务器yaml目录下
-            filename = self.save_yaml(self.params['app_name'], self.params['service_name'], 'service',
-                                      self.params['yaml'])
-
             # 获取集群master的信息并进行部署
             login_info = self.application_service.sync_fetch_ssh_login_info({'public_ip': server_info['public_ip']})
-            login_info.update({'filename': filename})
             if self.params.get('service_id'):
                 login_info['service_id'] = self.params.get('service_id')
-                self.delete_service(params=login_info, out_func=self.write_message)
-            out, err = self.k8s_apply(params=login_info, out_func=self.write_message)
+                self.delete_service(params=login_info, out_func=self.send_output)
+            out, err = self.k8s_apply(params=login_info, manifests=self.params['yaml'], out_func=self.send_output)
 
             # 生成部署数据
             log = {"out": out, "err": err}
@@ -161,7 +154,7 @@ class K8sServiceHandler(WebSocketBaseHandler):
             if self.params.get('service_id'):
                 arg['id'] = self.params.get('service_id')
             index = self.service_service.sync_add(arg)
-            self.write_message('service ID:' + str(index))
+            self.send('service ID:' + str(index))
 
             if err:
                 self.application_service.sync_update({'status': APPLICATION_STATE['abnormal']},
@@ -171,13 +164,13 @@ class K8sServiceHandler(WebSocketBaseHandler):
                                                      {'id': self.params.get('app_id')})
 
             # 反馈结果
-            self.write_message(FAILURE if err else SUCCESS)
+            self.send(FAILURE if err else SUCCESS)
         except Exception as e:
             self.log.error(traceback.format_exc())
-            self.write_message(str(e))
-            self.write_message(FAILURE)
+            self.send(str(e))
+            self.send(FAILURE)
         finally:
-            self.close()
+            self.close_later()
 
 class ServiceDeleteHandler(BaseHandler):
     @is_login
@@ -496,18 +489,6 @@ class IngressInfolHandler(BaseHandler):
 
 
 class IngressConfigHandler(BaseHandler):
-    def save_yaml(self, app_name, obj_name, obj_type, yaml):
-        full_path = os.path.join('/var/www/Dashboard/static', 'yaml')
-        if not os.path.exists(full_path): os.makedirs(full_path)
-
-        filename = app_name + "." + obj_name + "." + obj_type + ".yaml"
-        fullname = os.path.join(full_path, filename)
-
-        with open(fullname, 'wb') as f:
-            f.write(yaml.encode())
-
-        return filename
-
     @is_login
     @coroutine
     def post(self):
@@ -560,11 +541,9 @@ class IngressConfigHandler(BaseHandler):
                 yaml_json['spec']['rules'].append(rule_item)
 
             ingress_yaml = yaml.dump(yaml_json, default_flow_style=False)
-            # 生成yaml文件并归档到服务器yaml目录下
-            filename = self.save_yaml(app_name, ingress_name, 'ingress', ingress_yaml)
 
             ssh_info = yield self.application_service.fetch_ssh_login_info({'server_id': app_info['server_id']})
-            ssh_info['cmd'] = K8S_APPLY_CMD + filename
+            ssh_info.update({'cmd': K8S_APPLY_CMD, 'stdin': ingress_yaml})
 
             _, err = yield self.service_service.remote_ssh(ssh_info)
 
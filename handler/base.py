@@ -43,15 +43,17 @@ import jwt
 import time
 import datetime
 import traceback
-import os
 
 import tornado.web
 from service.permission.permission_template import PermissionTemplateService
-from tornado.gen import coroutine
+from tornado.gen import coroutine, sleep
+from tornado.ioloop import IOLoop
 from tornado.websocket import WebSocketHandler
+from concurrent.futures import ThreadPoolExecutor
 
 from constant import SESSION_TIMEOUT, SESSION_KEY, TOKEN_EXPIRES_DAYS, RIGHT, SERVICE, SUCCESS_STATUS, FAILURE_STATUS, \
-                     FORM_COMPANY, FORM_PERSON, USER_LATEST_TOKEN, FAILURE_CODE, K8S_APPLY_CMD, K8S_DELETE_CMD
+                     FORM_COMPANY, FORM_PERSON, USER_LATEST_TOKEN, FAILURE_CODE, K8S_APPLY_CMD, K8S_DELETE_CMD, \
+                     WS_WORKER_COUNT, SUCCESS, FAILURE, IMAGE_BUILD_STATUS, IMAGE_BUILD_TAIL_INTERVAL
 from service.cluster.cluster import ClusterService
 from service.company.company import CompanyService
 from service.company.company_employee import CompanyEmployeeService
@@ -64,6 +66,7 @@ from service.application.application import ApplicationService
 from service.application.deployment import DeploymentService, ReplicaSetService, PodService
 from service.application.service import ServiceService, EndpointService, IngressService
 from service.imagehub.image import ImageService
+from service.imagehub.build import ImageBuildService
 from service.project.project import ProjectService
 from service.project.project_versions import ProjectVersionService
 from service.repository.repository import RepositoryService
@@ -74,11 +77,12 @@ from service.user.user import UserService
 from service.label.label import LabelService
 from service.cloud.cloud_credentials import CloudCredentialsService
 from setting import settings
-from utils.general import json_dumps, json_loads
+from utils.general import json_dumps, json_loads, k8s_manifest
 from utils.datetool import seconds_to_human
 from utils.error import AppError
 from utils.context import catch
 from utils.ssh import SSH
+from utils.ws_output import OutputBuffer
 
 class BaseHandler(tornado.web.RequestHandler):
     cluster_service = ClusterService()
@@ -86,6 +90,7 @@ class BaseHandler(tornado.web.RequestHandler):
     project_service = ProjectService()
     application_service = ApplicationService()
     image_service = ImageService()
+    image_build_service = ImageBuildService()
     deployment_service = DeploymentService()
     replicaset_service = ReplicaSetService()
     pod_service = PodService()
@@ -324,10 +329,19 @@ class BaseHandler(tornado.web.RequestHandler):
 
 
 class WebSocketBaseHandler(WebSocketHandler, BaseHandler):
+    ''' 构建镜像/部署等耗时的操作, 子类实现process_message, 在worker线程池中执行, 不阻塞IOLoop
+        worker线程中不能直接调用write_message/close, 使用send/send_output/close_later由IOLoop线程执行
+        命令的输出用send_output, 合并后发送; 结果等控制消息用send, 单独一帧, 在此之前的输出先发送
+    '''
+    worker = ThreadPoolExecutor(max_workers=WS_WORKER_COUNT)
+
     def check_origin(self, origin):
         return True
 
     def open(self):
+        self.main_loop = IOLoop.current()
+        self.output = OutputBuffer(self.main_loop, self._write)
+
         user_id = self.decode_auth_token(self.params['Authorization']) if self.params.get('Authorization') else 0
         self._current_user = {'id': user_id}
         self.params['cid'] = int(self.params.get('Cid'))
@@ -343,11 +357,68 @@ class WebSocketBaseHandler(WebSocketHandler, BaseHandler):
             self.write_message('open')
 
     def on_message(self, message):
+        future = self.worker.submit(self.process_message, message)
+        future.add_done_callback(self._log_worker_error)
+
+    def process_message(self, message):
         pass
 
+    def _log_worker_error(self, future):
+        if future.exception():
+            self.log.error('websocket worker error: {}'.format(future.exception()))
+
+    def send(self, message):
+        ''' 线程安全 '''
+        self.main_loop.add_callback(self._send, message)
+
+    def send_output(self, line):
+        ''' 线程安全, 作为exec_rt的out_func '''
+        self.output.append(line)
+
+    def _write(self, message):
+        # 客户端已断开时丢弃
+        if self.ws_connection is not None:
+            return self.write_message(message)
+
+    def _send(self, message):
+        self.output.flush(force=True)
+        self._write(message)
+
+    def close_later(self):
+        self.main_loop.add_callback(self._close)
+
+    def _close(self):
+        self.output.flush(force=True)
+        self.close()
+
     def on_close(self):
         pass
 
+    @coroutine
+    def tail_build(self, job_id, offset=0):
+        ''' 在IOLoop中按IMAGE_BUILD_TAIL_INTERVAL读取构建任务的输出, 构建结束后发送结果并关闭连接, 客户端断开时停止 '''
+        finished = [IMAGE_BUILD_STATUS['success'], IMAGE_BUILD_STATUS['failure']]
+
+        while self.ws_connection is not None:
+            # 先取状态再取输出, 任务结束前的输出都已写入redis
+            job = yield self.image_build_service.select({'id': job_id}, fields='status', ct=False, ut=False, one=True)
+            if not job:
+                self._send('构建任务不存在')
+                self._send(FAILURE)
+                self._close()
+                return
+
+            lines, offset = self.image_build_service.tail(job_id, offset)
+            for line in lines:
+                self.output.append(line)
+
+            if job['status'] in finished:
+                self._send(SUCCESS if job['status'] == IMAGE_BUILD_STATUS['success'] else FAILURE)
+                self._close()
+                return
+
+            yield sleep(IMAGE_BUILD_TAIL_INTERVAL)
+
     def k8s_delete(self, params, out_func=None):
         if params.get('obj_type') and params.get('obj_name'):
             cmd = K8S_DELETE_CMD + ' '.join([params['obj_type'], params['obj_name']])
@@ -357,20 +428,12 @@ class WebSocketBaseHandler(WebSocketHandler, BaseHandler):
         out, err = ssh.exec_rt(cmd, out_func)
         return out, err
 
-    def k8s_apply(self, params, out_func=None):
-        cmd = K8S_APPLY_CMD + params['filename']
+    def k8s_apply(self, params, manifests, out_func=None):
+        ''' 多个对象(deployment/service/ingress等)合成一个yaml, 通过ssh的标准输入交给kubectl apply -f -, 一次执行
+        :param manifests: yaml字符串或其列表
+        '''
+        if isinstance(manifests, str):
+            manifests = [manifests]
         ssh = SSH(hostname=params['public_ip'], port=22, username=params['username'], passwd=params['passwd'])
-        out, err = ssh.exec_rt(cmd, out_func)
+        out, err = ssh.exec_rt(K8S_APPLY_CMD, out_func, stdin=k8s_manifest(manifests))
         return out, err
-
-    def save_yaml(self, app_name, obj_name, obj_type, yaml):
-        full_path = os.path.join('/var/www/Dashboard/static', 'yaml')
-        if not os.path.exists(full_path): os.makedirs(full_path)
-
-        filename = app_name + "." + obj_name + "." + obj_type + ".yaml"
-        fullname = os.path.join(full_path, filename)
-
-        with open(fullname, 'wb') as f:
-            f.write(yaml.encode())
-
-        return filename
@@ -1,3 +1,4 @@
+import json
 
 from tornado.gen import coroutine
 from tornado.ioloop import IOLoop
@@ -130,4 +131,95 @@ class ImageNewHandler(BaseHandler):
 
             self.log.info('Succeeded to create new image, name: %s, version: %s, app_id: %s'
                           % (self.params.get('name'), self.params.get('version'), self.params.get('app_id')))
-            self.success(new_image)
\ No newline at end of file
+            self.success(new_image)
+
+class ImageBuildJobHandler(BaseHandler):
+    @is_login
+    @coroutine
+    def get(self, job_id):
+        """
+        @api {get} /api/image/build/(\d+) 镜像构建任务
+        @apiName ImageBuildJobHandler
+        @apiGroup Image
+
+        @apiUse cidHeader
+
+        @apiParam {Number} [offset] 构建输出从第几行开始返回, 默认0
+
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": {
+                    "id": int,
+                    "kind": str,            //application/project
+                    "params": {},           //构建参数
+                    "status": int,          //0.排队中 1.构建中 2.成功 3.失败
+                    "build_host": str,      //构建主机
+                    "user_id": int,
+                    "start_time": str,
+                    "end_time": str,
+                    "create_time": str,
+                    "log": [str, ...],      //从offset开始的构建输出
+                    "offset": int           //下次读取的offset
+                }
+            }
+        """
+        with catch(self):
+            job = yield self.image_build_service.get_job(job_id, self.get_lord())
+            if not job:
+                self.error('构建任务不存在')
+                return
+
+            job['log'], job['offset'] = self.image_build_service.tail(job_id, int(self.params.get('offset', 0)))
+            self.success(job)
+
+
+class ImageBuildStatsHandler(BaseHandler):
+    @is_login
+    @coroutine
+    def get(self):
+        """
+        @api {get} /api/image/build/stats 镜像构建队列统计
+        @apiName ImageBuildStatsHandler
+        @apiGroup Image
+
+        @apiUse cidHeader
+
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": {
+                    "jobs": {"queued": int, "running": int, "success": int, "failure": int},   //当前用户/公司各状态的任务数
+                    "avg_duration": float,      //当前用户/公司最近一天的平均构建时长(秒)
+                    "max_duration": int,        //当前用户/公司最近一天的最长构建时长(秒)
+                    "queue_depth": int,         //当前进程中排队的任务数
+                    "running": int,             //当前进程中构建中的任务数
+                    "completed": {"success": int, "failure": int}   //当前进程启动后完成的任务数
+                }
+            }
+        """
+        with catch(self):
+            data = yield self.image_build_service.get_stats(self.get_lord())
+            self.success(data)
+
+
+class ImageBuildLogHandler(WebSocketBaseHandler):
+    ''' 按任务ID查看构建输出, 发送{"job_id": int, "offset": int}, 构建结束后发送success/failure并关闭连接 '''
+    @coroutine
+    def on_message(self, message):
+        params = json.loads(message)
+        job_id, offset = int(params['job_id']), int(params.get('offset', 0))
+
+        # 只能查看自己(个人或所在公司)的构建任务
+        job = yield self.image_build_service.get_job(job_id, self.get_lord())
+        if not job:
+            self._send('构建任务不存在')
+            self._send(FAILURE)
+            self._close()
+            return
+
+        yield self.tail_build(job_id, offset)
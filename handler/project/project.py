@@ -4,11 +4,10 @@ import traceback
 import json
 
 from tornado.gen import coroutine
-from tornado.ioloop import IOLoop
 from handler.base import BaseHandler, WebSocketBaseHandler
 from utils.decorator import is_login, require
 from utils.context import catch
-from setting import settings
+from service.imagehub.build import BUILD_HOSTS
 from handler.user import user
 from constant import PROJECT_STATUS, SUCCESS, FAILURE, OPERATION_OBJECT_STYPE, PROJECT_OPERATE_STATUS, OPERATE_STATUS,\
       RIGHT, SERVICE, FORM_COMPANY, FORM_PERSON
@@ -254,7 +253,7 @@ class ProjectUpdateHandler(BaseHandler):
 
 class ProjectDeploymentHandler(WebSocketBaseHandler):
 
-    def on_message(self, message):
+    def process_message(self, message):
         self.params = json.loads(message)
         try:
             args = ['image_name', 'container_name', 'ips', 'project_id']
@@ -266,7 +265,7 @@ class ProjectDeploymentHandler(WebSocketBaseHandler):
                     'object_id': self.params['project_id'],
                     'object_type': OPERATION_OBJECT_STYPE['project'],
             }
-            IOLoop.current().spawn_callback(self.init_operation_log, log_params)
+            self.main_loop.spawn_callback(self.init_operation_log, log_params)
 
             params = {'id': self.params['project_id'], 'status': PROJECT_STATUS['deploying']}
             self.project_service.sync_update_status(params)
@@ -276,7 +275,7 @@ class ProjectDeploymentHandler(WebSocketBaseHandler):
                 login_info = self.project_service.sync_fetch_ssh_login_info(ip)
                 self.params['infos'].append(login_info)
 
-            log = self.project_service.deployment(self.params, self.write_message)
+            log = self.project_service.deployment(self.params, self.send_output)
 
             status, result = PROJECT_STATUS['deploy-success'], SUCCESS
 
@@ -286,14 +285,14 @@ class ProjectDeploymentHandler(WebSocketBaseHandler):
             arg = [json.dumps(self.params['ips']), self.params['container_name'], status, self.params['project_id']]
             self.project_service.set_deploy_ips(arg)
 
-            IOLoop.current().spawn_callback(self.finish_operation_log, log_params)
+            self.main_loop.spawn_callback(self.finish_operation_log, log_params)
 
-            self.write_message('ok')
+            self.send('ok')
         except Exception as e:
             self.log.error(traceback.format_exc())
-            self.write_message(FAILURE)
+            self.send(FAILURE)
         finally:
-            self.close()
+            self.close_later()
 
     @coroutine
     def init_operation_log(self, log_params):
@@ -367,7 +366,7 @@ class ProjectContainersListHanler(BaseHandler):
 
 class ProjectImageCreationHandler(WebSocketBaseHandler):
 
-    def on_message(self, message):
+    def process_message(self, message):
         self.params = json.loads(message)
 
         try:
@@ -380,31 +379,20 @@ class ProjectImageCreationHandler(WebSocketBaseHandler):
                 'object_id': self.params['project_id'],
                 'object_type': OPERATION_OBJECT_STYPE['project'],
             }
-            IOLoop.current().spawn_callback(callback=self.init_operation_log, params=log_params)
+            self.main_loop.spawn_callback(callback=self.init_operation_log, params=log_params)
 
             params = {'status': PROJECT_STATUS['building'], 'name': self.params['prj_name']}
             self.project_service.sync_update_status(params)
 
-            login_info = self.project_service.sync_fetch_ssh_login_info({'public_ip': settings['ip_for_image_creation']})
-            self.params.update(login_info)
-            out, err = self.project_service.create_image(params=self.params, out_func=self.write_message)
-
-            log = {"out": out, "err": err}
-            arg = {'name': self.params['prj_name'], 'version': self.params['version'], 'log': json.dumps(log)}
-            self.project_service.sync_insert_log(arg)
-
-            params['status'], result = PROJECT_STATUS['build-success'], SUCCESS
-            if err:
-                params['status'], result = PROJECT_STATUS['build-failure'], FAILURE
-
-            self.project_service.sync_update_status(params)
-            IOLoop.current().spawn_callback(callback=self.finish_operation_log, params=log_params)
-            self.write_message(result)
+            # 构建结果及项目状态由构建任务更新
+            job_id = self.image_build_service.submit(kind='project', params=self.params,
+                                                     user_id=self.current_user['id'], lord=self.get_lord())
+            self.send('构建任务ID: {}'.format(job_id))
+            self.main_loop.add_callback(self.tail_build, job_id)
         except Exception as e:
             self.log.error(traceback.format_exc())
-            self.write_message(FAILURE)
-        finally:
-            self.close()
+            self.send(FAILURE)
+            self.close_later()
 
     @coroutine
     def init_operation_log(self, log_params):
@@ -416,18 +404,6 @@ class ProjectImageCreationHandler(WebSocketBaseHandler):
             'operation_status': OPERATE_STATUS['fail'],
         })
 
-    @coroutine
-    def finish_operation_log(self, log_params):
-
-        yield self.server_operation_service.update(
-                sets={'operation_status': OPERATE_STATUS['success']},
-                conds={
-                    'user_id': log_params['user_id'],
-                    'object_id': log_params['object_id'],
-                    'object_type': log_params['object_type']
-                }
-        )
-
 class ProjectImageLogHandler(BaseHandler):
     @is_login
     @coroutine
@@ -544,7 +520,9 @@ class ProjectImageFindHandler(BaseHandler):
         """
         with catch(self):
             self.params.update({"prj_name": prj_name})
-            login_info = yield self.server_service.fetch_ssh_login_info({'public_ip': settings['ip_for_image_creation']})
+            if not BUILD_HOSTS:
+                raise ValueError('没有配置构建主机')
+            login_info = yield self.server_service.fetch_ssh_login_info({'public_ip': BUILD_HOSTS[0]})
             self.params.update(login_info)
             data, err = yield self.project_service.find_image(self.params)
             if err:
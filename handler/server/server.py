@@ -10,11 +10,12 @@ from handler.base import BaseHandler, WebSocketBaseHandler
 from constant import DEPLOYING, DEPLOYED, DEPLOYED_FLAG, ERR_TIP
 from utils.general import validate_ip, json_loads
 from utils.security import Aes
-from utils.decorator import is_login, require
+from utils.decorator import is_login, require, check_data_right
 from utils.context import catch
 from utils.faker import is_faker, fake_systemload
 from constant import MONITOR_CMD, OPERATE_STATUS, OPERATION_OBJECT_STYPE, SERVER_OPERATE_STATUS, \
-      CONTAINER_OPERATE_STATUS, RIGHT, SERVICE, FORM_COMPANY, SERVERS_REPORT_INFO, THRESHOLD, FORM_PERSON, RESOURCE_TYPE
+      CONTAINER_OPERATE_STATUS, RIGHT, SERVICE, FORM_COMPANY, SERVERS_REPORT_INFO, THRESHOLD, FORM_PERSON, RESOURCE_TYPE, \
+      CONTAINER_BATCH_CMD, CONTAINER_BATCH_MAX_ITEMS
 
 
 class ServerNewHandler(WebSocketBaseHandler):
@@ -78,7 +79,7 @@ class ServerNewHandler(WebSocketBaseHandler):
         self.period = PeriodicCallback(self.check, 3000)  # 设置定时函数, 3秒
         self.period.start()
 
-        self.params.update({'passwd': passwd, 'cmd': MONITOR_CMD, 'rt': True, 'out_func': self.write_message})
+        self.params.update({'passwd': passwd, 'cmd': MONITOR_CMD, 'rt': True, 'out_func': self.send_output})
         _, err = yield self.server_service.remote_ssh(self.params)
 
         err = [e for e in err if not re.search(r'symlink|resolve host', e)] # 忽略某些错误
@@ -87,12 +88,12 @@ class ServerNewHandler(WebSocketBaseHandler):
         if err:
             if err[0] == 'Authentication failed.':
                 reason = '认证失败'
-                self.write_message(reason)
+                self.send(reason)
                 message['reason'] = reason
                 yield self.message_service.notify_server_add_failed(message)
-            self.write_message('failure')
+            self.send('failure')
             self.period.stop()
-            self.close()
+            self.close_later()
 
             self.redis.hdel(DEPLOYING, self.params['public_ip'])
 
@@ -102,9 +103,9 @@ class ServerNewHandler(WebSocketBaseHandler):
         result = self.redis.hget(DEPLOYED, self.params['public_ip'])
 
         if result:
-            self.write_message('success')
+            self.send('success')
             self.period.stop()
-            self.close()
+            self.close_later()
 
     def on_close(self):
         if hasattr(self, 'period'):
@@ -252,11 +253,36 @@ class ServerDelHandler(BaseHandler):
 
         @apiParam {Number[]} id 主机ID
 
-        @apiUse Success
+        @apiDescription 主机记录立即删除, agent在后台卸载, 立即返回每台主机的operation_id, 通过/api/server/operation/(\d+)查询卸载结果
+
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": {
+                    "operation_ids": {
+                        "1": 10, # 主机id: operation_id
+                        "2": 11
+                    }
+                }
+            }
         """
         with catch(self):
-            yield self.server_service.delete_server(self.params)
-            self.success()
+            infos = yield self.server_service.delete_server(self.params)
+
+            ids = list(infos.keys())
+            logs = yield [self.server_operation_service.add(params={
+                                                            'user_id': self.current_user['id'],
+                                                            'object_id': id,
+                                                            'object_type': OPERATION_OBJECT_STYPE['server'],
+                                                            'operation': SERVER_OPERATE_STATUS['delete'],
+                                                            'operation_status': OPERATE_STATUS['processing'],
+                                                        }) for id in ids]
+            operation_ids = {id: log['id'] for id, log in zip(ids, logs)}
+
+            self.server_service.submit_uninstall(infos, operation_ids)
+            self.success({'operation_ids': operation_ids})
 
 
 class ServerDetailHandler(BaseHandler):
@@ -497,8 +523,17 @@ class ServerStopHandler(BaseHandler):
 
         @apiParam {Number} id 主机id
 
-        @apiUse Success
+        @apiDescription 立即返回operation_id, 操作在后台执行, 通过/api/server/operation/(\d+)查询结果
 
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": {
+                    "operation_id": 1
+                }
+            }
         """
         with catch(self):
             data = yield self.server_operation_service.add(params={
@@ -506,14 +541,10 @@ class ServerStopHandler(BaseHandler):
                                                             'object_id': id,
                                                             'object_type': OPERATION_OBJECT_STYPE['server'],
                                                             'operation': SERVER_OPERATE_STATUS['stop'],
-                                                            'operation_status': OPERATE_STATUS['fail'],
+                                                            'operation_status': OPERATE_STATUS['processing'],
                                                         })
-            yield self.server_service.stop_server(id)
-            yield self.server_operation_service.update(
-                                                        sets={'operation_status': OPERATE_STATUS['success']},
-                                                        conds={'id': data['id']}
-                                                    )
-            self.success()
+            self.server_service.submit_operation(id, 'stop', data['id'])
+            self.success({'operation_id': data['id']})
 
 
 class ServerStartHandler(BaseHandler):
@@ -529,7 +560,17 @@ class ServerStartHandler(BaseHandler):
 
         @apiParam {Number} id 主机id
 
-        @apiUse Success
+        @apiDescription 立即返回operation_id, 操作在后台执行, 通过/api/server/operation/(\d+)查询结果
+
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": {
+                    "operation_id": 1
+                }
+            }
         """
         with catch(self):
             data = yield self.server_operation_service.add(params={
@@ -537,14 +578,10 @@ class ServerStartHandler(BaseHandler):
                                                             'object_id': id,
                                                             'object_type': OPERATION_OBJECT_STYPE['server'],
                                                             'operation': SERVER_OPERATE_STATUS['start'],
-                                                            'operation_status': OPERATE_STATUS['fail'],
+                                                            'operation_status': OPERATE_STATUS['processing'],
                                                         })
-            yield self.server_service.start_server(id)
-            yield self.server_operation_service.update(
-                                                        sets={'operation_status': OPERATE_STATUS['success']},
-                                                        conds={'id': data['id']}
-                                                    )
-            self.success()
+            self.server_service.submit_operation(id, 'start', data['id'])
+            self.success({'operation_id': data['id']})
 
 
 class ServerRebootHandler(BaseHandler):
@@ -560,7 +597,17 @@ class ServerRebootHandler(BaseHandler):
 
         @apiParam {Number} id 主机id
 
-        @apiUse Success
+        @apiDescription 立即返回operation_id, 操作在后台执行, 通过/api/server/operation/(\d+)查询结果
+
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": {
+                    "operation_id": 1
+                }
+            }
         """
         with catch(self):
             data = yield self.server_operation_service.add(params={
@@ -568,14 +615,95 @@ class ServerRebootHandler(BaseHandler):
                                                             'object_id': id,
                                                             'object_type': OPERATION_OBJECT_STYPE['server'],
                                                             'operation': SERVER_OPERATE_STATUS['reboot'],
-                                                            'operation_status': OPERATE_STATUS['fail'],
+                                                            'operation_status': OPERATE_STATUS['processing'],
                                                         })
-            yield self.server_service.reboot_server(id)
-            yield self.server_operation_service.update(
-                                                        sets={'operation_status': OPERATE_STATUS['success']},
-                                                        conds={'id': data['id']}
-                                                    )
-            self.success()
+            self.server_service.submit_operation(id, 'reboot', data['id'])
+            self.success({'operation_id': data['id']})
+
+
+class ServerBatchOperationHandler(BaseHandler):
+    @require(RIGHT['start_stop_server'], service=SERVICE['s'])
+    @coroutine
+    def post(self, cmd):
+        """
+        @api {post} /api/server/batch/(start|stop|reboot) 批量开机/关机/重启主机
+        @apiName ServerBatchOperationHandler
+        @apiGroup Server
+
+        @apiUse cidHeader
+
+        @apiParam {Number[]} id 主机id列表
+
+        @apiDescription 按云和地域分组调用批量接口, 立即返回每台主机的operation_id, 通过/api/server/operation/(\d+)查询结果
+
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": {
+                    "operation_ids": {
+                        "1": 10, # 主机id: operation_id
+                        "2": 11
+                    }
+                }
+            }
+        """
+        with catch(self):
+            ids = list(dict.fromkeys(int(i) for i in self.params['id']))
+
+            logs = yield [self.server_operation_service.add(params={
+                                                                'user_id': self.current_user['id'],
+                                                                'object_id': id,
+                                                                'object_type': OPERATION_OBJECT_STYPE['server'],
+                                                                'operation': SERVER_OPERATE_STATUS[cmd],
+                                                                'operation_status': OPERATE_STATUS['processing'],
+                                                            }) for id in ids]
+            operation_ids = {id: log['id'] for id, log in zip(ids, logs)}
+
+            self.server_service.submit_batch_operation(ids, cmd, operation_ids)
+            self.success({'operation_ids': operation_ids})
+
+
+class ServerOperationStatusHandler(BaseHandler):
+    @is_login
+    @coroutine
+    def get(self, id):
+        """
+        @api {get} /api/server/operation/(\d+) 查询主机开关机/重启操作的状态
+        @apiName ServerOperationStatusHandler
+        @apiGroup Server
+
+        @apiUse cidHeader
+
+        @apiParam {Number} id 开关机/重启接口返回的operation_id
+
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": {
+                    "id": 1,
+                    "object_id": "2", # 主机id
+                    "object_type": 0,
+                    "operation": 0, # 0 开机, 1 关机, 2 重启
+                    "operation_status": 2, # 0 成功, 1 失败, 2 进行中
+                    "created_time": "2018-10-19 10:00:00",
+                    "update_time": "2018-10-19 10:00:05"
+                }
+            }
+        """
+        with catch(self):
+            data = yield self.server_operation_service.get_operation(int(id))
+
+            # url参数是operation_id而不是主机id, 非本人发起的操作需要对该主机有数据权限
+            if data.pop('user_id') != self.current_user['id']:
+                if data['object_type'] != OPERATION_OBJECT_STYPE['server']:
+                    raise ValueError('操作不存在')
+                yield check_data_right(self, SERVICE['s'], [int(data['object_id'])])
+
+            self.success(data)
 
 
 class ServerStatusHandler(BaseHandler):
@@ -683,6 +811,41 @@ class ServerContainersHandler(BaseHandler):
             self.success()
 
 
+class ServerContainerNamesHandler(BaseHandler):
+    @require(service=SERVICE['s'])
+    @coroutine
+    def get(self, id):
+        """
+        @api {get} /api/server/containers/(\d+)/names 获取主机上报过的容器名列表
+        @apiName ServerContainerNamesHandler
+        @apiGroup Server
+
+        @apiParam {Number} id 主机id
+        @apiParam {Number} [start_time] 起始时间, 只返回此后上报过的容器
+        @apiParam {Number} [end_time] 终止时间, 只返回此前开始上报的容器
+
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": [
+                    {
+                        "container_name": "harbor-jobservice",
+                        "first_time": 1508923260, # 首次上报时间
+                        "last_time": 1509009660 # 最近上报时间
+                    },
+                    ...
+                ]
+            }
+        """
+        with catch(self):
+            self.params.update({'id': int(id)})
+            data = yield self.server_service.get_container_names(self.params)
+
+            self.success(data)
+
+
 class ServerContainersInfoHandler(BaseHandler):
     @require(service=SERVICE['s'])
     @coroutine
@@ -819,6 +982,73 @@ class ServerContainerDelHandler(BaseHandler):
             self.success()
 
 
+class ServerContainerBatchHandler(BaseHandler):
+    @require(service=SERVICE['s'])
+    @coroutine
+    def post(self):
+        """
+        @api {post} /api/server/container/batch 批量启动/停止/重启/删除容器
+        @apiName ServerContainerBatchHandler
+        @apiGroup Server
+
+        @apiUse cidHeader
+
+        @apiParam {Object[]} items 操作列表, 每项为[主机id, 容器id, 操作]或{"server_id", "container_id", "action"}
+        @apiParam {String} items.action start/stop/reboot/delete
+
+        @apiDescription 同一主机的操作在一个ssh会话中顺序执行, 各主机并发执行, 返回每项的结果, 顺序与items一致
+
+        @apiSuccessExample {json} Success-Response:
+            HTTP/1.1 200 OK
+            {
+                "status": 0,
+                "msg": "success",
+                "data": [
+                    {
+                        "server_id": 1,
+                        "container_id": "c1e3",
+                        "action": "stop",
+                        "success": true,
+                        "output": ["c1e3"]
+                    },
+                    ...
+                ]
+            }
+        """
+        with catch(self):
+            items = []
+            for item in self.params['items']:
+                if isinstance(item, dict):
+                    item = [item['server_id'], item['container_id'], item['action']]
+                server_id, container_id, action = item
+                if action not in CONTAINER_BATCH_CMD:
+                    raise ValueError('不支持的操作: {}'.format(action))
+                items.append({'server_id': int(server_id), 'container_id': str(container_id), 'action': action})
+
+            if not items or len(items) > CONTAINER_BATCH_MAX_ITEMS:
+                raise ValueError('每次操作1到{}个容器'.format(CONTAINER_BATCH_MAX_ITEMS))
+
+            # 主机id在items中, require取不到, 在此检查数据权限, 任一主机不合法则整批拒绝
+            yield check_data_right(self, SERVICE['s'], sorted({i['server_id'] for i in items}))
+
+            logs = yield [self.server_operation_service.add(params={
+                                                                'user_id': self.current_user['id'],
+                                                                'object_id': item['container_id'],
+                                                                'object_type': OPERATION_OBJECT_STYPE['container'],
+                                                                'operation': CONTAINER_OPERATE_STATUS[item['action']],
+                                                                'operation_status': OPERATE_STATUS['processing'],
+                                                            }) for item in items]
+
+            results = yield self.server_service.operate_containers(items)
+
+            for status, success in [(OPERATE_STATUS['success'], True), (OPERATE_STATUS['fail'], False)]:
+                ids = [log['id'] for log, r in zip(logs, results) if r['success'] == success]
+                if ids:
+                    yield self.server_operation_service.update(sets={'operation_status': status}, conds={'id': ids})
+
+            self.success(results)
+
+
 class OperationLogHandler(BaseHandler):
     @is_login
     @coroutine
@@ -13,7 +13,8 @@ from handler.permission.permission import PermissionTemplateListHandler, Permiss
 from handler.application.application import ApplicationNewHandler, ApplicationDeleteHandler, ApplicationBriefHandler, \
                                             ApplicationSummaryHandler, ApplicationUpdateHandler, ImageCreationHandler, \
                                             SubApplicationBriefHandler
-from handler.imagehub.image import ImageDetailHandler, ImageNewHandler
+from handler.imagehub.image import ImageDetailHandler, ImageNewHandler, ImageBuildJobHandler, ImageBuildStatsHandler, \
+                                   ImageBuildLogHandler
 from handler.application.deployment import K8sDeploymentHandler, K8sDeploymentNameCheckHandler, DeploymentBriefHandler, \
                                            K8sDeploymentYamlGenerateHandler, DeploymentReplicasSetSourceHandler, \
                                            DeploymentPodSourceHandler, DeploymentLastestHandler, \
@@ -32,9 +33,10 @@ from handler.repository.repository import RepositoryHandler, RepositoryBranchHan
 from handler.server.server import ServerNewHandler, ServerReport, ServerDelHandler, \
     ServerDetailHandler, ServerPerformanceHandler, ServerUpdateHandler, \
     ServerStopHandler, ServerStartHandler, ServerRebootHandler, \
-    ServerStatusHandler, ServerContainerPerformanceHandler, ServerContainersHandler, \
+    ServerStatusHandler, ServerContainerPerformanceHandler, ServerContainersHandler, ServerContainerNamesHandler, \
     ServerContainersInfoHandler, ServerContainerStartHandler, ServerContainerStopHandler, \
-    ServerContainerDelHandler, OperationLogHandler, SystemLoadHandler, ServerThresholdHandler,ServerMontiorHandler
+    ServerContainerDelHandler, OperationLogHandler, SystemLoadHandler, ServerThresholdHandler,ServerMontiorHandler, \
+    ServerOperationStatusHandler, ServerBatchOperationHandler, ServerContainerBatchHandler
 from handler.cloud.cloud import CloudsHandler, CloudCredentialHandler
 from handler.user.user import UserLoginHandler, UserLogoutHandler, UserSMSHandler, UserDetailHandler, \
                               UserUpdateHandler, UserUploadToken, GetCaptchaHandler, \
@@ -80,14 +82,18 @@ routes = [
     (r'/api/server/stop/(\d+)', ServerStopHandler),
     (r'/api/server/start/(\d+)', ServerStartHandler),
     (r'/api/server/reboot/(\d+)', ServerRebootHandler),
+    (r'/api/server/operation/(\d+)', ServerOperationStatusHandler),
+    (r'/api/server/batch/(start|stop|reboot)', ServerBatchOperationHandler),
     (r'/api/server/([\w\W]+)/status', ServerStatusHandler),
 
 
     (r'/api/server/containers/(\d+)', ServerContainersHandler),
+    (r'/api/server/containers/(\d+)/names', ServerContainerNamesHandler),
     (r'/api/server/container/performance', ServerContainerPerformanceHandler),
     (r'/api/server/container/start', ServerContainerStartHandler),
     (r'/api/server/container/stop', ServerContainerStopHandler),
     (r'/api/server/container/del', ServerContainerDelHandler),
+    (r'/api/server/container/batch', ServerContainerBatchHandler),
     (r'/api/server/([\w\W]+)/container/([\w\W]+)', ServerContainersInfoHandler),
 
     (r'/api/log/operation', OperationLogHandler),
@@ -142,6 +148,9 @@ routes = [
     # 镜像相关
     (r'/api/image', ImageDetailHandler),
     (r'/api/image/new', ImageNewHandler),
+    (r'/api/image/build/stats', ImageBuildStatsHandler),
+    (r'/api/image/build/log', ImageBuildLogHandler),
+    (r'/api/image/build/(\d+)', ImageBuildJobHandler),
 
     # 应用相关
     (r'/api/application/new', ApplicationNewHandler),
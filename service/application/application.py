@@ -64,9 +64,9 @@ class ApplicationService(BaseService):
                params['form'], params['lord'], params['log'], params['dockerfile']]
         self.sync_db_execute(sql, arg)
 
-    def create_image(self, params, out_func=None):
+    def create_image(self, params, out_func=None, timeout=None):
         cmd = CREATE_IMAGE_CMD + ' '.join([params['app_name'], params['image_name'], params['repos_https_url'],
                                            params['branch_name'], params['version']])
         ssh = SSH(hostname=params['public_ip'], port=22, username=params['username'], passwd=params['passwd'])
-        out, err = ssh.exec_rt(cmd, out_func)
+        out, err = ssh.exec_rt(cmd, out_func, timeout)
         return out, err
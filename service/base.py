@@ -22,6 +22,7 @@ from urllib.parse import urlencode
 from utils.db import DB, REDIS, SYNC_DB
 from utils.log import LOG
 from utils.ssh import SSH
+from utils.ssh_executor import SSH_EXECUTOR
 from utils.general import get_formats, get_in_formats, get_not_in_formats, choose_user_agent
 from constant import FULL_DATE_FORMAT, FULL_DATE_FORMAT_ESCAPE, POOL_COUNT, HTTP_TIMEOUT, ALIYUN_DOMAIN, NEG, \
                      DEFAULT_PAGE_NUM, MAX_PAGE_NUMBER
@@ -32,10 +33,14 @@ class BaseService():
 
     def __init__(self):
         self.db = DB
-        self.sync_db = SYNC_DB
         self.redis = REDIS
         self.log = LOG
 
+    @property
+    def sync_db(self):
+        ''' 当前线程的同步连接 '''
+        return SYNC_DB.connection()
+
     ############################################################################################
     # DB SELECT
     ############################################################################################
@@ -266,18 +271,21 @@ class BaseService():
     ############################################################################################
     # SSH
     ############################################################################################
-    @run_on_executor
     def remote_ssh(self, params):
-        """ 远程控制主机
-        :param params: dict, 必须{'public_ip', 'username', 'passwd', 'cmd'}, 可选{'rt'(实时输出), 'out_func'}
+        """ 远程控制主机, 在SSH_EXECUTOR中执行, 不占用BaseService.executor
+        :param params: dict, 必须{'public_ip', 'username', 'passwd', 'cmd'}, 可选{'rt'(实时输出), 'out_func', 'timeout', 'stdin'}
         """
+        return SSH_EXECUTOR.submit(params['public_ip'], self._remote_ssh, params)
+
+    def _remote_ssh(self, params):
+        timeout = params.get('timeout')
         try:
             ssh = SSH(hostname=params['public_ip'], username=params['username'], passwd=params['passwd'])
 
             if params.get('rt'):
-                out, err = ssh.exec_rt(params['cmd'], params.get('out_func'))
+                out, err = ssh.exec_rt(params['cmd'], params.get('out_func'), timeout=timeout, stdin=params.get('stdin'))
             else:
-                out, err = ssh.exec(params['cmd'])
+                out, err = ssh.exec(params['cmd'], timeout=timeout, stdin=params.get('stdin'))
             ssh.close()
 
             return out, err
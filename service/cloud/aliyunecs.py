@@ -6,9 +6,9 @@ import hashlib
 import hmac
 import urllib.request, urllib.parse
 import base64
-import requests
 import json
-from constant import ALIYUN_DOMAIN, ALIYUN_REGION_LIST, ALIYUN_DISK_TYPE
+from constant import ALIYUN_DOMAIN, ALIYUN_REGION_LIST, ALIYUN_DISK_TYPE, CLOUD_API_PAGE_SIZE
+from utils.http_session import get_json
 
 from setting import settings
 
@@ -67,23 +67,37 @@ class AliyunBase:
 
         return url
 
+    def describe_all(self, cmd, outer, inner):
+        ''' 按PageNumber翻页获取全部结果, 结果在info[outer][inner]中, 出错时(如密钥无效)返回已获取的部分
+        '''
+        resp, page = list(), 1
+        while True:
+            info = get_json(self.make_url(dict(cmd, PageSize=str(CLOUD_API_PAGE_SIZE), PageNumber=str(page))))
+            items = info.get(outer, {}).get(inner) or []
+            resp.extend(items)
+
+            if len(items) < CLOUD_API_PAGE_SIZE or len(resp) >= info.get('TotalCount', 0):
+                return resp
+            page += 1
+
 
 class AliyunECSBase(AliyunBase):
     def __init__(self, access_key_id, access_key_secret, ecs_domain):
         super().__init__(access_key_id, access_key_secret)
         self.aliyun_domain = ecs_domain
 
+    def get_region_instance(self, region):
+        instances = list()
+        cmd = {'Action': 'DescribeInstances', 'RegionId': region}
+        for j in self.describe_all(cmd, 'Instances', 'Instance'):
+            j.update({'region_id': j['RegionId']})
+            instances.append(j)
+        return instances
+
     def get_all_region_instance(self):
         all_region_instances = list()
         for r in ALIYUN_REGION_LIST:
-            cmd = {'Action': 'DescribeInstances', 'RegionId': r}
-            url = self.make_url(cmd)
-            r = requests.get(url).json()
-            if not r.get('Instances', {}).get('Instance', ''):
-                continue
-            for j in r['Instances']['Instance']:
-                j.update({'region_id': j['RegionId']})
-                all_region_instances.append(j)
+            all_region_instances.extend(self.get_region_instance(r))
         return all_region_instances
 
 
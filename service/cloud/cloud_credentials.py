@@ -1,18 +1,60 @@
 
+import hashlib
 from tornado.gen import coroutine
+from tornado.concurrent import run_on_executor
+from concurrent.futures import ThreadPoolExecutor
 
 from service.base import BaseService
-from constant import TENCLOUD_PROVIDER_LIST, ERR_TIP, ALIYUN_DOMAIN, QCLOUD_DOMAIN
+from constant import TENCLOUD_PROVIDER_LIST, ERR_TIP, ALIYUN_DOMAIN, QCLOUD_DOMAIN, ALIYUN_REGION_LIST, \
+                     QCLOUD_REGION_LIST, ZCLOUD_REGION_LIST, CLOUD_SCAN_POOL_COUNT, CLOUD_CREDENTIAL_SCAN_TTL
 from utils.error import AppError
+from utils.cache import TTLCache, MISSING
+from utils.general import get_in_formats
 from service.cloud.aliyunecs import AliyunECSBase
 from service.cloud.qcloudcvm import QcloudCVMBase
 from service.cloud.zcloudec2 import ZcloudEC2
 
 
+def _format_aliyun(i):
+    return {
+        'instance_id': i['InstanceId'],
+        'public_ip': ','.join(i['PublicIpAddress']['IpAddress']) if len(i['PublicIpAddress']['IpAddress']) else '',
+        'inner_ip': ','.join(i['InnerIpAddress']['IpAddress']) if len(i['InnerIpAddress']['IpAddress']) else '',
+        'net_type': i.get('InstanceNetworkType', ''),
+        'region_id': i.get('RegionId')
+    }
+
+
+def _format_qcloud(i):
+    return {
+        'instance_id': i['InstanceId'],
+        'public_ip': ','.join(i.get('PublicIpAddresses')) if len(i.get('PublicIpAddresses')) else '',
+        'inner_ip': ','.join(i.get('PrivateIpAddresses')) if len(i.get('PrivateIpAddresses')) else '',
+        'net_type': 'vpc',
+        'region_id': i.get('region_id')
+    }
+
+
+def _format_zcloud(i):
+    return {
+        'instance_id': i['InstanceId'],
+        'public_ip': i.get('PublicIpAddress', ''),
+        'inner_ip': i.get('PrivateIpAddress', ''),
+        'net_type': 'vpc',
+        'region_id': i.get('region_id')
+    }
+
+
 class CloudCredentialsService(BaseService):
     table = 'cloud_credentials'
     fields = 'id', 'content', 'cloud_type', 'lord', 'form'
 
+    # 各地域的查询都是阻塞的HTTP/boto3调用, 用独立的线程池并发执行, 不占用BaseService的线程池
+    executor = ThreadPoolExecutor(max_workers=CLOUD_SCAN_POOL_COUNT)
+
+    # 同一账号短时间内重复查询时直接使用缓存, key为(cloud_type, access_key, access_secret的sha1)
+    scan_cache = TTLCache(CLOUD_CREDENTIAL_SCAN_TTL)
+
     @coroutine
     def check_instance(self, instance_id):
         sql = """
@@ -23,6 +65,47 @@ class CloudCredentialsService(BaseService):
             return True
         return False
 
+    @coroutine
+    def check_instances(self, instance_ids):
+        ''' 一次查询返回已添加的实例id集合 '''
+        if not instance_ids:
+            return set()
+
+        sql = "SELECT instance_id FROM instance WHERE {ids}".format(ids=get_in_formats('instance_id', instance_ids))
+        cur = yield self.db.execute(sql, instance_ids)
+        return {i['instance_id'] for i in cur.fetchall()}
+
+    @run_on_executor
+    def scan_region(self, client, region, format_func):
+        return [format_func(i) for i in client.get_region_instance(region)]
+
+    @coroutine
+    def scan_instances(self, cloud_type, access_key, access_secret):
+        '''
+        并发查询账号下所有地域的实例, 结果按账号缓存CLOUD_CREDENTIAL_SCAN_TTL秒
+        :return: [{'instance_id', 'public_ip', 'inner_ip', 'net_type', 'region_id'}, ...]
+        '''
+        key = (cloud_type, access_key, hashlib.sha1(access_secret.encode()).hexdigest())
+        instances = self.scan_cache.get(key, MISSING)
+        if instances is not MISSING:
+            return instances
+
+        if cloud_type == TENCLOUD_PROVIDER_LIST['阿里云']:
+            client = AliyunECSBase(access_key_id=access_key, access_key_secret=access_secret, ecs_domain=ALIYUN_DOMAIN)
+            regions, format_func = ALIYUN_REGION_LIST, _format_aliyun
+        elif cloud_type == TENCLOUD_PROVIDER_LIST['腾讯云']:
+            client = QcloudCVMBase(access_key_id=access_key, access_key_secret=access_secret, cvm_domain=QCLOUD_DOMAIN)
+            regions, format_func = QCLOUD_REGION_LIST, _format_qcloud
+        else:
+            client = ZcloudEC2(access_key_id=access_key, access_key_secret=access_secret)
+            regions, format_func = ZCLOUD_REGION_LIST, _format_zcloud
+
+        results = yield [self.scan_region(client, r, format_func) for r in regions]
+
+        instances = [i for region_instances in results for i in region_instances]
+        self.scan_cache.set(key, instances)
+        return instances
+
     @coroutine
     def get_server_info(self, params):
         """
@@ -38,46 +121,13 @@ class CloudCredentialsService(BaseService):
         if cloud_type not in TENCLOUD_PROVIDER_LIST.values():
             raise AppError(ERR_TIP['cloud_unsupported']['msg'], ERR_TIP['cloud_unsupported']['sts'])
 
+        instances = yield self.scan_instances(cloud_type, credentials['access_key'], credentials['access_secret'])
+
+        # is_add随添加服务器变化, 不缓存, 每次一次查询得出
+        added = yield self.check_instances([i['instance_id'] for i in instances])
+
         resp = []
-        access_key = credentials['access_key']
-        access_secret = credentials['access_secret']
-        if cloud_type == TENCLOUD_PROVIDER_LIST['阿里云']:
-            ecs = AliyunECSBase(access_key_id=access_key, access_key_secret=access_secret, ecs_domain=ALIYUN_DOMAIN)
-            for i in ecs.get_all_region_instance():
-                is_add = yield self.check_instance(i['InstanceId'])
-                ret = {
-                    'is_add': is_add,
-                    'instance_id': i['InstanceId'],
-                    'public_ip': ','.join(i['PublicIpAddress']['IpAddress']) if len(i['PublicIpAddress']['IpAddress']) else '',
-                    'inner_ip': ','.join(i['InnerIpAddress']['IpAddress']) if len(i['InnerIpAddress']['IpAddress']) else '',
-                    'net_type': i.get('InstanceNetworkType', ''),
-                    'region_id': i.get('RegionId')
-                }
-                resp.append(ret)
-        elif cloud_type == TENCLOUD_PROVIDER_LIST['腾讯云']:
-            cvm = QcloudCVMBase(access_key_id=access_key, access_key_secret=access_secret, cvm_domain=QCLOUD_DOMAIN)
-            for i in cvm.get_all_region_instance():
-                is_add = yield self.check_instance(i['InstanceId'])
-                ret = {
-                    'is_add': is_add,
-                    'instance_id': i['InstanceId'],
-                    'public_ip': ','.join(i.get('PublicIpAddresses')) if len(i.get('PublicIpAddresses')) else '',
-                    'inner_ip': ','.join(i.get('PrivateIpAddresses')) if len(i.get('PrivateIpAddresses')) else '',
-                    'net_type': 'vpc',
-                    'region_id': i.get('region_id')
-                }
-                resp.append(ret)
-        elif cloud_type == TENCLOUD_PROVIDER_LIST['亚马逊云']:
-            ec2 = ZcloudEC2(access_key_id=access_key, access_key_secret=access_secret)
-            for i in ec2.get_all_region_instance():
-                is_add = yield self.check_instance(i['InstanceId'])
-                ret = {
-                    'is_add': is_add,
-                    'instance_id': i['InstanceId'],
-                    'public_ip': i.get('PublicIpAddress', ''),
-                    'inner_ip': i.get('PrivateIpAddress', ''),
-                    'net_type': 'vpc',
-                    'region_id': i.get('region_id')
-                }
-                resp.append(ret)
-        return resp
\ No newline at end of file
+        for i in instances:
+            ret = dict(i, is_add=i['instance_id'] in added)
+            resp.append(ret)
+        return resp
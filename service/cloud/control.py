@@ -0,0 +1,85 @@
+__author__ = 'Jon'
+
+'''
+云主机的控制接口: 开机/关机/重启/查询公网ip
+
+说明
+---------------
+* 阿里云/腾讯云为签名后的HTTP请求, 亚马逊云为boto3, 都是阻塞调用, 统一在线程池中执行, 不阻塞IOLoop
+* 等待公网ip变化时按指数退避轮询, 超过CLOUD_IP_WAIT_TIMEOUT则抛出异常
+
+Usage::
+    >>> from service.cloud.control import CLOUD_CONTROL
+    >>> yield CLOUD_CONTROL.operate(info, 'stop')
+    >>> yield CLOUD_CONTROL.operate_batch(ALIYUN_NAME, 'cn-hangzhou', ['i-1', 'i-2'], 'stop')
+    >>> new_ip = yield CLOUD_CONTROL.wait_ip_change(info)
+'''
+import time
+from tornado.gen import coroutine, sleep
+from tornado.concurrent import run_on_executor
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.aliyun import Aliyun
+from utils.qcloud import Qcloud
+from utils.zcloud import Zcloud
+from constant import ALIYUN_NAME, QCLOUD_NAME, ZCLOUD_NAME, POOL_COUNT, CLOUD_IP_POLL_INTERVAL, \
+                     CLOUD_IP_POLL_MAX_INTERVAL, CLOUD_IP_WAIT_TIMEOUT, CLOUD_BATCH_SIZE
+
+
+class CloudControl:
+    executor = ThreadPoolExecutor(max_workers=POOL_COUNT)
+
+    clouds = {
+        ALIYUN_NAME: Aliyun,
+        QCLOUD_NAME: Qcloud,
+        ZCLOUD_NAME: Zcloud
+    }
+
+    @run_on_executor
+    def operate(self, info, cmd):
+        '''
+        :param info: instance表的一行, 需要provider/region_id/instance_id
+        :param cmd:  start/stop/reboot
+        '''
+        cloud = self.clouds[info['provider']]
+
+        if info['provider'] == ZCLOUD_NAME:
+            return getattr(cloud, cmd)(info)
+
+        return cloud.request(getattr(cloud, cmd)(info))
+
+    @run_on_executor
+    def operate_batch(self, provider, region_id, instance_ids, cmd):
+        ''' 同一云同一地域的多个实例, 使用各云的批量接口, 每次最多CLOUD_BATCH_SIZE个 '''
+        cloud = self.clouds[provider]
+
+        for n in range(0, len(instance_ids), CLOUD_BATCH_SIZE):
+            chunk = instance_ids[n:n+CLOUD_BATCH_SIZE]
+            if provider == ZCLOUD_NAME:
+                cloud.batch(cmd, region_id, chunk)
+            else:
+                cloud.request(cloud.batch(cmd, region_id, chunk))
+
+    @run_on_executor
+    def get_public_ip(self, info):
+        return self.clouds[info['provider']].get_public_ip(info)
+
+    @coroutine
+    def wait_ip_change(self, info, timeout=CLOUD_IP_WAIT_TIMEOUT):
+        ''' 等待实例的公网ip与info['public_ip']不同, 返回新的ip '''
+        deadline = time.time() + timeout
+        delay = CLOUD_IP_POLL_INTERVAL
+
+        while True:
+            new_ip = yield self.get_public_ip(info)
+            if new_ip and new_ip != info['public_ip']:
+                return new_ip
+
+            if time.time() + delay > deadline:
+                raise ValueError('等待{}的公网ip变化超时'.format(info['instance_id']))
+
+            yield sleep(delay)
+            delay = min(delay * 2, CLOUD_IP_POLL_MAX_INTERVAL)
+
+
+CLOUD_CONTROL = CloudControl()
@@ -7,8 +7,8 @@ import hashlib
 import hmac
 import urllib.parse
 import binascii
-import requests
-from constant import QCLOUD_DOMAIN, QCLOUD_REGION_LIST, QCLOUD_IMAGE_DOMAIN
+from constant import QCLOUD_DOMAIN, QCLOUD_REGION_LIST, QCLOUD_IMAGE_DOMAIN, CLOUD_API_PAGE_SIZE
+from utils.http_session import get_json
 
 class QcloudBase:
 
@@ -59,22 +59,36 @@ class QcloudBase:
         url = qcloud_domain + urllib.parse.urlencode(payload)
         return url
 
+    def describe_all(self, cmd, field, qcloud_domain=None):
+        ''' 按Offset/Limit翻页获取全部结果, 结果在Response[field]中, 出错时(如密钥无效)返回已获取的部分
+        '''
+        resp = list()
+        while True:
+            info = get_json(self.make_url(dict(cmd, Offset=len(resp), Limit=CLOUD_API_PAGE_SIZE), qcloud_domain))
+            info = info.get('Response', {})
+            items = info.get(field) or []
+            resp.extend(items)
+
+            if len(items) < CLOUD_API_PAGE_SIZE or len(resp) >= info.get('TotalCount', 0):
+                return resp
+
 class QcloudCVMBase(QcloudBase):
     def __init__(self, access_key_id, access_key_secret, cvm_domain):
         super().__init__(access_key_id, access_key_secret)
         self.qcloud_domain = cvm_domain
 
+    def get_region_instance(self, region):
+        instances = list()
+        cmd = {'Action': 'DescribeInstances', 'Region': region, 'Version': '2017-03-12'}
+        for one in self.describe_all(cmd, 'InstanceSet'):
+            one.update({'region_id': region})
+            instances.append(one)
+        return instances
+
     def get_all_region_instance(self):
         all_region_instances = list()
         for r in QCLOUD_REGION_LIST:
-            cmd = {'Action': 'DescribeInstances', 'Limit': 100, 'Region': r, 'Version': '2017-03-12'}
-            url = self.make_url(cmd)
-            result = requests.get(url).json()
-            if not result['Response'].get('InstanceSet', ''):
-                continue
-            for one in result['Response']['InstanceSet']:
-                one.update({'region_id': r})
-                all_region_instances.append(one)
+            all_region_instances.extend(self.get_region_instance(r))
         return all_region_instances
 
 
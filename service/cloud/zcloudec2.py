@@ -22,14 +22,19 @@ class ZcloudEC2:
         )
         return client
 
+    def get_region_instance(self, region):
+        instances = list()
+        client = self._get_client(region)
+        for page in client.get_paginator('describe_instances').paginate():
+            for reservation in page.get('Reservations', []):
+                for one in reservation['Instances']:
+                    one.update({'region_id': region})
+                    instances.append(one)
+        return instances
+
     def get_all_region_instance(self):
         all_region_instances = list()
         for region in ZCLOUD_REGION_LIST:
-            client = self._get_client(region)
-            r = client.describe_instances()
-            if r.get('Reservations'):
-                for one in r['Reservations'][0]['Instances']:
-                    one.update({'region_id': region})
-                    all_region_instances.append(one)
+            all_region_instances.extend(self.get_region_instance(region))
         return all_region_instances
 
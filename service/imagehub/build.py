@@ -0,0 +1,302 @@
+__author__ = 'Jon'
+
+'''
+镜像构建任务
+
+说明
+---------------
+* 构建请求写入image_build_job表, 由后台线程池执行, 与提交的websocket连接无关, 连接断开后构建照常进行
+* 构建主机为settings['ip_for_image_creation'], 多台时用逗号分隔, 每台同时构建IMAGE_BUILD_PER_HOST个, 其余在线程池中排队
+* 构建输出逐行写入redis(IMAGE_BUILD_LOG), 任意连接可按任务ID及偏移量读取
+* 进程重启时排队中的任务重新提交, 构建中的任务已中断, 标记为失败
+* 构建完成后的镜像数据/应用状态/项目状态/操作记录由任务负责更新, 不再依赖提交的连接
+
+Usage::
+    >>> job_id = image_build_service.submit(kind='application', params=params, user_id=1, lord=lord)
+    >>> lines, offset = image_build_service.tail(job_id, offset=0)
+    >>> image_build_service.recover()  # 启动时
+'''
+import json
+import time
+import threading
+import traceback
+from tornado.gen import coroutine
+from concurrent.futures import ThreadPoolExecutor
+
+from service.base import BaseService
+from utils.general import get_in_formats
+from service.application.application import ApplicationService
+from service.imagehub.image import ImageService
+from service.project.project import ProjectService
+from setting import settings
+from constant import IMAGE_BUILD_STATUS, IMAGE_BUILD_PER_HOST, IMAGE_BUILD_TIMEOUT, IMAGE_BUILD_LOG, \
+                     IMAGE_BUILD_LOG_MAX_LINES, IMAGE_BUILD_LOG_TTL, IMAGE_BUILD_LOG_FLUSH_INTERVAL, REPOS_DOMAIN, \
+                     APPLICATION_STATE, IMAGE_STATUS, PROJECT_STATUS, OPERATE_STATUS, OPERATION_OBJECT_STYPE, \
+                     FULL_DATE_FORMAT
+
+
+BUILD_HOSTS = [h.strip() for h in settings['ip_for_image_creation'].split(',') if h.strip()]
+
+# 各类构建任务需要保存的参数, 其他参数(如Authorization)不写入数据库
+BUILD_PARAMS = {
+    'application': ['image_name', 'version', 'repos_https_url', 'branch_name', 'app_id', 'app_name', 'dockerfile'],
+    'project': ['prj_name', 'repos_url', 'branch_name', 'version', 'image_name', 'project_id'],
+}
+
+
+class _JobLog:
+    ''' 构建输出, 按IMAGE_BUILD_LOG_FLUSH_INTERVAL批量写入redis, 超过IMAGE_BUILD_LOG_MAX_LINES的不再保存 '''
+    def __init__(self, redis, job_id):
+        self.redis = redis
+        self.key = IMAGE_BUILD_LOG.format(job_id)
+        self.lines = []
+        self.count = 0
+        self.flushed_at = time.time()
+
+    def append(self, line):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+
+        if self.count < IMAGE_BUILD_LOG_MAX_LINES:
+            self.lines.append(line)
+        elif self.count == IMAGE_BUILD_LOG_MAX_LINES:
+            self.lines.append('...(输出超过{}行, 不再保存)'.format(IMAGE_BUILD_LOG_MAX_LINES))
+        self.count += 1
+
+        if time.time() - self.flushed_at >= IMAGE_BUILD_LOG_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.flushed_at = time.time()
+        if not self.lines:
+            return
+
+        pipe = self.redis.pipeline()
+        pipe.rpush(self.key, *self.lines)
+        pipe.expire(self.key, IMAGE_BUILD_LOG_TTL)
+        pipe.execute()
+        self.lines = []
+
+
+class ImageBuildService(BaseService):
+    table = 'image_build_job'
+    fields = 'id, kind, params, status, build_host, user_id, lord, form, start_time, end_time'
+
+    # 构建耗时较长, 独立的线程池, 大小为构建主机数 * IMAGE_BUILD_PER_HOST, 超过的任务在线程池中排队
+    workers = ThreadPoolExecutor(max_workers=max(len(BUILD_HOSTS), 1) * IMAGE_BUILD_PER_HOST)
+
+    _lock = threading.Lock()
+    _host_load = {h: 0 for h in BUILD_HOSTS}
+    _stats = {'queued': 0, 'running': 0, 'success': 0, 'failure': 0}
+
+    def __init__(self):
+        super().__init__()
+        self.application_service = ApplicationService()
+        self.image_service = ImageService()
+        self.project_service = ProjectService()
+
+    def submit(self, kind, params, user_id, lord):
+        '''
+        :param kind:   'application'/'project'
+        :param params: 构建参数, 只保存BUILD_PARAMS[kind]中的
+        :param lord:   {'lord', 'form'}
+        :return: 任务ID
+        '''
+        params = {k: params[k] for k in BUILD_PARAMS[kind] if k in params}
+        sql = """
+                INSERT INTO {table} (kind, params, status, user_id, lord, form) VALUES (%s, %s, %s, %s, %s, %s)
+              """.format(table=self.table)
+        job_id = self.sync_db_execute(sql, [kind, json.dumps(params), IMAGE_BUILD_STATUS['queued'], user_id,
+                                            lord['lord'], lord['form']])
+        self._enqueue(job_id)
+        return job_id
+
+    def _enqueue(self, job_id):
+        with self._lock:
+            self._stats['queued'] += 1
+        future = self.workers.submit(self._run, job_id)
+        future.add_done_callback(self._log_error)
+
+    def _log_error(self, future):
+        if future.exception():
+            self.log.error('image build worker error: {}'.format(future.exception()))
+
+    def _acquire_host(self):
+        with self._lock:
+            self._stats['queued'] -= 1
+            self._stats['running'] += 1
+            if not self._host_load:
+                return None
+            host = min(self._host_load, key=self._host_load.get)
+            self._host_load[host] += 1
+            return host
+
+    def _release_host(self, host, status=None):
+        with self._lock:
+            self._stats['running'] -= 1
+            if status is not None:
+                self._stats['success' if status == IMAGE_BUILD_STATUS['success'] else 'failure'] += 1
+            if host is not None:
+                self._host_load[host] -= 1
+
+    def _claim(self, job_id, host):
+        ''' 只有排队中的任务才执行, 防止recover等重复提交时构建两次 '''
+        cur = self.sync_db.cursor()
+        cur.execute("UPDATE {table} SET status=%s, build_host=%s, start_time=NOW() WHERE id=%s AND status=%s"
+                    .format(table=self.table),
+                    [IMAGE_BUILD_STATUS['running'], host or '', job_id, IMAGE_BUILD_STATUS['queued']])
+        claimed = cur.rowcount
+        cur.close()
+        return claimed
+
+    def _run(self, job_id):
+        host = self._acquire_host()
+        try:
+            claimed = self._claim(job_id, host)
+        except Exception:
+            self._release_host(host)
+            raise
+        if not claimed:
+            self._release_host(host)
+            return
+
+        status, start = IMAGE_BUILD_STATUS['failure'], time.time()
+        joblog = _JobLog(self.redis, job_id)
+
+        try:
+            job = self.sync_select({'id': job_id}, ct=False, ut=False, one=True)
+            params = json.loads(job['params'])
+            if host is None:
+                raise ValueError('没有配置构建主机')
+
+            params.update(self.application_service.sync_fetch_ssh_login_info({'public_ip': host}))
+            joblog.append('构建主机: {}'.format(host))
+
+            if job['kind'] == 'application':
+                out, err = self.application_service.create_image(params=params, out_func=joblog.append,
+                                                                 timeout=IMAGE_BUILD_TIMEOUT)
+                self._finish_application(job, params, out, err)
+            else:
+                out, err = self.project_service.create_image(params=params, out_func=joblog.append,
+                                                             timeout=IMAGE_BUILD_TIMEOUT)
+                self._finish_project(job, params, out, err)
+
+            if not err:
+                status = IMAGE_BUILD_STATUS['success']
+        except Exception as e:
+            self.log.error(traceback.format_exc())
+            joblog.append(str(e))
+        finally:
+            joblog.flush()
+            self.sync_db_execute("UPDATE {table} SET status=%s, end_time=NOW() WHERE id=%s".format(table=self.table),
+                                 [status, job_id])
+            self._release_host(host, status)
+            self.log.stats('IMAGE BUILD job={job} host={host} status={status} run={run:.3f}s'.format(
+                job=job_id, host=host, status=status, run=time.time() - start))
+
+    def _finish_application(self, job, params, out, err):
+        ''' 生成镜像数据, 刷新应用的状态(正常或异常)及镜像状态 '''
+        log = {"out": out, "err": err}
+        arg = {'name': params['image_name'], 'version': params['version'], 'app_id': params['app_id'],
+               'url': REPOS_DOMAIN + '/' + params['app_name'] + '/' + params['image_name'] + ':' + params['version'],
+               'dockerfile': params['dockerfile'], 'log': json.dumps(log), 'lord': job['lord'], 'form': job['form']}
+        self.application_service.add_image_data(arg)
+
+        image = {'name': params['image_name'], 'version': params['version']}
+        if err:
+            self.application_service.sync_update({'status': APPLICATION_STATE['abnormal']}, {'id': params['app_id']})
+            self.image_service.sync_update({'state': IMAGE_STATUS['failure']}, image)
+        else:
+            self._finish_operation_log(job['user_id'], params['app_id'], OPERATION_OBJECT_STYPE['application'])
+            self.application_service.sync_update({'status': APPLICATION_STATE['normal']}, {'id': params['app_id']})
+            self.image_service.sync_update({'state': IMAGE_STATUS['success']}, image)
+
+    def _finish_project(self, job, params, out, err):
+        log = {"out": out, "err": err}
+        self.project_service.sync_insert_log({'name': params['prj_name'], 'version': params['version'],
+                                              'log': json.dumps(log)})
+
+        status = PROJECT_STATUS['build-failure'] if err else PROJECT_STATUS['build-success']
+        self.project_service.sync_update_status({'status': status, 'name': params['prj_name']})
+        self._finish_operation_log(job['user_id'], params['project_id'], OPERATION_OBJECT_STYPE['project'])
+
+    def _finish_operation_log(self, user_id, object_id, object_type):
+        self.sync_update(sets={'operation_status': OPERATE_STATUS['success']},
+                         conds={'user_id': user_id, 'object_id': object_id, 'object_type': object_type},
+                         table='operation_log')
+
+    @coroutine
+    def get_job(self, job_id, lord):
+        sql = """
+                SELECT id, kind, params, status, build_host, user_id,
+                       DATE_FORMAT(start_time, %s) AS start_time,
+                       DATE_FORMAT(end_time, %s) AS end_time,
+                       DATE_FORMAT(create_time, %s) AS create_time
+                FROM {table}
+                WHERE id=%s AND lord=%s AND form=%s
+              """.format(table=self.table)
+        cur = yield self.db.execute(sql, [FULL_DATE_FORMAT, FULL_DATE_FORMAT, FULL_DATE_FORMAT, job_id,
+                                          lord['lord'], lord['form']])
+        job = cur.fetchone()
+        if job:
+            job['params'] = json.loads(job['params'])
+        return job
+
+    def tail(self, job_id, offset=0):
+        '''
+        :return: (lines, 下次读取的偏移量)
+        '''
+        lines = self.redis.lrange(IMAGE_BUILD_LOG.format(job_id), offset, -1)
+        return lines, offset + len(lines)
+
+    def recover(self):
+        ''' 进程启动时调用, 上次退出时排队中的任务重新提交
+            构建队列只在本进程中, 构建中的任务已随进程退出而中断, 全部标记为失败
+        '''
+        running = self.sync_db_fetchall("SELECT id FROM {table} WHERE status=%s".format(table=self.table),
+                                        [IMAGE_BUILD_STATUS['running']])
+        for job in running:
+            joblog = _JobLog(self.redis, job['id'])
+            joblog.append('构建中断: 服务重启')
+            joblog.flush()
+        if running:
+            ids = [job['id'] for job in running]
+            self.sync_db_execute("UPDATE {table} SET status=%s, end_time=NOW() WHERE ".format(table=self.table) +
+                                 get_in_formats(field='id', contents=ids), [IMAGE_BUILD_STATUS['failure']] + ids)
+            self.log.info('IMAGE BUILD marked {} interrupted jobs as failed'.format(len(ids)))
+
+        jobs = self.sync_db_fetchall("SELECT id FROM {table} WHERE status=%s ORDER BY id".format(table=self.table),
+                                     [IMAGE_BUILD_STATUS['queued']])
+        for job in jobs:
+            self._enqueue(job['id'])
+
+        if jobs:
+            self.log.info('IMAGE BUILD recovered {} queued jobs'.format(len(jobs)))
+
+    @coroutine
+    def get_stats(self, lord):
+        ''' lord的各状态任务数及最近一天的构建时长, 当前进程中排队/构建中的任务数(不含构建主机信息) '''
+        cur = yield self.db.execute("SELECT status, COUNT(*) AS num FROM {table} WHERE lord=%s AND form=%s GROUP BY status"
+                                    .format(table=self.table), [lord['lord'], lord['form']])
+        counts = {row['status']: row['num'] for row in cur.fetchall()}
+
+        cur = yield self.db.execute("""
+                SELECT AVG(TIMESTAMPDIFF(SECOND, start_time, end_time)) AS avg_duration,
+                       MAX(TIMESTAMPDIFF(SECOND, start_time, end_time)) AS max_duration
+                FROM {table}
+                WHERE lord=%s AND form=%s
+                  AND start_time IS NOT NULL AND end_time IS NOT NULL AND end_time > NOW() - INTERVAL 1 DAY
+              """.format(table=self.table), [lord['lord'], lord['form']])
+        duration = cur.fetchone()
+
+        with self._lock:
+            stats = dict(self._stats)
+
+        return {
+            'jobs': {name: counts.get(status, 0) for name, status in IMAGE_BUILD_STATUS.items()},
+            'avg_duration': float(duration['avg_duration'] or 0),
+            'max_duration': int(duration['max_duration'] or 0),
+            'queue_depth': stats['queued'],
+            'running': stats['running'],
+            'completed': {'success': stats['success'], 'failure': stats['failure']},
+        }
@@ -6,10 +6,13 @@ from tornado.gen import coroutine
 from tornado.concurrent import run_on_executor
 from service.base import BaseService
 from utils.ssh import SSH
+from utils.ssh_executor import SSH_EXECUTOR
 from utils.security import Aes
+from utils import container_inventory
 from constant import CREATE_IMAGE_CMD, IMAGE_INFO_CMD, DEPLOY_CMD, \
                      REPOS_DOMAIN, LIST_CONTAINERS_CMD, LOAD_IMAGE_FILE,\
-                     LOAD_IMAGE, CLOUD_DOWNLOAD_IMAGE, YE_PORTMAP
+                     LOAD_IMAGE, CLOUD_DOWNLOAD_IMAGE, YE_PORTMAP, DEPLOY_ROLLOUT, DEPLOY_ROLLOUT_DEFAULT, \
+                     DEPLOY_BATCH_SIZE
 from setting import settings
 
 
@@ -58,13 +61,19 @@ class ProjectService(BaseService):
 
         return res
 
-    def create_image(self, params, out_func=None):
+    def create_image(self, params, out_func=None, timeout=None):
         cmd = CREATE_IMAGE_CMD + ' '.join([params['image_name'], params['repos_url'], params['branch_name'], params['version']])
         ssh = SSH(hostname=params['public_ip'], port=22, username=params['username'], passwd=params['passwd'])
-        out, err = ssh.exec_rt(cmd, out_func)
+        out, err = ssh.exec_rt(cmd, out_func, timeout)
         return out, err
 
     def deployment(self, params, out_func=None):
+        ''' 按批次部署到多台主机, 同一批次并发执行, 有主机失败时后续批次不再执行
+        :param params: {'image_name', 'container_name', 'infos': [ssh登录信息], 可选'rollout', 'batch_size'}
+        :return: {'log': {ip: {'output', 'error', 'result'}}, 'has_err': bool}
+        '''
+        if not out_func: out_func = print
+
         image_name = REPOS_DOMAIN + "/library/" + params['image_name']
         cmd = DEPLOY_CMD.format(
             repository=REPOS_DOMAIN,
@@ -75,18 +84,47 @@ class ProjectService(BaseService):
             container_name=params['container_name'])
         has_err = False
         log = dict()
-        for ip in params['infos']:
-            ssh = SSH(hostname=ip['public_ip'], port=22, username=ip['username'], passwd=ip['passwd'])
-            result = '成功'
-
-            out, err = ssh.exec_rt(cmd, out_func)
-            if err:
-                has_err, result = True, '失败'
-
-            out_func('IP: {}, 部署{}'.format(ip['public_ip'], result))
-            log[ip['public_ip']] = {"output": str(out), "error": str(err)}
+        for batch in self._rollout_batches(params['infos'], params.get('rollout'), params.get('batch_size')):
+            if has_err:
+                for ip in batch:
+                    log[ip['public_ip']] = {"output": str([]), "error": str([]), "result": '未执行'}
+                continue
+
+            futures = [SSH_EXECUTOR.submit(ip['public_ip'], self._deploy_host, ip, cmd, out_func) for ip in batch]
+            for ip, f in zip(batch, futures):
+                out, err = f.result()
+                result = '失败' if err else '成功'
+                has_err = has_err or bool(err)
+
+                out_func('IP: {}, 部署{}'.format(ip['public_ip'], result))
+                log[ip['public_ip']] = {"output": str(out), "error": str(err), "result": result}
         return {'log': log, 'has_err': has_err}
 
+    @staticmethod
+    def _rollout_batches(infos, rollout=None, batch_size=None):
+        '''
+        :param rollout: all同时部署, batch每批batch_size台, canary逐台部署
+        :return: [[info, ...], ...]
+        '''
+        rollout = rollout if rollout in DEPLOY_ROLLOUT else DEPLOY_ROLLOUT_DEFAULT
+        size = {'all': len(infos), 'batch': int(batch_size or DEPLOY_BATCH_SIZE), 'canary': 1}[rollout]
+        size = max(size, 1)
+        return [infos[i:i + size] for i in range(0, len(infos), size)]
+
+    @staticmethod
+    def _deploy_host(ip, cmd, out_func):
+        ''' 输出的每行前加上主机IP, 多台主机的输出交替显示 '''
+        def tagged(line):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', 'replace')
+            out_func('[{}] {}'.format(ip['public_ip'], line))
+
+        try:
+            ssh = SSH(hostname=ip['public_ip'], port=22, username=ip['username'], passwd=ip['passwd'])
+            return ssh.exec_rt(cmd, tagged)
+        except Exception as e:
+            return [], [str(e)]
+
     def set_deploy_ips(self, params):
         sql = """
                 UPDATE {table} SET deploy_ips=%s, container_name=%s, status=%s
@@ -119,6 +157,14 @@ class ProjectService(BaseService):
 
     @coroutine
     def list_containers(self, params):
+        ''' 优先使用agent上报的容器列表, 过期时ssh执行docker ps, 只返回包含container_name的
+        :param params: {'public_ip', 'container_name', ssh登录信息}
+        '''
+        containers = container_inventory.load(self.redis, params['public_ip'])
+        if containers is not None:
+            rows = [container_inventory.to_row(c) for c in containers]
+            return [r for r in rows if params['container_name'] in ','.join(r)]
+
         sufix = '|grep {container_name} '.format(container_name=params['container_name'])
         params['cmd'] = LIST_CONTAINERS_CMD+sufix
         out, err = yield self.remote_ssh(params)
@@ -1,20 +1,28 @@
 __author__ = 'Jon'
 
 import json
+import time
 import random
-from tornado.gen import coroutine, sleep
+import shlex
+from tornado.gen import coroutine
+from tornado.ioloop import IOLoop
+from tornado.locks import Semaphore
+from tornado.concurrent import run_on_executor
 
 from service.base import BaseService
 from utils.general import get_formats
-from utils.aliyun import Aliyun
-from utils.qcloud import Qcloud
-from utils.zcloud import Zcloud
+from service.cloud.control import CLOUD_CONTROL
 from constant import UNINSTALL_CMD, DEPLOYED, LIST_CONTAINERS_CMD, START_CONTAINER_CMD, STOP_CONTAINER_CMD, \
                      DEL_CONTAINER_CMD, CONTAINER_INFO_CMD, ALIYUN_NAME, QCLOUD_NAME, FULL_DATE_FORMAT, ZCLOUD_NAME, \
-                     SERVERS_REPORT_INFO, TCLOUD_STATUS, THRESHOLD, MONITOR_COLOR_TYPE, INSTANCE_STATUS
+                     SERVERS_REPORT_INFO, TCLOUD_STATUS, THRESHOLD, MONITOR_COLOR_TYPE, INSTANCE_STATUS, OPERATE_STATUS, \
+                     CONTAINER_BATCH_CMD, CONTAINER_BATCH_MARK, SERVER_UNINSTALL_CONCURRENCY, METRIC_RETENTION
 from utils.security import Aes
 from utils.general import get_in_formats, json_loads, json_dumps
 from utils.faker import is_faker, fake_report_info, fake_performance
+from utils.metric_archive import read_records
+from utils.recent_metric import RECENT_METRICS
+from utils import instance_refresh, container_inventory
+from setting import settings
 
 class ServerService(BaseService):
     table = 'server'
@@ -32,9 +40,19 @@ class ServerService(BaseService):
             sql = (base_sql % table) + suffix
             yield self.db.execute(sql, base_data + [content])
 
+        # 容器列表单独保存, 不写入SERVERS_REPORT_INFO; 旧版本的agent没有该字段
+        if params.get('containers') is not None:
+            container_inventory.save(self.redis, params['public_ip'], params.pop('containers'))
+
         if params.get('docker'):
             for (k, v) in params['docker'].items():
                 self._save_docker_report(base_data + [k] + [json.dumps(v)])
+            self._save_container_names(params['public_ip'], params['time'], list(params['docker'].keys()))
+
+        # 最近的数据同时保存在内存中, 供短时间段的查询
+        RECENT_METRICS.add_host(params['public_ip'], params['time'], params)
+        for (k, v) in (params.get('docker') or {}).items():
+            RECENT_METRICS.add_container(params['public_ip'], k, params['time'], v)
 
         yield self._save_k8s_report(params)
 
@@ -72,6 +90,45 @@ class ServerService(BaseService):
             "VALUES(%s, %s, %s, %s)"
         yield self.db.execute(sql, params)
 
+    @coroutine
+    def _save_container_names(self, public_ip, created_time, names):
+        ''' 维护主机的容器名索引(docker_container表), 查询容器列表时不需要扫描docker_stat
+        '''
+        values = ','.join(['(%s, %s, %s, %s)'] * len(names))
+        arg = []
+        for name in names:
+            arg.extend([public_ip, name, created_time, created_time])
+
+        sql = "INSERT INTO docker_container(public_ip, container_name, first_time, last_time) VALUES {values}" \
+              " ON DUPLICATE KEY UPDATE last_time=VALUES(last_time)".format(values=values)
+        yield self.db.execute(sql, arg)
+
+    @coroutine
+    def get_container_names(self, params):
+        '''
+        :param params: {'id': 主机id, 'start_time': 可选, 'end_time': 可选}
+        :return: [{'container_name': str, 'first_time': int, 'last_time': int}, ...]
+        '''
+        public_ip = yield self.fetch_public_ip(params['id'])
+        if not public_ip:
+            raise ValueError('主机不存在')
+
+        conds, arg = ['public_ip=%s'], [public_ip]
+        if params.get('start_time'):
+            conds.append('last_time>=%s')
+            arg.append(params['start_time'])
+        if params.get('end_time'):
+            conds.append('first_time<%s')
+            arg.append(params['end_time'])
+
+        sql = """
+                SELECT container_name, first_time, last_time FROM docker_container
+                WHERE {conds}
+                ORDER BY container_name
+              """.format(conds=' AND '.join(conds))
+        cur = yield self.db.execute(sql, arg)
+        return cur.fetchall()
+
     @coroutine
     def save_server_account(self, params):
         sql = " INSERT INTO server_account(public_ip, username, passwd) " \
@@ -127,27 +184,72 @@ class ServerService(BaseService):
         return data
 
     @coroutine
-    def _delete_server_info(self, table, public_ip):
-        base_sql = "DELETE FROM %s " % table
-        sql = base_sql + "WHERE public_ip=%s"
-        yield self.db.execute(sql, public_ip)
+    def delete_server(self, params):
+        ''' 批量删除主机, server/server_account表的记录在一个事务中删除, agent由submit_uninstall在后台卸载
+        :param params: {'id': [主机id, ...]}
+        :return: {server_id: {'server_id', 'public_ip', 'username', 'passwd'}}, 已删除的主机, 不存在的不在其中
+        '''
+        ids = [int(i) for i in params['id']]
+        if not ids:
+            return {}
 
-    @coroutine
-    def _delete_server(self, server_id):
-        params = yield self.fetch_ssh_login_info({'server_id': server_id})
+        sql = " SELECT s.id AS server_id, s.public_ip, sa.username, sa.passwd FROM server s " \
+              " LEFT JOIN server_account sa USING(public_ip) WHERE " + get_in_formats(field='s.id', contents=ids)
+        cur = yield self.db.execute(sql, ids)
+        infos = {i['server_id']: i for i in cur.fetchall()}
+        if not infos:
+            return infos
+
+        public_ips = list({i['public_ip'] for i in infos.values()})
+        tx = yield self.db.begin()
+        try:
+            for table in ['server', 'server_account']:
+                sql = "DELETE FROM {table} WHERE ".format(table=table) + get_in_formats('public_ip', public_ips)
+                yield tx.execute(sql, public_ips)
+            yield tx.commit()
+        except Exception:
+            yield tx.rollback()
+            raise
+
+        self.redis.hdel(DEPLOYED, *public_ips)
+        container_inventory.delete(self.redis, *public_ips)
+
+        for info in infos.values():
+            if info['passwd']:
+                info['passwd'] = Aes.decrypt(info['passwd'])
+        return infos
+
+    def submit_uninstall(self, infos, operation_ids):
+        ''' 在后台卸载已删除主机的agent, 同时卸载的主机数不超过SERVER_UNINSTALL_CONCURRENCY, 结果写入operation_log表
+        :param infos:         delete_server的返回值
+        :param operation_ids: {server_id: operation_log表的id}
+        '''
+        IOLoop.current().spawn_callback(self._run_uninstall, infos, operation_ids)
 
-        params['cmd'] = UNINSTALL_CMD
-        yield self.remote_ssh(params)
+    @coroutine
+    def _run_uninstall(self, infos, operation_ids):
+        semaphore = Semaphore(SERVER_UNINSTALL_CONCURRENCY)
+        ids = list(infos.keys())
+        results = yield [self._uninstall(semaphore, infos[id]) for id in ids]
 
-        for table in ['server', 'server_account']:
-            yield self._delete_server_info(table, params['public_ip'])
+        errors = {id: err for id, err in zip(ids, results) if err}
+        for id, err in errors.items():
+            self.log.error('server {id} uninstall failed: {err}'.format(id=id, err=err))
 
-        self.redis.hdel(DEPLOYED, params['public_ip'])
+        yield self._finish_operations(ids, operation_ids, errors)
 
     @coroutine
-    def delete_server(self, params):
-        for server_id in params['id']:
-            yield self._delete_server(server_id=server_id)
+    def _uninstall(self, semaphore, info):
+        ''' :return: 错误信息, 成功时为空 '''
+        if not info['username']:
+            return '没有登录信息'
+
+        try:
+            with (yield semaphore.acquire()):
+                _, err = yield self.remote_ssh(dict(info, cmd=UNINSTALL_CMD))
+        except Exception as e:
+            return str(e) or '卸载失败'
+        return ''.join(err).strip()
 
     @coroutine
     def update_server(self, params):
@@ -274,13 +376,13 @@ class ServerService(BaseService):
     @coroutine
     def _get_performance_page(self, params):
         data = []
-        start_page = (params['now_page'] - 1) * params['page_number']
+        start_page = params.get('offset', (params['now_page'] - 1) * params['page_number'])
         arg = [
             params['public_ip'],
             params['start_time'],
             params['end_time'],
             start_page,
-            params['page_number']
+            params.get('limit', params['page_number'])
         ]
         sql = """
             SELECT c.created_time AS created_time, c.content AS  cpu, d.content AS disk, m.content AS memory, n.content AS net
@@ -332,6 +434,91 @@ class ServerService(BaseService):
             data.append(one_record)
         return data
 
+    @staticmethod
+    def _sample(records):
+        ''' 与_get_performance一致, 从最新的一条开始等间隔取约7条, 按时间升序返回 '''
+        step = len(records)//7
+        return records[::-1][::step][::-1] if step else records
+
+    def _get_recent_performance(self, params):
+        ''' 时间段已被内存缓冲覆盖时, 不查MySQL '''
+        records = RECENT_METRICS.host_records(params['public_ip'], params['start_time'], params['end_time'])
+
+        if params['type'] == 0:
+            records = self._sample(records)
+            return {table: [dict(r[table], created_time=r['created_time']) for r in records]
+                    for table in ['cpu', 'memory', 'disk', 'net']}
+
+        offset = (params['now_page'] - 1) * params['page_number']
+        return records[offset:offset+params['page_number']]
+
+    @coroutine
+    def _fetch_raw_horizon(self, public_ip, start_time):
+        ''' MySQL中该主机最早的原始数据时间, 更早的数据已归档
+            start_time仍在原始数据保留期内时不会有归档, 不必查询
+        '''
+        if start_time >= int(time.time()) - METRIC_RETENTION['raw']['keep_days'] * 86400:
+            return start_time
+
+        cur = yield self.db.execute("SELECT MIN(created_time) AS min_time FROM cpu WHERE public_ip=%s", [public_ip])
+        data = cur.fetchone()
+
+        return data['min_time'] if data and data['min_time'] else int(time.time())
+
+    @run_on_executor
+    def _read_archive(self, public_ip, start_time, end_time):
+        return read_records(settings['metric_archive_path'], public_ip, start_time, end_time)
+
+    @coroutine
+    def _get_merged_performance(self, table, archived, params):
+        ''' 归档数据与MySQL中的数据合并后再统一采样, MySQL部分只查询被选中的记录
+        '''
+        cur = yield self.db.execute("""
+                SELECT id FROM {table}
+                WHERE public_ip=%s AND created_time>=%s AND created_time<%s
+                ORDER BY created_time
+                """.format(table=table), [params['public_ip'], params['start_time'], params['end_time']])
+        ids = [i['id'] for i in cur.fetchall()]
+
+        records = self._sample([dict(r[table], created_time=r['created_time']) for r in archived] + ids)
+        choose_id = [i for i in records if not isinstance(i, dict)]
+        if not choose_id:
+            return records
+
+        cur = yield self.db.execute("""
+                SELECT id, created_time, content FROM {table}
+                WHERE {ids}
+                """.format(table=table, ids=get_in_formats(field='id', contents=choose_id)), choose_id)
+        rows = {x['id']: dict(json.loads(x['content']), created_time=x['created_time']) for x in cur.fetchall()}
+
+        return [i if isinstance(i, dict) else rows[i] for i in records if isinstance(i, dict) or i in rows]
+
+    @coroutine
+    def _get_archive_performance(self, params, horizon):
+        ''' 早于horizon的部分从归档读取, 其余仍查MySQL, 返回格式与_get_performance/_get_performance_page一致
+        '''
+        archived = yield self._read_archive(params['public_ip'], params['start_time'], min(params['end_time'], horizon))
+        recent = dict(params, start_time=max(params['start_time'], horizon))
+        has_recent = recent['start_time'] < params['end_time']
+
+        if params['type'] == 0:
+            data = {}
+            for table in ['cpu', 'memory', 'disk', 'net']:
+                if has_recent:
+                    data[table] = yield self._get_merged_performance(table, archived, recent)
+                else:
+                    data[table] = [dict(r[table], created_time=r['created_time']) for r in self._sample(archived)]
+            return data
+
+        # 分页时先取归档部分, 不足一页再从MySQL补
+        offset = (params['now_page'] - 1) * params['page_number']
+        data = archived[offset:offset+params['page_number']]
+        if has_recent and len(data) < params['page_number']:
+            recent.update({'offset': max(offset - len(archived), 0), 'limit': params['page_number'] - len(data)})
+            rows = yield self._get_performance_page(recent)
+            data.extend(rows)
+        return data
+
     @coroutine
     def get_performance(self, params):
         params['public_ip'] = yield self.fetch_public_ip(params['id'])
@@ -340,6 +527,15 @@ class ServerService(BaseService):
         if info and is_faker(info['instance_id']):
             return fake_performance(params)
 
+        if params['type'] in [0, 1] and RECENT_METRICS.covers_host(params['public_ip'], params['start_time']):
+            return self._get_recent_performance(params)
+
+        if params['type'] in [0, 1]:
+            horizon = yield self._fetch_raw_horizon(params['public_ip'], params['start_time'])
+            if params['start_time'] < horizon:
+                data = yield self._get_archive_performance(params, horizon)
+                return data
+
         data = {}
         if params['type'] == 0:
             data['cpu'] = yield self._get_performance('cpu', params)
@@ -376,68 +572,157 @@ class ServerService(BaseService):
         return info
 
     @coroutine
-    def _change_ip(self, cloud, info):
-        new_ip = cloud.get_public_ip(info)
+    def _change_ip(self, info):
         old_ip = info['public_ip']
-
-        while not new_ip or new_ip == old_ip:
-            yield sleep(1)
-            new_ip = cloud.get_public_ip(info)
+        new_ip = yield CLOUD_CONTROL.wait_ip_change(info)
 
         self.redis.hset(DEPLOYED, new_ip, 1)
         self.redis.hdel(DEPLOYED, old_ip)
+        status = self.redis.hget(INSTANCE_STATUS, old_ip)
+        if status:
+            self.redis.hset(INSTANCE_STATUS, new_ip, status)
+            self.redis.hdel(INSTANCE_STATUS, old_ip)
         yield self.update(sets={'public_ip': new_ip}, conds={'public_ip': old_ip})
         yield self.db.execute('UPDATE instance SET public_ip = %s WHERE public_ip = %s', [new_ip, old_ip])
         yield self.db.execute('UPDATE server_account SET public_ip = %s WHERE public_ip = %s', [new_ip, old_ip])
 
-    def _produce_cloud(self, provider):
-        clouds = {
-            ALIYUN_NAME: Aliyun,
-            QCLOUD_NAME: Qcloud,
-            ZCLOUD_NAME: Zcloud
-        }
-
-        return clouds[provider]
-
     @coroutine
     def stop_server(self, id):
-        yield self._operate_server(id, 'stop')
-        yield self.change_instance_status(status=TCLOUD_STATUS[9], id=id)
-        ip = yield self.fetch_public_ip(server_id=id)
-        self.redis.hset(INSTANCE_STATUS, ip, TCLOUD_STATUS[9])
+        yield self._operate_server(id, 'stop', TCLOUD_STATUS[9])
 
     @coroutine
     def start_server(self, id):
-        yield self._operate_server(id, 'start')
-        yield self.change_instance_status(status=TCLOUD_STATUS[8], id=id)
-        ip = yield self.fetch_public_ip(server_id=id)
-        self.redis.hset(INSTANCE_STATUS, ip, TCLOUD_STATUS[8])
+        yield self._operate_server(id, 'start', TCLOUD_STATUS[8])
 
     @coroutine
     def reboot_server(self, id):
-        yield self._operate_server(id, 'reboot')
-        yield self.change_instance_status(status=TCLOUD_STATUS[7], id=id)
-        ip = yield self.fetch_public_ip(server_id=id)
-        self.redis.hset(INSTANCE_STATUS, ip, TCLOUD_STATUS[7])
+        yield self._operate_server(id, 'reboot', TCLOUD_STATUS[7])
 
     @coroutine
-    def _operate_server(self, id, cmd):
+    def _operate_server(self, id, cmd, status):
         info = yield self.fetch_instance_info(id)
-        cloud = self._produce_cloud(info['provider'])
+
+        yield CLOUD_CONTROL.operate(info, cmd)
+        yield self.change_instance_status(status=status, id=id)
+        self.redis.hset(INSTANCE_STATUS, info['public_ip'], status)
+
+        # 由实例同步进程单独刷新该实例, 不必等待全量同步
+        instance_refresh.push(self.redis, [(info['provider'], info['region_id'], info['instance_id'])])
 
         # 亚马逊云与微软云，会变化public_ip
-        if info['provider'] == ZCLOUD_NAME:
-            getattr(cloud, cmd)(info)
+        if info['provider'] == ZCLOUD_NAME and cmd in ['start', 'reboot']:
+            yield self._change_ip(info)
+
+    def submit_operation(self, id, cmd, operation_id):
+        ''' 在后台执行开机/关机/重启, 立即返回, 结果写入operation_log表的operation_status
+        :param cmd: start/stop/reboot
+        :param operation_id: operation_log表的id, 用于查询操作状态
+        '''
+        IOLoop.current().spawn_callback(self._run_operation, id, cmd, operation_id)
 
-            if cmd in ['start', 'reboot']:
-                yield self._change_ip(cloud, info)
+    @coroutine
+    def _run_operation(self, id, cmd, operation_id):
+        status = OPERATE_STATUS['success']
+        try:
+            yield getattr(self, cmd + '_server')(id)
+        except Exception as e:
+            self.log.error('server {id} {cmd} failed: {e}'.format(id=id, cmd=cmd, e=e))
+            status = OPERATE_STATUS['fail']
+
+        yield self.db.execute('UPDATE operation_log SET operation_status=%s WHERE id=%s', [status, operation_id])
 
-            return
+    @coroutine
+    def fetch_instance_infos(self, server_ids):
+        sql = " SELECT s.id AS server_id, i.* FROM instance i JOIN server s USING(instance_id) WHERE "
+        sql += get_in_formats(field='s.id', contents=server_ids)
+        cur = yield self.db.execute(sql, server_ids)
+        return cur.fetchall()
 
-        params = getattr(cloud, cmd)(info)
-        payload = cloud.add_sign(params)
+    @coroutine
+    def _operate_group(self, provider, region_id, infos, cmd):
+        ''' 同一云同一地域的实例调用一次批量接口, 返回错误信息, 成功时为空 '''
+        try:
+            yield CLOUD_CONTROL.operate_batch(provider, region_id, [i['instance_id'] for i in infos], cmd)
+        except Exception as e:
+            return str(e) or '操作失败'
+        return ''
 
-        yield self.get(payload, host=cloud.domain)
+    @coroutine
+    def _try_change_ip(self, info):
+        try:
+            yield self._change_ip(info)
+        except Exception as e:
+            return str(e)
+        return ''
+
+    @coroutine
+    def operate_servers(self, ids, cmd):
+        ''' 批量开机/关机/重启, 按云和地域分组, 各组并发调用批量接口, 状态批量写入
+        :param ids: 主机id列表
+        :param cmd: start/stop/reboot
+        :return: {server_id: 错误信息}, 成功的主机不在其中
+        '''
+        status = {'start': TCLOUD_STATUS[8], 'stop': TCLOUD_STATUS[9], 'reboot': TCLOUD_STATUS[7]}[cmd]
+
+        infos = yield self.fetch_instance_infos(ids)
+        errors = {id: '主机不存在' for id in set(ids) - {i['server_id'] for i in infos}}
+
+        groups = {}
+        for info in infos:
+            groups.setdefault((info['provider'], info['region_id']), []).append(info)
+
+        keys = list(groups.keys())
+        results = yield [self._operate_group(provider, region_id, groups[(provider, region_id)], cmd)
+                         for provider, region_id in keys]
+
+        done = []
+        for key, err in zip(keys, results):
+            if err:
+                errors.update({i['server_id']: err for i in groups[key]})
+            else:
+                done.extend(groups[key])
+
+        if done:
+            instance_ids = [i['instance_id'] for i in done]
+            sql = 'UPDATE instance SET status=%s WHERE ' + get_in_formats(field='instance_id', contents=instance_ids)
+            yield self.db.execute(sql, [status] + instance_ids)
+            self.redis.hmset(INSTANCE_STATUS, {i['public_ip']: status for i in done})
+            instance_refresh.push(self.redis, [(i['provider'], i['region_id'], i['instance_id']) for i in done])
+
+        # 亚马逊云与微软云，会变化public_ip
+        changing = [i for i in done if i['provider'] == ZCLOUD_NAME and cmd in ['start', 'reboot']]
+        if changing:
+            results = yield [self._try_change_ip(i) for i in changing]
+            errors.update({i['server_id']: err for i, err in zip(changing, results) if err})
+
+        return errors
+
+    def submit_batch_operation(self, ids, cmd, operation_ids):
+        ''' 在后台执行批量开机/关机/重启, 结果写入operation_log表
+        :param operation_ids: {server_id: operation_log表的id}
+        '''
+        IOLoop.current().spawn_callback(self._run_batch_operation, ids, cmd, operation_ids)
+
+    @coroutine
+    def _run_batch_operation(self, ids, cmd, operation_ids):
+        try:
+            errors = yield self.operate_servers(ids, cmd)
+        except Exception as e:
+            errors = {id: str(e) for id in ids}
+
+        for id, err in errors.items():
+            self.log.error('server {id} {cmd} failed: {err}'.format(id=id, cmd=cmd, err=err))
+
+        yield self._finish_operations(ids, operation_ids, errors)
+
+    @coroutine
+    def _finish_operations(self, ids, operation_ids, errors):
+        ''' 按结果批量更新operation_log, errors中的为失败, 其余为成功 '''
+        for status, op_ids in [(OPERATE_STATUS['fail'], [operation_ids[id] for id in ids if id in errors]),
+                               (OPERATE_STATUS['success'], [operation_ids[id] for id in ids if id not in errors])]:
+            if op_ids:
+                sql = 'UPDATE operation_log SET operation_status=%s WHERE ' + get_in_formats(field='id', contents=op_ids)
+                yield self.db.execute(sql, [status] + op_ids)
 
     @coroutine
     def get_instance_status(self, ip):
@@ -451,7 +736,15 @@ class ServerService(BaseService):
 
     @coroutine
     def get_containers(self, params):
-        return []
+        ''' 优先使用agent上报的容器列表, 过期时ssh执行docker ps
+        :param params: {'server_id': str}
+        :return: [[id, name, status, created_at], ...]
+        '''
+        public_ip = yield self.fetch_public_ip(params['server_id'])
+        containers = container_inventory.load(self.redis, public_ip)
+        if containers is not None:
+            return [container_inventory.to_row(c) for c in containers]
+
         info = yield self.fetch_ssh_login_info(params)
         params.update(info)
         params['cmd'] = LIST_CONTAINERS_CMD
@@ -487,6 +780,79 @@ class ServerService(BaseService):
         if err:
             raise ValueError
 
+    @coroutine
+    def fetch_ssh_login_infos(self, server_ids):
+        ''' 批量获取ssh登录信息
+        :return: {server_id: {'server_id', 'public_ip', 'username', 'passwd'}}, 不存在的主机不在其中
+        '''
+        sql = " SELECT s.id AS server_id, s.public_ip, sa.username, sa.passwd FROM server s " \
+              " JOIN server_account sa USING(public_ip) WHERE " + get_in_formats(field='s.id', contents=server_ids)
+        cur = yield self.db.execute(sql, server_ids)
+
+        infos = dict()
+        for info in cur.fetchall():
+            info['passwd'] = Aes.decrypt(info['passwd'])
+            infos[info['server_id']] = info
+        return infos
+
+    @coroutine
+    def operate_containers(self, items):
+        ''' 批量启动/停止/重启/删除容器, 同一主机的操作合成一条命令在一个ssh会话中顺序执行, 各主机并发执行
+        :param items: [{'server_id': int, 'container_id': str, 'action': start/stop/reboot/delete}, ...]
+        :return: [{'server_id', 'container_id', 'action', 'success': bool, 'output': [str]}, ...], 顺序与items一致
+        '''
+        results = [dict(i, success=False, output=[]) for i in items]
+
+        infos = yield self.fetch_ssh_login_infos(list({i['server_id'] for i in items}))
+
+        hosts = dict()  # {server_id: [items中的下标]}
+        for index, item in enumerate(items):
+            if item['server_id'] in infos:
+                hosts.setdefault(item['server_id'], []).append(index)
+            else:
+                results[index]['output'].append('主机不存在')
+
+        server_ids = list(hosts.keys())
+        outputs = yield [self.remote_ssh(dict(infos[sid], cmd=self._container_batch_cmd([items[i] for i in hosts[sid]])))
+                         for sid in server_ids]
+
+        for sid, (out, err) in zip(server_ids, outputs):
+            self._parse_container_batch([results[i] for i in hosts[sid]], out, err)
+
+        return results
+
+    @staticmethod
+    def _container_batch_cmd(items):
+        ''' 每个操作的输出前打上开始标记, 之后打上带退出码的结束标记, 一个操作失败不影响后面的 '''
+        parts = []
+        for n, item in enumerate(items):
+            cmd = CONTAINER_BATCH_CMD[item['action']].format(container_id=shlex.quote(item['container_id']))
+            parts.append('echo "{mark}{n}"; ({cmd}) 2>&1; echo "{mark}{n}:$?"'.format(mark=CONTAINER_BATCH_MARK,
+                                                                                     n=n, cmd=cmd))
+        return '; '.join(parts)
+
+    @staticmethod
+    def _parse_container_batch(results, out, err):
+        ''' 按标记拆分出各个操作的输出及退出码, 没有结束标记的(连接失败/超时)视为失败, 附上ssh的错误信息 '''
+        current, finished = None, set()
+        for line in out:
+            line = line.rstrip('\n')
+            if line.startswith(CONTAINER_BATCH_MARK):
+                n, _, code = line[len(CONTAINER_BATCH_MARK):].partition(':')
+                n = int(n)
+                if code:
+                    results[n]['success'] = code == '0'
+                    finished.add(n)
+                    current = None
+                else:
+                    current = results[n]
+            elif current is not None:
+                current['output'].append(line)
+
+        for n, result in enumerate(results):
+            if n not in finished:
+                result['output'].extend(e.rstrip('\n') for e in err)
+
     @coroutine
     def get_docker_performance(self, params):
         # 通过主机id(server_id)获取公共IP
@@ -495,7 +861,11 @@ class ServerService(BaseService):
             raise ValueError('主机不存在')
 
         data = {}
-        if params['type'] == 0:
+        if params['type'] == 0 and RECENT_METRICS.covers_container(params['public_ip'], params['container_name'], params['start_time']):
+            rows = RECENT_METRICS.container_records(params['public_ip'], params['container_name'],
+                                                    params['start_time'], params['end_time'])
+            data = self._format_container_performance(self._sample(rows)) if rows else {}
+        elif params['type'] == 0:
             data = yield self._get_container_performance(params)
         elif params['type'] == 1:
             data = yield self._get_container_performance_page(params)
@@ -529,37 +899,43 @@ class ServerService(BaseService):
                 WHERE {ids}
                 """.format(table='docker_stat', ids=ids)
         cur = yield self.db.execute(sql, choose_id)
+
+        return self._format_container_performance([(x['created_time'], json.loads(x['content'])) for x in cur.fetchall()])
+
+    def _format_container_performance(self, rows):
+        '''
+        :param rows: [(created_time, content), ...], content为docker_stat表的content
+        '''
         data = {
             'cpu': [],
             'memory': [],
             'net': [],
             'block': []
         }
-        for x in cur.fetchall():
-            content = json.loads(x['content'])
+        for created_time, content in rows:
             cpu = {
                     'percent': content['cpu'],
-                    'created_time': x['created_time'],
+                    'created_time': created_time,
                 }
             data['cpu'].append(cpu)
 
             memory = {
                     'percent': content['mem_percent'],
-                    'created_time': x['created_time'],
+                    'created_time': created_time,
                 }
             data['memory'].append(memory)
 
             net = {
                     'input': content['net_input'],
                     'output': content['net_output'],
-                    'created_time': x['created_time'],
+                    'created_time': created_time,
             }
             data['net'].append(net)
 
             block = {
                     'input': content['block_input'],
                     'output': content['block_output'],
-                    'created_time': x['created_time'],
+                    'created_time': created_time,
             }
             data['block'].append(block)
 
@@ -567,42 +943,51 @@ class ServerService(BaseService):
 
     @coroutine
     def _get_container_performance_page(self, params):
-        data = []
         start_page = (params['now_page'] - 1) * params['page_number']
+
+        if RECENT_METRICS.covers_container(params['public_ip'], params['container_name'], params['start_time']):
+            rows = RECENT_METRICS.container_records(params['public_ip'], params['container_name'],
+                                                    params['start_time'], params['end_time'])
+            return [self._format_container_record(t, content)
+                    for t, content in rows[start_page:start_page+params['page_number']]]
+
         arg = [
             params['public_ip'],
+            params['container_name'],
             params['start_time'],
             params['end_time'],
             start_page,
             params['page_number']
         ]
+        # 走ip_container_time(public_ip, container_name, created_time)索引的范围扫描
         sql = """
                 SELECT created_time, content FROM {table}
-                WHERE public_ip=%s  AND created_time>=%s AND created_time<%s
+                WHERE public_ip=%s AND container_name=%s AND created_time>=%s AND created_time<%s
+                ORDER BY created_time
                 LIMIT %s, %s
             """.format(table='docker_stat')
         cur = yield self.db.execute(sql, arg)
-        for i in cur.fetchall():
-            content = json.loads(i['content'])
-            one_record = {
-                'created_time': i['created_time'],
-                'cpu': {'percent': content['cpu']},
-                'block': {
-                        'block_input': content['block_input'],
-                        'block_output': content['block_output'],
-                },
-                'memory': {
-                        'mem_limit': content['mem_limit'],
-                        'mem_usage': content['mem_usage'],
-                        'mem_percent': content['mem_percent']
-                        },
-                'net': {
-                        'net_input': content['net_input'],
-                        'net_output': content['net_output'],
-                        },
-            }
-            data.append(one_record)
-        return data
+        return [self._format_container_record(i['created_time'], json.loads(i['content'])) for i in cur.fetchall()]
+
+    @staticmethod
+    def _format_container_record(created_time, content):
+        return {
+            'created_time': created_time,
+            'cpu': {'percent': content['cpu']},
+            'block': {
+                    'block_input': content['block_input'],
+                    'block_output': content['block_output'],
+            },
+            'memory': {
+                    'mem_limit': content['mem_limit'],
+                    'mem_usage': content['mem_usage'],
+                    'mem_percent': content['mem_percent']
+                    },
+            'net': {
+                    'net_input': content['net_input'],
+                    'net_output': content['net_output'],
+                    },
+        }
 
     @coroutine
     def _get_container_performance_avg(self, table, params):
@@ -637,10 +1022,20 @@ class ServerService(BaseService):
 
     @coroutine
     def get_container_info(self, params):
+        ''' 优先使用agent上报的inspect摘要, 过期或找不到该容器时ssh执行docker inspect '''
+        containers = container_inventory.load(self.redis, params['public_ip'])
+        container = container_inventory.find(containers, params['container_id']) if containers else None
+        if container and container.get('inspect'):
+            return self._format_container_info(container['inspect'], params), []
+
         params['cmd'] = CONTAINER_INFO_CMD % (params['container_id'])
 
         raw_out, err = yield self.remote_ssh(params)
         json_out = json.loads(raw_out[0])
+        return self._format_container_info(json_out, params), err
+
+    @staticmethod
+    def _format_container_info(json_out, params):
         data = {
             'name': json_out['Name'],
             'status': json_out['State'].get('Status', 'dead'),
@@ -663,7 +1058,7 @@ class ServerService(BaseService):
                 'portbind': json_out['NetworkSettings'].get('Ports', '')
             }
         }
-        return data, err
+        return data
 
     @coroutine
     def change_instance_status(self, status, id):
@@ -23,3 +23,19 @@ class ServerOperationService(BaseService):
               """
         cur = yield self.db.execute(sql, [FULL_DATE_FORMAT, params['object_type'], params['object_id']])
         return cur.fetchall()
+
+    @coroutine
+    def get_operation(self, id):
+        ''' 查询一次操作的状态, operation_status: 0 成功, 1 失败, 2 进行中 '''
+        sql = """
+                SELECT id, user_id, object_id, object_type, operation, operation_status,
+                    DATE_FORMAT(created_time, %s) AS created_time,
+                    DATE_FORMAT(update_time, %s) AS update_time
+                FROM operation_log
+                WHERE id=%s
+              """
+        cur = yield self.db.execute(sql, [FULL_DATE_FORMAT, FULL_DATE_FORMAT, id])
+        data = cur.fetchone()
+        if not data:
+            raise ValueError('操作不存在')
+        return data
@@ -64,7 +64,7 @@ settings['git_state'] = ''
 #################################################################################################
 # 构建部署配置
 #################################################################################################
-settings['ip_for_image_creation'] = ''
+settings['ip_for_image_creation'] = ''  # 构建镜像的主机, 多台时用逗号分隔
 settings['deploy_username'] = ''
 settings['deploy_password'] = ''
 
@@ -95,6 +95,12 @@ settings['qiniu_file_bucket_url'] = ''
 settings['store_path'] = ''
 
 
+#################################################################################################
+# 监控数据归档
+#################################################################################################
+settings['metric_archive_path'] = '/data/metric_archive'  # 绝对路径, web服务与crontab/metric_archive.py需一致
+
+
 #################################################################################################
 # 极验证
 #################################################################################################
@@ -6,9 +6,9 @@ import hashlib
 import hmac
 import urllib.request, urllib.parse
 import base64
-import requests
 import json
-from constant import ALIYUN_DOMAIN, ALIYUN_REGION_LIST, ALIYUN_DISK_TYPE
+from constant import ALIYUN_DOMAIN, ALIYUN_REGION_LIST, ALIYUN_DISK_TYPE, CLOUD_API_PAGE_SIZE, CLOUD_BATCH_SIZE
+from utils.http_session import get_json
 
 from setting import settings
 
@@ -69,6 +69,29 @@ class Aliyun:
 
         return url
 
+    @classmethod
+    def request(cls, params):
+        ''' 签名并请求, 接口返回错误时抛出ValueError '''
+        info = get_json(cls.make_url(params))
+        if info.get('Code'):
+            raise ValueError('{}: {}'.format(info['Code'], info.get('Message', '')))
+        return info
+
+    @classmethod
+    def describe_all(cls, cmd, outer, inner):
+        ''' 按PageNumber翻页获取全部结果, 结果在info[outer][inner]中
+            阿里云签名时参数须为字符串
+        '''
+        resp, page = list(), 1
+        while True:
+            info = get_json(cls.make_url(dict(cmd, PageSize=str(CLOUD_API_PAGE_SIZE), PageNumber=str(page))))
+            items = info[outer].get(inner) or []
+            resp.extend(items)
+
+            if len(items) < CLOUD_API_PAGE_SIZE or len(resp) >= info.get('TotalCount', 0):
+                return resp
+            page += 1
+
     #################################################################################################
     # 生成各种命令所需要的参数
     # data 为instance各项属性，
@@ -89,6 +112,15 @@ class Aliyun:
     def reboot(cls, data):
         return cls._common('RebootInstance', data)
 
+    # 批量操作同一地域的多个实例, 每次最多100个
+    @classmethod
+    def batch(cls, cmd, region_id, instance_ids):
+        actions = {'start': 'StartInstances', 'stop': 'StopInstances', 'reboot': 'RebootInstances'}
+        params = {'Action': actions[cmd], 'RegionId': region_id}
+        for n, instance_id in enumerate(instance_ids, 1):
+            params['InstanceId.{}'.format(n)] = instance_id
+        return params
+
     # 如果获取到空数据，很大原因是改image已被销毁，目前所有image中含有base的都已被阿里销毁
     @classmethod
     def describe_images(cls, data):
@@ -101,7 +133,7 @@ class Aliyun:
             cmd.update({'ImageId': data['ImageId']})
 
         url = cls.make_url(cmd)
-        info = requests.get(url).json()
+        info = get_json(url)
         images = info['Images']['Image']
 
         resp = list()
@@ -121,22 +153,9 @@ class Aliyun:
             resp.append(image)
         return resp
 
-    # 提取disk信息，并返回其数组
-    @classmethod
-    def describe_disks(cls, data):
-        cmd = {
-            'Action': 'DescribeDisks',
-            'RegionId': data['region_id'],
-            'InstanceId': data['InstanceId']
-        }
-        url = cls.make_url(cmd)
-        info = requests.get(url).json()
-        disks = info['Disks']['Disk']
-
+    @staticmethod
+    def _format_disks(disks):
         resp = list()
-        if not len(disks):
-            return resp
-
         for one in disks:
             disk = dict()
             category = one['Category']
@@ -150,6 +169,28 @@ class Aliyun:
             resp.append(disk)
         return resp
 
+    # 提取disk信息，并返回其数组
+    @classmethod
+    def describe_disks(cls, data):
+        cmd = {
+            'Action': 'DescribeDisks',
+            'RegionId': data['region_id'],
+            'InstanceId': data['InstanceId']
+        }
+        url = cls.make_url(cmd)
+        info = get_json(url)
+
+        return cls._format_disks(info['Disks']['Disk'])
+
+    # 一次获取整个地域的disk, 按挂载的实例分组 {InstanceId: [disk, ...]}
+    @classmethod
+    def describe_region_disks(cls, region_id):
+        resp = dict()
+        disks = cls.describe_all({'Action': 'DescribeDisks', 'RegionId': region_id}, 'Disks', 'Disk')
+        for disk in cls._format_disks(disks):
+            resp.setdefault(disk['InstanceId'], []).append(disk)
+        return resp
+
     @classmethod
     def describe_bandwidth(cls, data):
         cmd = {
@@ -160,27 +201,37 @@ class Aliyun:
             'InstanceChargeType': data['InstanceChargeType'],
         }
         url = cls.make_url(cmd)
-        info = requests.get(url).json()
+        info = get_json(url)
         bandwidth = info['Bandwidths']['Bandwidth']
         return bandwidth
 
-    # get all instances
+    # get all instances, regions为空时获取所有地域
     @classmethod
-    def describe_instances(cls):
-        instance_urls = []
+    def describe_instances(cls, regions=None):
         instances = []
 
-        for r in ALIYUN_REGION_LIST:
+        for r in regions or ALIYUN_REGION_LIST:
             cmd = {'Action': 'DescribeInstances', 'RegionId': r}
-            instance_urls.append(cls.make_url(cmd))
 
-        for url in instance_urls:
-            r = requests.get(url).json()
+            for j in cls.describe_all(cmd, 'Instances', 'Instance'):
+                j.update({'region_id': j['RegionId']})
+                instances.append(j)
+        return instances
+
+    # 只获取同一地域的指定实例, 每次最多100个
+    @classmethod
+    def describe_instances_by_id(cls, region_id, instance_ids):
+        instances = []
 
-            if not r['Instances'].get('Instance', ''):
-                continue
+        for n in range(0, len(instance_ids), CLOUD_BATCH_SIZE):
+            cmd = {
+                'Action': 'DescribeInstances',
+                'RegionId': region_id,
+                'InstanceIds': json.dumps(instance_ids[n:n + CLOUD_BATCH_SIZE]),
+                'PageSize': str(CLOUD_BATCH_SIZE)
+            }
 
-            for j in r['Instances']['Instance']:
+            for j in cls.request(cmd)['Instances']['Instance']:
                 j.update({'region_id': j['RegionId']})
                 instances.append(j)
         return instances
@@ -0,0 +1,50 @@
+__author__ = 'Jon'
+
+'''
+进程内的过期缓存
+
+Usage::
+    >>> cache = TTLCache(ttl=600)
+    >>> cache.set(('aliyun', 'cn-hangzhou', 'img-1'), data)
+    >>> cache.get(('aliyun', 'cn-hangzhou', 'img-1'), MISSING)
+    >>> cache.invalidate(key)  # 或cache.invalidate()清空
+'''
+import time
+import threading
+
+MISSING = object()
+
+
+class TTLCache:
+    ''' 每个key写入后ttl秒过期, 线程安全. 值可以为None/空列表, 以MISSING区分未命中
+    '''
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expire_at = item
+            if expire_at <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (ttl or self.ttl))
+
+    def invalidate(self, key=MISSING):
+        with self._lock:
+            if key is MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,60 @@
+__author__ = 'Jon'
+
+'''
+agent上报的容器列表, 保存在redis中
+
+说明
+---------------
+* 主机上报时由ServerService.save_report写入, 容器列表/详情接口直接读取, 不再ssh到主机执行docker ps/inspect
+* CONTAINER_INVENTORY为hash, key为public_ip, 值为json的{'time': 收到上报的时间, 'containers': [...]}
+* 容器为{'id', 'name', 'status', 'created_at', 'inspect'}, inspect为docker inspect的摘要, 字段名与docker inspect一致
+* 超过CONTAINER_INVENTORY_TTL未上报(agent未升级/停止)时视为过期, 返回None, 由调用方改用ssh查询
+
+Usage::
+    >>> save(REDIS, public_ip, params.pop('containers'))
+    >>> containers = load(REDIS, public_ip)
+    >>> if containers is None:
+    ...     pass  # ssh
+    >>> container = find(containers, container_id)
+'''
+import json
+import time
+
+from constant import CONTAINER_INVENTORY, CONTAINER_INVENTORY_TTL
+
+
+def save(redis, public_ip, containers):
+    redis.hset(CONTAINER_INVENTORY, public_ip, json.dumps({'time': time.time(), 'containers': containers}))
+
+
+def load(redis, public_ip):
+    '''
+    :return: [container, ...], 没有上报或已过期时为None
+    '''
+    data = redis.hget(CONTAINER_INVENTORY, public_ip)
+    if not data:
+        return None
+
+    data = json.loads(data)
+    if time.time() - data['time'] > CONTAINER_INVENTORY_TTL:
+        return None
+
+    return data['containers']
+
+
+def find(containers, container_id):
+    ''' 按容器id(可为前缀)或容器名查找, 与docker inspect的参数一致 '''
+    for c in containers:
+        if c['id'].startswith(container_id) or c['name'] == container_id:
+            return c
+    return None
+
+
+def to_row(container):
+    ''' 与LIST_CONTAINERS_CMD的输出格式一致: [id, name, status, created_at] '''
+    return [container['id'], container['name'], container['status'], container['created_at']]
+
+
+def delete(redis, *public_ips):
+    if public_ips:
+        redis.hdel(CONTAINER_INVENTORY, *public_ips)
@@ -4,7 +4,7 @@ import redis
 import pymysql.cursors
 
 from tornado_mysql import pools, cursors
-from DBUtils.PooledDB import PooledDB
+from DBUtils.PersistentDB import PersistentDB
 
 from setting import settings
 
@@ -22,15 +22,15 @@ DB = pools.Pool(
      )
 
 
-pool = PooledDB(pymysql, maxcached=1, maxconnections=2,
-                host=settings['mysql_host'],
-                user=settings['mysql_user'],
-                password=settings['mysql_password'],
-                db=settings['mysql_database'],
-                charset=settings['mysql_charset'],
-                cursorclass=pymysql.cursors.DictCursor,
-                autocommit=True)
-SYNC_DB = pool.connection()
+# pymysql的连接不是线程安全的, 每个线程(IOLoop及websocket的worker)各自一个连接, 使用时SYNC_DB.connection()
+SYNC_DB = PersistentDB(pymysql,
+                       host=settings['mysql_host'],
+                       user=settings['mysql_user'],
+                       password=settings['mysql_password'],
+                       db=settings['mysql_database'],
+                       charset=settings['mysql_charset'],
+                       cursorclass=pymysql.cursors.DictCursor,
+                       autocommit=True)
 
 
 
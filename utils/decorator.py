@@ -49,6 +49,45 @@ def find_ids(handler, args):
     else:
         return [int(v)]
 
+@coroutine
+def _check_owner(handler, service, ids):
+    ''' 资源是否都属于当前的个人/公司, 不合法时raise '''
+    params = handler.get_lord()
+    params['id'] = ids
+    data = yield getattr(handler, service['personal']).select(params)
+
+    if len(data) != len(ids):
+        raise ValueError('请求的资源，并非全部合法!')
+
+@coroutine
+def _check_data(handler, service, cid, ids):
+    ''' 数据权限: 公司员工查授权表, 个人查是否为自己的资源, 不合法时raise '''
+    if cid:
+        yield getattr(handler, service['company']).check_right({'cid': cid, 'uid': handler.current_user['id'], 'ids': ids})
+    else:
+        yield _check_owner(handler, service, ids)
+
+@coroutine
+def check_data_right(handler, service, ids):
+    ''' 在handler中检查数据权限, 用于id不在json或url参数中的接口, 公司管理员只检查资源是否属于该公司
+    :param service: constant.SERVICE中的一项
+    :param ids: list, 需要检查的资源id
+    Usage:
+        yield check_data_right(self, SERVICE['s'], server_ids)
+    '''
+    cid = handler.params.get('cid')
+
+    if cid:
+        try:
+            yield handler.company_employee_service.check_admin(cid, handler.current_user['id'])
+        except AppError:
+            pass
+        else:
+            yield _check_owner(handler, service, ids)
+            return
+
+    yield _check_data(handler, service, cid, ids)
+
 def auth(role):
     ''' 员工认证，管理员认证, 没有cid代表个人
     :param role: enum('staff', 'admin')
@@ -107,15 +146,10 @@ def require(*pids, service=None):
                         yield self.user_permission_service.check_right({'cid': cid, 'uid': self.current_user['id'], 'ids': pids}) # 功能权限
 
                         if ids:
-                            yield getattr(self, service['company']).check_right({'cid': cid, 'uid': self.current_user['id'], 'ids': ids})
+                            yield _check_data(self, service, cid, ids)
                 else:  # 个人
                     if ids:
-                        params = self.get_lord()
-                        params['id'] = ids
-                        data = yield getattr(self, service['personal']).select(params)
-
-                        if len(data) != len(ids):
-                            raise ValueError('请求的资源，并非全部合法!')
+                        yield _check_data(self, service, cid, ids)
 
             except Exception as e:
                 self.error(str(e))
@@ -108,6 +108,10 @@ def json_dumps(data):
     ''' json can dumps None '''
     return json.dumps(data) if data else '{}'
 
+def k8s_manifest(docs):
+    ''' 多个对象的yaml合成一个, 以---分隔, 供kubectl apply -f -使用 '''
+    return '\n---\n'.join(d.strip('\n') for d in docs if d and d.strip()) + '\n'
+
 def gen_md5(fp):
     m = md5()
     m.update(fp)
@@ -0,0 +1,48 @@
+__author__ = 'Jon'
+
+'''
+云接口的HTTP连接池
+
+说明
+---------------
+* 每个接口域名(如ecs.aliyuncs.com)共用一个requests.Session, 连接keep-alive复用, 不必每次请求都重新建立连接/TLS握手
+* Session线程安全地创建, 可以在线程池中并发使用
+* 默认超时为CLOUD_API_TIMEOUT (连接超时, 读取超时)
+
+Usage::
+    >>> from utils.http_session import get_json
+    >>> get_json(url)
+'''
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from constant import HTTP_POOL_SIZE, CLOUD_API_TIMEOUT
+
+_SESSIONS = {}
+_LOCK = threading.Lock()
+
+
+def get_session(url):
+    ''' url所在域名的Session '''
+    host = urlsplit(url).netloc
+
+    session = _SESSIONS.get(host)
+    if session is not None:
+        return session
+
+    with _LOCK:
+        session = _SESSIONS.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _SESSIONS[host] = session
+    return session
+
+
+def get_json(url, timeout=CLOUD_API_TIMEOUT):
+    return get_session(url).get(url, timeout=timeout).json()
@@ -0,0 +1,79 @@
+__author__ = 'Jon'
+
+'''
+待单独刷新的实例队列, 保存在redis中
+
+说明
+---------------
+* 开机/关机/重启后由ServerService写入, crontab/instance.py读取并只刷新这些实例
+* INSTANCE_REFRESH_QUEUE为zset, 成员为json的[provider, region_id, instance_id], score为下次刷新的时间
+* 同一实例重复写入时只保留一个, 截止时间以最后一次写入为准
+* 状态仍未稳定时按INSTANCE_REFRESH_INTERVAL再次刷新, 直到截止时间
+
+Usage::
+    >>> push(REDIS, [(info['provider'], info['region_id'], info['instance_id'])])
+    >>> for provider, region_id, instance_id in pop_due(REDIS, [ALIYUN_NAME]):
+    ...     pass
+    >>> retry(REDIS, items)  # 状态未稳定的
+'''
+import json
+import time
+
+from constant import INSTANCE_REFRESH_QUEUE, INSTANCE_REFRESH_DEADLINE, INSTANCE_REFRESH_DELAY, \
+                     INSTANCE_REFRESH_INTERVAL, INSTANCE_REFRESH_TIMEOUT
+
+
+def _member(item):
+    return json.dumps(list(item))
+
+
+def push(redis, items, delay=INSTANCE_REFRESH_DELAY):
+    '''
+    :param items: [(provider, region_id, instance_id), ...]
+    '''
+    if not items:
+        return
+
+    now = time.time()
+    members = [_member(i) for i in items]
+    pipe = redis.pipeline()
+    pipe.zadd(INSTANCE_REFRESH_QUEUE, *[x for m in members for x in (now + delay, m)])
+    pipe.hmset(INSTANCE_REFRESH_DEADLINE, {m: now + INSTANCE_REFRESH_TIMEOUT for m in members})
+    pipe.execute()
+
+
+def pop_due(redis, providers):
+    ''' 取出已到刷新时间的实例, 只取providers中的云, 其他的留在队列中
+    :return: [(provider, region_id, instance_id), ...]
+    '''
+    members = redis.zrangebyscore(INSTANCE_REFRESH_QUEUE, 0, time.time())
+    items = [tuple(json.loads(m)) for m in members]
+    items = [i for i in items if i[0] in providers]
+    if items:
+        redis.zrem(INSTANCE_REFRESH_QUEUE, *[_member(i) for i in items])
+    return items
+
+
+def retry(redis, items):
+    ''' 未到截止时间的放回队列, 已超时的丢弃 '''
+    if not items:
+        return
+
+    now = time.time()
+    members = [_member(i) for i in items]
+    deadlines = redis.hmget(INSTANCE_REFRESH_DEADLINE, members)
+
+    pending = [m for m, d in zip(members, deadlines) if d and float(d) > now]
+    expired = [m for m, d in zip(members, deadlines) if not (d and float(d) > now)]
+
+    pipe = redis.pipeline()
+    if pending:
+        pipe.zadd(INSTANCE_REFRESH_QUEUE, *[x for m in pending for x in (now + INSTANCE_REFRESH_INTERVAL, m)])
+    if expired:
+        pipe.hdel(INSTANCE_REFRESH_DEADLINE, *expired)
+    pipe.execute()
+
+
+def done(redis, items):
+    if items:
+        redis.hdel(INSTANCE_REFRESH_DEADLINE, *[_member(i) for i in items])
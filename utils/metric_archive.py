@@ -0,0 +1,250 @@
+__author__ = 'Jon'
+
+'''
+监控数据的冷归档, 每台主机每天一个列式存储的segment文件
+
+文件格式(小端)
+---------------
+* header:  magic(4s) version(B) 列数(H) 行数(I) block行数(H) block数(I)
+* 列定义:   名称长度(B) 名称 小数位数(B)
+* block索引: 首个时间戳(q) 行数(I) 文件偏移(I)
+* block:   时间戳列及各数值列, 每列为 长度(I) + zigzag varint流
+           时间戳存二阶差分(delta-of-delta), 数值按小数位数量化为整数后存一阶差分
+
+Usage::
+    >>> write_segment(path, times, {'cpu.percent': [1.5, 2.25]})
+    >>> with Segment(path) as seg:
+    ...     seg.read(start_time, end_time)
+'''
+import os
+import mmap
+import time
+import struct
+import datetime
+from bisect import bisect_right
+
+MAGIC = b'TMA1'
+VERSION = 1
+BLOCK_SIZE = 256
+DECIMALS = 2  # agent上报的浮点数精度
+
+_HEADER = struct.Struct('<4sBHIHI')
+_INDEX = struct.Struct('<qII')
+_LENGTH = struct.Struct('<I')
+
+# 归档的字段, 列名为 表名.字段名
+ARCHIVE_FIELDS = {
+    'cpu': ['percent'],
+    'memory': ['total', 'available', 'free', 'percent'],
+    'disk': ['total', 'free', 'percent', 'utilize'],
+    'net': ['input', 'output']
+}
+ARCHIVE_COLUMNS = ['{}.{}'.format(t, f) for t, fields in ARCHIVE_FIELDS.items() for f in fields]
+
+
+############################################################################################
+# varint
+############################################################################################
+def _put_varint(buf, n):
+    n = n << 1 if n >= 0 else ((-n) << 1) - 1  # zigzag
+    while n > 0x7f:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def _iter_varint(data, start, end):
+    n = shift = 0
+    for i in range(start, end):
+        b = data[i]
+        n |= (b & 0x7f) << shift
+        if b & 0x80:
+            shift += 7
+            continue
+        yield (n >> 1) if not n & 1 else -((n + 1) >> 1)
+        n = shift = 0
+
+
+############################################################################################
+# 写
+############################################################################################
+def _decimals(values):
+    return 0 if all(float(v).is_integer() for v in values) else DECIMALS
+
+
+def _encode_times(times):
+    buf, prev, prev_delta = bytearray(), times[0], 0
+    for t in times[1:]:
+        delta = t - prev
+        _put_varint(buf, delta - prev_delta)
+        prev, prev_delta = t, delta
+    return buf
+
+
+def _encode_values(values, decimals):
+    buf, prev, scale = bytearray(), 0, 10 ** decimals
+    for v in values:
+        q = int(round(float(v) * scale))
+        _put_varint(buf, q - prev)
+        prev = q
+    return buf
+
+
+def write_segment(path, times, columns):
+    '''
+    :param path:    segment文件路径, 先写临时文件再rename, 保证读到的都是完整文件
+    :param times:   按时间升序的时间戳列表
+    :param columns: {'cpu.percent': [...], ...}, 每列长度与times一致
+    '''
+    names = list(columns.keys())
+    decimals = [_decimals(columns[n]) for n in names]
+    nrow = len(times)
+    starts = list(range(0, nrow, BLOCK_SIZE))
+
+    head = bytearray(_HEADER.pack(MAGIC, VERSION, len(names), nrow, BLOCK_SIZE, len(starts)))
+    for name, d in zip(names, decimals):
+        encoded = name.encode('utf-8')
+        head += struct.pack('<B', len(encoded)) + encoded + struct.pack('<B', d)
+
+    offset = len(head) + _INDEX.size * len(starts)
+    index, blocks = bytearray(), bytearray()
+    for s in starts:
+        e = min(s + BLOCK_SIZE, nrow)
+        block = bytearray()
+        for stream in [_encode_times(times[s:e])] + [_encode_values(columns[n][s:e], d) for n, d in zip(names, decimals)]:
+            block += _LENGTH.pack(len(stream)) + stream
+        index += _INDEX.pack(times[s], e - s, offset + len(blocks))
+        blocks += block
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(head + index + blocks)
+    os.replace(tmp, path)
+
+
+############################################################################################
+# 读
+############################################################################################
+class Segment:
+    ''' 通过mmap读取segment, 按block索引只解码所需时间段 '''
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, _, ncol, self.nrow, _, nblock = _HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('invalid segment: %s' % path)
+
+        pos, self.columns, self.decimals = _HEADER.size, [], []
+        for _ in range(ncol):
+            length = self._data[pos]
+            self.columns.append(self._data[pos+1:pos+1+length].decode('utf-8'))
+            self.decimals.append(self._data[pos+1+length])
+            pos += length + 2
+
+        self.blocks = [_INDEX.unpack_from(self._data, pos + i * _INDEX.size) for i in range(nblock)]
+        self._first_times = [b[0] for b in self.blocks]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if getattr(self, '_data', None) is not None:
+            self._data.close()
+            self._data = None
+        self._file.close()
+
+    def _read_block(self, block):
+        first_time, count, pos = block
+        streams = []
+        for _ in range(len(self.columns) + 1):
+            length, = _LENGTH.unpack_from(self._data, pos)
+            streams.append((pos + _LENGTH.size, pos + _LENGTH.size + length))
+            pos += _LENGTH.size + length
+
+        times, t, delta = [first_time], first_time, 0
+        for dod in _iter_varint(self._data, *streams[0]):
+            delta += dod
+            t += delta
+            times.append(t)
+
+        values = []
+        for (s, e), d in zip(streams[1:], self.decimals):
+            col, prev, scale = [], 0, 10 ** d
+            for diff in _iter_varint(self._data, s, e):
+                prev += diff
+                col.append(prev / scale if d else prev)
+            values.append(col)
+
+        return times, values
+
+    def read(self, start_time, end_time):
+        ''' 返回[start_time, end_time)内的数据, (times, {'cpu.percent': [...], ...}) '''
+        times, columns = [], {c: [] for c in self.columns}
+        i = max(bisect_right(self._first_times, start_time) - 1, 0)
+
+        for block in self.blocks[i:]:
+            if block[0] >= end_time:
+                break
+            block_times, values = self._read_block(block)
+            for row, t in enumerate(block_times):
+                if start_time <= t < end_time:
+                    times.append(t)
+                    for c, col in zip(self.columns, values):
+                        columns[c].append(col[row])
+
+        return times, columns
+
+
+############################################################################################
+# 按主机/日期组织
+############################################################################################
+def segment_path(root, public_ip, day):
+    '''
+    :param day: datetime.date
+    :return: {root}/{public_ip}/{YYYYMMDD}.seg
+    '''
+    return os.path.join(root, public_ip, day.strftime('%Y%m%d') + '.seg')
+
+
+def read_records(root, public_ip, start_time, end_time):
+    ''' 读取[start_time, end_time)的归档数据, 格式与cpu/memory/disk/net表的content一致
+    :return: [{'created_time': int, 'cpu': {...}, 'memory': {...}, 'disk': {...}, 'net': {...}}, ...]
+    '''
+    records = []
+    if start_time >= end_time:
+        return records
+
+    day = datetime.date.fromtimestamp(start_time)
+    last = datetime.date.fromtimestamp(end_time - 1)
+
+    while day <= last:
+        path = segment_path(root, public_ip, day)
+        day += datetime.timedelta(days=1)
+        if not os.path.exists(path):
+            continue
+
+        with Segment(path) as seg:
+            times, columns = seg.read(start_time, end_time)
+
+        for row, t in enumerate(times):
+            record = {'created_time': t}
+            for c, values in columns.items():
+                table, field = c.split('.', 1)
+                record.setdefault(table, {})[field] = values[row]
+            records.append(record)
+
+    return records
+
+
+def day_range(day):
+    ''' 某一天的[零点, 次日零点) 时间戳 '''
+    start = int(time.mktime(day.timetuple()))
+    end = int(time.mktime((day + datetime.timedelta(days=1)).timetuple()))
+    return start, end
@@ -8,7 +8,8 @@ import hmac
 import urllib.parse
 import binascii
 import requests
-from constant import QCLOUD_DOMAIN, QCLOUD_REGION_LIST, QCLOUD_IMAGE_DOMAIN
+from constant import QCLOUD_DOMAIN, QCLOUD_REGION_LIST, QCLOUD_IMAGE_DOMAIN, CLOUD_API_PAGE_SIZE, CLOUD_BATCH_SIZE
+from utils.http_session import get_json
 
 from setting import settings
 
@@ -61,6 +62,32 @@ class Qcloud:
         url = domain + urllib.parse.urlencode(payload)
         return url
 
+    @classmethod
+    def request(cls, params, domain=None):
+        ''' 签名并请求, 接口返回错误时抛出ValueError '''
+        info = get_json(cls.make_url(params, domain))['Response']
+        if info.get('Error'):
+            raise ValueError('{}: {}'.format(info['Error'].get('Code', ''), info['Error'].get('Message', '')))
+        return info
+
+    @classmethod
+    def describe_all(cls, cmd, field, domain=None):
+        ''' 按Offset/Limit翻页获取全部结果, 结果在Response[field]中
+        '''
+        resp = list()
+        while True:
+            info = get_json(cls.make_url(dict(cmd, Offset=len(resp), Limit=CLOUD_API_PAGE_SIZE), domain))['Response']
+
+            # 接口出错时不能当作没有数据, 否则同步时会删除该地域所有实例
+            if info.get('Error'):
+                raise ValueError('{}: {}'.format(cmd.get('Region', ''), info['Error'].get('Message', '')))
+
+            items = info.get(field) or []
+            resp.extend(items)
+
+            if len(items) < CLOUD_API_PAGE_SIZE or len(resp) >= info.get('TotalCount', 0):
+                return resp
+
     #################################################################################################
     # 生成各种命令所需要的参数
     #################################################################################################
@@ -80,35 +107,42 @@ class Qcloud:
     def reboot(cls, data):
         return cls._common('RestartInstances', data)
 
+    # 批量操作同一地域的多个实例, 每次最多100个
+    @classmethod
+    def batch(cls, cmd, region_id, instance_ids):
+        actions = {'start': 'StartInstances', 'stop': 'StopInstances', 'reboot': 'RestartInstances'}
+        params = {'Action': actions[cmd], 'Region': region_id, 'Version': '2017-03-12'}
+        for n, instance_id in enumerate(instance_ids):
+            params['InstanceIds.{}'.format(n)] = instance_id
+        return params
+
+    # regions为空时获取所有地域
     @classmethod
-    def describe_instances(cls):
+    def describe_instances(cls, regions=None):
         qcloud_instances = []
 
-        for r in QCLOUD_REGION_LIST:
-            cmd = {'Action': 'DescribeInstances', 'Limit': 100, 'Region': r, 'Version': '2017-03-12'}
-            instance_url = cls.make_url(cmd)
+        for r in regions or QCLOUD_REGION_LIST:
+            cmd = {'Action': 'DescribeInstances', 'Region': r, 'Version': '2017-03-12'}
 
-            result = requests.get(instance_url).json()
-
-            if not result['Response'].get('InstanceSet', ''):
-                continue
-
-            for one in result['Response']['InstanceSet']:
+            for one in cls.describe_all(cmd, 'InstanceSet'):
                     one.update({'region_id': r})
                     qcloud_instances.append(one)
         return qcloud_instances
 
+    # 只获取同一地域的指定实例, 每次最多100个
     @classmethod
-    def instance_status(cls, data):
-        cmd = {
-            'Action': 'DescribeInstancesStatus',
-            'InstanceIds.0': data['InstanceId'],
-            'Region': data['region_id'],
-            'Version': '2017-03-12'
-        }
-        status_url = cls.make_url(cmd)
-        status_info = requests.get(status_url).json()
-        return status_info['Response']['InstanceStatusSet'][0]['InstanceState']
+    def describe_instances_by_id(cls, region_id, instance_ids):
+        qcloud_instances = []
+
+        for n in range(0, len(instance_ids), CLOUD_BATCH_SIZE):
+            cmd = {'Action': 'DescribeInstances', 'Region': region_id, 'Version': '2017-03-12', 'Limit': CLOUD_BATCH_SIZE}
+            for i, instance_id in enumerate(instance_ids[n:n + CLOUD_BATCH_SIZE]):
+                cmd['InstanceIds.{}'.format(i)] = instance_id
+
+            for one in cls.request(cmd).get('InstanceSet') or []:
+                one.update({'region_id': region_id})
+                qcloud_instances.append(one)
+        return qcloud_instances
 
     @classmethod
     def describe_images(cls, data):
@@ -119,7 +153,7 @@ class Qcloud:
             'Region': data['region_id']
         }
         image_url = cls.make_url(params=cmd, domain=QCLOUD_IMAGE_DOMAIN)
-        image_info = requests.get(image_url).json()
+        image_info = get_json(image_url)
         images = image_info['Response']['ImageSet']
 
         resp = list()
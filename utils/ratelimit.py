@@ -0,0 +1,40 @@
+__author__ = 'Jon'
+
+'''
+调用频率限制
+
+Usage::
+    >>> limiter = RateLimiter(rate=20)
+    >>> limiter.acquire()  # 超过每秒20次时阻塞等待
+'''
+import time
+import threading
+
+
+class RateLimiter:
+    ''' 令牌桶, 线程安全
+    :param rate:  每秒产生的令牌数
+    :param burst: 桶的容量, 默认与rate相同
+    '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        ''' 取一个令牌, 返回等待的秒数 '''
+        waited = 0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
@@ -0,0 +1,155 @@
+__author__ = 'Jon'
+
+'''
+最近一段时间的监控数据, 保存在进程内存中
+
+说明
+---------------
+* 每台主机/每个容器一个固定大小的环形缓冲, 由ServerService.save_report写入
+* 每个字段一个array, 不保存dict/json, 单台主机约 字段数 * 8字节 * RECENT_METRIC_SIZE
+* 主机数/容器数超过上限时, 淘汰最久没有上报的
+* 缓冲只有在覆盖了整个查询时间段时才使用, 进程刚启动时仍查MySQL
+
+Usage::
+    >>> from utils.recent_metric import RECENT_METRICS
+    >>> RECENT_METRICS.add_host(public_ip, created_time, report)
+    >>> if RECENT_METRICS.covers_host(public_ip, start_time):
+    ...     RECENT_METRICS.host_records(public_ip, start_time, end_time)
+'''
+from array import array
+from collections import OrderedDict
+
+from constant import RECENT_METRIC_SIZE, RECENT_METRIC_MAX_HOSTS, RECENT_METRIC_MAX_CONTAINERS
+
+# (表名, 字段, array类型) 'd'浮点, 'q'整数
+HOST_COLUMNS = [
+    ('cpu', 'percent', 'd'),
+    ('memory', 'total', 'q'),
+    ('memory', 'available', 'q'),
+    ('memory', 'free', 'q'),
+    ('memory', 'percent', 'd'),
+    ('disk', 'total', 'q'),
+    ('disk', 'free', 'q'),
+    ('disk', 'percent', 'd'),
+    ('disk', 'utilize', 'd'),
+    ('net', 'input', 'q'),
+    ('net', 'output', 'q'),
+]
+
+# docker_stat表content中的数值字段
+CONTAINER_COLUMNS = [
+    ('cpu', 'd'),
+    ('mem_percent', 'd'),
+    ('mem_limit', 'q'),
+    ('mem_usage', 'q'),
+    ('net_input', 'q'),
+    ('net_output', 'q'),
+    ('block_input', 'q'),
+    ('block_output', 'q'),
+]
+
+
+class RingBuffer:
+    ''' 定长环形缓冲, 时间戳及每个字段各一个array '''
+    __slots__ = ('size', 'head', 'count', 'times', 'values')
+
+    def __init__(self, typecodes, size=RECENT_METRIC_SIZE):
+        self.size = size
+        self.head = 0
+        self.count = 0
+        self.times = array('q', [0]) * size
+        self.values = [array(t, [0]) * size for t in typecodes]
+
+    def newest(self):
+        return self.times[(self.head - 1) % self.size] if self.count else None
+
+    def oldest(self):
+        return self.times[(self.head - self.count) % self.size] if self.count else None
+
+    def append(self, created_time, row):
+        # 只接受递增的时间, 保证缓冲内有序
+        if self.count and created_time <= self.newest():
+            return
+
+        i = self.head
+        self.times[i] = created_time
+        for col, v in zip(self.values, row):
+            col[i] = v
+
+        self.head = (i + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def covers(self, start_time):
+        return bool(self.count) and self.oldest() <= start_time
+
+    def range(self, start_time, end_time):
+        ''' 按时间升序返回[start_time, end_time)内的 (created_time, [v1, v2, ...]) '''
+        data = []
+        for n in range(self.count):
+            i = (self.head - self.count + n) % self.size
+            t = self.times[i]
+            if t >= end_time:
+                break
+            if t >= start_time:
+                data.append((t, [col[i] for col in self.values]))
+        return data
+
+
+class RecentMetrics:
+    def __init__(self):
+        self._hosts = OrderedDict()
+        self._containers = OrderedDict()
+
+    @staticmethod
+    def _ring(rings, key, typecodes, limit):
+        ring = rings.get(key)
+        if ring is None:
+            ring = rings[key] = RingBuffer(typecodes)
+            if len(rings) > limit:
+                rings.popitem(last=False)
+        else:
+            rings.move_to_end(key)
+        return ring
+
+    @staticmethod
+    def _value(content, field, typecode):
+        v = content.get(field) or 0
+        return int(v) if typecode == 'q' else float(v)
+
+    def add_host(self, public_ip, created_time, report):
+        '''
+        :param report: 上报信息, 包含cpu/memory/disk/net
+        '''
+        ring = self._ring(self._hosts, public_ip, [t for _, _, t in HOST_COLUMNS], RECENT_METRIC_MAX_HOSTS)
+        ring.append(int(created_time), [self._value(report.get(table) or {}, f, t) for table, f, t in HOST_COLUMNS])
+
+    def add_container(self, public_ip, container_name, created_time, content):
+        ring = self._ring(self._containers, (public_ip, container_name), [t for _, t in CONTAINER_COLUMNS],
+                          RECENT_METRIC_MAX_CONTAINERS)
+        ring.append(int(created_time), [self._value(content, f, t) for f, t in CONTAINER_COLUMNS])
+
+    def covers_host(self, public_ip, start_time):
+        ring = self._hosts.get(public_ip)
+        return ring is not None and ring.covers(start_time)
+
+    def covers_container(self, public_ip, container_name, start_time):
+        ring = self._containers.get((public_ip, container_name))
+        return ring is not None and ring.covers(start_time)
+
+    def host_records(self, public_ip, start_time, end_time):
+        ''' :return: [{'created_time': int, 'cpu': {...}, 'memory': {...}, 'disk': {...}, 'net': {...}}, ...] '''
+        records = []
+        for t, row in self._hosts[public_ip].range(start_time, end_time):
+            record = {'created_time': t}
+            for (table, f, _), v in zip(HOST_COLUMNS, row):
+                record.setdefault(table, {})[f] = v
+            records.append(record)
+        return records
+
+    def container_records(self, public_ip, container_name, start_time, end_time):
+        ''' :return: [(created_time, content), ...], content与docker_stat表的content字段一致 '''
+        ring = self._containers[(public_ip, container_name)]
+        return [(t, {f: v for (f, _), v in zip(CONTAINER_COLUMNS, row)}) for t, row in ring.range(start_time, end_time)]
+
+
+RECENT_METRICS = RecentMetrics()
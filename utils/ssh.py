@@ -1,46 +1,223 @@
 __author__ = 'Jon'
 
+'''
+ssh远程执行命令, 连接保存在进程内的连接池中
+
+说明
+---------------
+* 以(主机, 端口, 用户名, 密码的sha1)为key, 每个key一个已认证的连接(transport), 每条命令在连接上打开一个新的channel
+* 每个连接同时打开的channel数不超过SSH_MAX_SESSIONS_PER_HOST, 超过时等待
+* 空闲超过SSH_POOL_CHECK_INTERVAL的连接使用前检查一次, 已断开则重连; 空闲超过SSH_POOL_IDLE_TIMEOUT的关闭
+* 打开channel失败时(连接已被远端关闭)丢弃该连接, 重连后再试一次
+* 传入stdin时不分配pty, 数据写入channel后关闭写端, 如kubectl apply -f -
+'''
+import time
+import socket
 import select
+import hashlib
+import threading
 import paramiko
+from contextlib import contextmanager
+from collections import deque
 
 from utils.log import LOG
-from constant import SSH_CONNECT_TIMEOUT
+from constant import SSH_CONNECT_TIMEOUT, SSH_MAX_SESSIONS_PER_HOST, SSH_POOL_IDLE_TIMEOUT, SSH_POOL_CHECK_INTERVAL, \
+                     SSH_OUTPUT_MAX_LINES
 
 
 class SSHError(Exception):
     pass
 
 
+_log_init = set()
+
+
+def _log_to_file(logpath):
+    ''' paramiko的日志每个文件只需设置一次, 重复设置会重复添加handler '''
+    if logpath not in _log_init:
+        _log_init.add(logpath)
+        paramiko.util.log_to_file(logpath)
+
+
+class _Connection:
+    ''' 池中的一个已认证的连接
+        busy在连接池的锁下修改, 与evict_idle/stats的检查互斥
+    '''
+
+    def __init__(self, key, client, lock):
+        self.key = key
+        self.client = client
+        self.sessions = threading.BoundedSemaphore(SSH_MAX_SESSIONS_PER_HOST)
+        self.busy = 0
+        self._lock = lock
+        self.last_used = time.time()
+
+    def healthy(self):
+        transport = self.client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+
+        if time.time() - self.last_used > SSH_POOL_CHECK_INTERVAL:
+            try:
+                transport.send_ignore()
+            except Exception:
+                return False
+        return True
+
+    @contextmanager
+    def session(self):
+        with self.sessions:
+            with self._lock:
+                self.busy += 1
+            try:
+                yield self.client
+            finally:
+                with self._lock:
+                    self.busy -= 1
+                    self.last_used = time.time()
+
+    def close(self):
+        self.client.close()
+
+
+class SSHPool:
+    '''
+    Usage::
+            >>> conn = SSH_POOL.get(hostname, port, username, passwd)
+            >>> with conn.session() as client:
+            ...     client.exec_command('cmd')
+            >>> SSH_POOL.discard(conn)  # 连接已失效时
+    '''
+
+    def __init__(self):
+        self._conns = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._last_evict = time.time()
+
+    @staticmethod
+    def _key(hostname, port, username, passwd):
+        return hostname, port, username, hashlib.sha1((passwd or '').encode('utf-8')).hexdigest()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _connect(self, key, hostname, port, username, passwd):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+        try:
+            client.connect(hostname=hostname, port=port, username=username, password=passwd,
+                           timeout=SSH_CONNECT_TIMEOUT, allow_agent=False, look_for_keys=False)
+        except Exception as e:
+            client.close()
+            raise e
+        return _Connection(key, client, self._lock)
+
+    def get(self, hostname, port, username, passwd):
+        self.evict_idle()
+
+        key = self._key(hostname, port, username, passwd)
+
+        # 同一主机的连接只建立一次, 不同主机之间互不等待
+        with self._key_lock(key):
+            conn = self._conns.get(key)
+            if conn is not None and not conn.healthy():
+                self.discard(conn)
+                conn = None
+
+            if conn is None:
+                conn = self._connect(key, hostname, port, username, passwd)
+                self._conns[key] = conn
+            return conn
+
+    def discard(self, conn):
+        with self._lock:
+            if self._conns.get(conn.key) is conn:
+                del self._conns[conn.key]
+        conn.close()
+
+    def evict_idle(self):
+        now = time.time()
+        if now - self._last_evict < SSH_POOL_CHECK_INTERVAL:
+            return
+
+        with self._lock:
+            self._last_evict = now
+            idle = [c for c in self._conns.values() if not c.busy and now - c.last_used > SSH_POOL_IDLE_TIMEOUT]
+            for conn in idle:
+                del self._conns[conn.key]
+
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {'connections': len(self._conns), 'busy_sessions': sum(c.busy for c in self._conns.values())}
+
+
+SSH_POOL = SSHPool()
+
+
 class SSH:
     '''
     Usage::
             >>> ssh = SSH(hostname=hostname, username=username, passwd=passwd)
             >>> ssh.exec('cmd')
-            >>> ssh.close()
+            >>> ssh.exec_rt('kubectl apply -f -', out_func, stdin=manifest)
+            >>> ssh.close()  # 连接归还连接池, 不会断开
     '''
 
     def __init__(self, hostname=None, port=22, username=None, passwd=None, logpath='logs/sysdeploy.log'):
-        paramiko.util.log_to_file(logpath)
+        _log_to_file(logpath)
 
-        self._client = paramiko.SSHClient()
-        self._client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self._args = (hostname, port, username, passwd)
+        self._conn = SSH_POOL.get(*self._args)
 
-        try:
-            self._client.connect(hostname=hostname, port=port, username=username, password=passwd,
-                                 timeout=SSH_CONNECT_TIMEOUT)
-        except Exception as e:
-            self.close()
-            raise e
+    @contextmanager
+    def _open(self, cmd, stdin=None):
+        ''' 在池中的连接上打开一个channel执行cmd, 打开失败时重连一次
+        :param stdin: str/bytes, 写入命令的标准输入后关闭写端; 此时不分配pty, 否则远端读不到EOF
+        '''
+        for retry in (False, True):
+            conn = self._conn
+            with conn.session() as client:
+                try:
+                    channel_in, stdout, stderr = client.exec_command(cmd, get_pty=stdin is None)
+                except (paramiko.SSHException, EOFError, socket.error):
+                    if retry:
+                        raise
+                    SSH_POOL.discard(conn)
+                    self._conn = SSH_POOL.get(*self._args)
+                    continue
+
+                if stdin is not None:
+                    channel_in.write(stdin)
+                    channel_in.flush()
+                    channel_in.channel.shutdown_write()
+
+                try:
+                    yield stdout, stderr
+                finally:
+                    stdout.channel.close()
+                return
 
     def _log(self, data, msg):
         LOG.info('SSH {msg}:{rs}{data}'.format(msg=msg, rs='\n', data=''.join(data)))
 
-    def exec(self, cmd):
+    def exec(self, cmd, timeout=None, stdin=None):
+        ''' :param timeout: 秒, 超时则关闭channel并抛出SSHError
+            :param stdin:   写入命令标准输入的内容
+        '''
         LOG.info('SSH CMD: %s' % cmd)
 
-        stdin, stdout, stderr = self._client.exec_command(cmd, get_pty=True)
-
-        out, err = stdout.readlines(), stderr.readlines()
+        with self._open(cmd, stdin) as (stdout, stderr):
+            stdout.channel.settimeout(timeout)
+            try:
+                out, err = stdout.readlines(), stderr.readlines()
+            except socket.timeout:
+                raise SSHError('执行超时({}s): {}'.format(timeout, cmd))
 
         if err:
             self._log(err, 'ERR')
@@ -49,53 +226,68 @@ class SSH:
 
         return out, err
 
-    def exec_rt(self, cmd, out_func=None):
+    def exec_rt(self, cmd, out_func=None, timeout=None, stdin=None):
         ''' 实时显示远端信息
             Usage::
                 >>> out, err = ssh.exec_rt('top -b -n 5', self.write_message) # tornado websocket
+            :param timeout: 秒, 超时则关闭channel, 已有的输出及超时信息照常返回
+            :param stdin:   写入命令标准输入的内容
+            :return: (out, err), 各自只保留最后SSH_OUTPUT_MAX_LINES行, 完整的输出已实时交给out_func
         '''
         LOG.info('SSH RT_CMD: %s' % cmd)
 
-        stdin, stdout, stderr = self._client.exec_command(cmd, get_pty=True)
-        channel = stdout.channel
+        deadline = time.time() + timeout if timeout else None
         pending = err_pending = None
 
         if not out_func: out_func = print
 
-        out, err = [], []
-
-        while not channel.closed or channel.recv_ready() or channel.recv_stderr_ready():
-            readq, _, _ = select.select([channel], [], [], 1)
-            for c in readq:
-                if c.recv_ready():
-                    chunk = c.recv(len(c.in_buffer))
-                    if pending is not None:
-                        chunk = pending + chunk
-                    lines = chunk.splitlines()
-                    if lines and lines[-1] and lines[-1][-1] == chunk[-1]:
-                        pending = lines.pop()
-                    else:
-                        pending = None
-
-                    for line in lines:
-                        out_func(line)
-                        line = line.decode('utf-8')
-                        out.append(line)
-
-                if c.recv_stderr_ready():
-                    chunk = c.recv_stderr(len(c.in_stderr_buffer))
-                    if err_pending is not None:
-                        chunk = err_pending + chunk
-                    lines = chunk.splitlines()
-                    if lines and lines[-1] and lines[-1][-1] == chunk[-1]:
-                        err_pending = lines.pop()
-                    else:
-                        err_pending = None
-
-                    for line in lines:
-                        out_func(line)
-                        line = line.decode('utf-8')
-                        err.append(line)
+        out, err = deque(maxlen=SSH_OUTPUT_MAX_LINES), deque(maxlen=SSH_OUTPUT_MAX_LINES)
+        out_count = err_count = 0
+
+        with self._open(cmd, stdin) as (stdout, stderr):
+            channel = stdout.channel
+
+            while not channel.closed or channel.recv_ready() or channel.recv_stderr_ready():
+                if deadline and time.time() > deadline:
+                    err.append('执行超时({}s): {}'.format(timeout, cmd))
+                    err_count += 1
+                    break
+
+                readq, _, _ = select.select([channel], [], [], 1)
+                for c in readq:
+                    if c.recv_ready():
+                        chunk = c.recv(len(c.in_buffer))
+                        if pending is not None:
+                            chunk = pending + chunk
+                        lines = chunk.splitlines()
+                        if lines and lines[-1] and lines[-1][-1] == chunk[-1]:
+                            pending = lines.pop()
+                        else:
+                            pending = None
+
+                        for line in lines:
+                            out_func(line)
+                            line = line.decode('utf-8')
+                            out.append(line)
+                        out_count += len(lines)
+
+                    if c.recv_stderr_ready():
+                        chunk = c.recv_stderr(len(c.in_stderr_buffer))
+                        if err_pending is not None:
+                            chunk = err_pending + chunk
+                        lines = chunk.splitlines()
+                        if lines and lines[-1] and lines[-1][-1] == chunk[-1]:
+                            err_pending = lines.pop()
+                        else:
+                            err_pending = None
+
+                        for line in lines:
+                            out_func(line)
+                            line = line.decode('utf-8')
+                            err.append(line)
+                        err_count += len(lines)
+
+        out, err = self._tail(out, out_count), self._tail(err, err_count)
 
         if err == ['[', ']']: err = []
 
@@ -106,5 +298,13 @@ class SSH:
 
         return out, err
 
+    @staticmethod
+    def _tail(lines, count):
+        lines = list(lines)
+        if count > len(lines):
+            lines.insert(0, '...(省略前{}行)'.format(count - len(lines)))
+        return lines
+
     def close(self):
-        self._client.close()
\ No newline at end of file
+        ''' 连接由连接池管理, 这里不断开 '''
+        self._conn = None
@@ -0,0 +1,122 @@
+__author__ = 'Jon'
+
+'''
+ssh命令的调度, 与BaseService.executor分开, 慢的或连不上的主机不影响其他线程池的使用者
+
+说明
+---------------
+* 独立的线程池, 大小为SSH_POOL_COUNT
+* 每台主机同时执行的任务数不超过SSH_MAX_CONCURRENCY_PER_HOST, 超过的在该主机的队列中等待, 不占用线程
+* 排队中的任务可以取消(future.cancel()), 执行中的任务由SSH的timeout结束
+* 记录每个任务的排队时间及执行时间, 写入LOG.stats, 汇总可通过stats()查看
+
+Usage::
+    >>> from utils.ssh_executor import SSH_EXECUTOR
+    >>> future = SSH_EXECUTOR.submit(public_ip, func, *args, **kwargs)  # concurrent.futures.Future, 可在coroutine中yield
+    >>> SSH_EXECUTOR.stats()
+'''
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from utils.log import LOG
+from constant import SSH_POOL_COUNT, SSH_MAX_CONCURRENCY_PER_HOST
+
+
+class _Task:
+    __slots__ = ('host', 'fn', 'args', 'kwargs', 'future', 'queued_at')
+
+    def __init__(self, host, fn, args, kwargs):
+        self.host = host
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.queued_at = time.time()
+
+
+class SSHExecutor:
+    def __init__(self, max_workers=SSH_POOL_COUNT, per_host=SSH_MAX_CONCURRENCY_PER_HOST):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._per_host = per_host
+        self._queues = {}   # {host: deque([task, ...])}, 等待该主机空出位置的任务
+        self._running = {}  # {host: 正在执行的任务数}
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0,
+                       'queue_time': 0, 'run_time': 0, 'max_queue_time': 0, 'max_run_time': 0}
+
+    def submit(self, host, fn, *args, **kwargs):
+        task = _Task(host, fn, args, kwargs)
+
+        with self._lock:
+            self._stats['submitted'] += 1
+            if self._running.get(host, 0) < self._per_host:
+                self._running[host] = self._running.get(host, 0) + 1
+            else:
+                self._queues.setdefault(host, deque()).append(task)
+                return task.future
+
+        self._start(task)
+        return task.future
+
+    def _start(self, task):
+        self._pool.submit(self._run, task)
+
+    def _run(self, task):
+        start = time.time()
+        try:
+            # 排队时已取消的任务不执行
+            if task.future.set_running_or_notify_cancel():
+                try:
+                    result = task.fn(*task.args, **task.kwargs)
+                except BaseException as e:
+                    task.future.set_exception(e)
+                else:
+                    task.future.set_result(result)
+        finally:
+            self._done(task, start)
+
+    def _done(self, task, start):
+        end = time.time()
+        queue_time, run_time = start - task.queued_at, end - start
+
+        with self._lock:
+            if task.future.cancelled():
+                self._stats['cancelled'] += 1
+            else:
+                self._stats['failed' if task.future.exception() else 'completed'] += 1
+                self._stats['queue_time'] += queue_time
+                self._stats['run_time'] += run_time
+                self._stats['max_queue_time'] = max(self._stats['max_queue_time'], queue_time)
+                self._stats['max_run_time'] = max(self._stats['max_run_time'], run_time)
+
+            # 该主机空出的位置交给队列中的下一个任务
+            queue = self._queues.get(task.host)
+            following = queue.popleft() if queue else None
+            if queue is not None and not queue:
+                del self._queues[task.host]
+            if following is None:
+                self._running[task.host] -= 1
+                if not self._running[task.host]:
+                    del self._running[task.host]
+
+        if following is not None:
+            self._start(following)
+
+        if not task.future.cancelled():
+            LOG.stats('SSH host={host} queue={queue:.3f}s run={run:.3f}s'.format(host=task.host, queue=queue_time,
+                                                                                run=run_time))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'running': sum(self._running.values()),
+                'queued': sum(len(q) for q in self._queues.values()),
+                'hosts': len(self._running),
+            })
+        return stats
+
+
+SSH_EXECUTOR = SSHExecutor()
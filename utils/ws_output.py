@@ -0,0 +1,94 @@
+__author__ = 'Jon'
+
+'''
+websocket的输出合并
+
+说明
+---------------
+* worker线程逐行写入, IOLoop线程按时间(WS_OUTPUT_FLUSH_INTERVAL)或大小(WS_OUTPUT_FLUSH_SIZE)合并成一帧发送
+* 上一帧还没有写完(客户端较慢)时不再发送, 期间的输出继续合并, 超过WS_OUTPUT_MAX_BUFFER时丢弃最早的行
+* flush(force=True)不等待上一帧, 用于发送结果等控制消息之前保证顺序
+
+Usage::
+    >>> output = OutputBuffer(IOLoop.current(), self.write_message)
+    >>> output.append(line)  # 任意线程
+    >>> output.flush(force=True)  # IOLoop线程
+'''
+import threading
+from collections import deque
+
+from constant import WS_OUTPUT_FLUSH_INTERVAL, WS_OUTPUT_FLUSH_SIZE, WS_OUTPUT_MAX_BUFFER
+
+
+class OutputBuffer:
+    def __init__(self, loop, write):
+        '''
+        :param loop:  IOLoop
+        :param write: 在IOLoop线程中调用, 返回Future(如WebSocketHandler.write_message)或None
+        '''
+        self.loop = loop
+        self.write = write
+
+        self._lines = deque()
+        self._size = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._notified = False  # 已通知IOLoop线程, 在下一次flush之前不再通知
+        self._urgent = False    # 已达到WS_OUTPUT_FLUSH_SIZE, 已通知立即发送
+
+        # 以下只在IOLoop线程中使用
+        self._timer = None
+        self._writing = None
+
+    def append(self, line):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+
+        with self._lock:
+            self._lines.append(line)
+            self._size += len(line)
+            while self._size > WS_OUTPUT_MAX_BUFFER and len(self._lines) > 1:
+                self._size -= len(self._lines.popleft())
+                self._dropped += 1
+
+            urgent = self._size >= WS_OUTPUT_FLUSH_SIZE and not self._urgent
+            notify = urgent or not self._notified
+            self._notified = True
+            self._urgent = self._urgent or urgent
+
+        if notify:
+            self.loop.add_callback(self._on_append, urgent)
+
+    def _on_append(self, urgent):
+        if urgent:
+            self.flush()
+        else:
+            self._schedule()
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = self.loop.call_later(WS_OUTPUT_FLUSH_INTERVAL, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self.flush()
+
+    def flush(self, force=False):
+        if self._timer is not None:
+            self.loop.remove_timeout(self._timer)
+            self._timer = None
+
+        if not force and self._writing is not None and not self._writing.done():
+            self._schedule()
+            return
+
+        with self._lock:
+            lines, dropped = list(self._lines), self._dropped
+            self._lines.clear()
+            self._size = self._dropped = 0
+            self._notified = self._urgent = False
+
+        if dropped:
+            lines.insert(0, '...(输出过快, 省略{}行)'.format(dropped))
+        if lines:
+            self._writing = self.write('\n'.join(lines))
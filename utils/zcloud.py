@@ -25,11 +25,16 @@ class Zcloud:
 
         r = c.describe_instances(**kwargs) if kwargs else c.describe_instances()
 
-        if r.get('Reservations'):
-            instances.extend(r['Reservations'][0]['Instances'])
+        for reservation in r.get('Reservations', []):
+            instances.extend(reservation['Instances'])
 
         return instances
 
+    # 只获取同一地域的指定实例
+    @classmethod
+    def describe_instances_by_id(cls, region_id, instance_ids):
+        return cls.get_instances(region_id, InstanceIds=list(instance_ids))
+
     @classmethod
     def stop(cls, data):
         c = cls._get_client(data['region_id'])
@@ -48,6 +53,14 @@ class Zcloud:
 
         c.reboot_instances(InstanceIds=[data['instance_id']])
 
+    # 批量操作同一地域的多个实例
+    @classmethod
+    def batch(cls, cmd, region_id, instance_ids):
+        c = cls._get_client(region_id)
+        actions = {'start': c.start_instances, 'stop': c.stop_instances, 'reboot': c.reboot_instances}
+
+        actions[cmd](InstanceIds=list(instance_ids))
+
     @classmethod
     def get_public_ip(cls, data):
         r = cls.get_instances(region=data['region_id'], InstanceIds=[data['instance_id']])
@@ -75,24 +88,39 @@ class Zcloud:
             resp.append(image)
         return resp
 
+    @staticmethod
+    def _format_disk(one):
+        category = one.get('VolumeType','')
+        attachment = (one.get('Attachments') or [{}])[0]
+        disk = dict()
+        disk['DiskId'] = one.get('VolumeId','')
+        disk['DiskName'] = ''
+        disk['DiskType'] = ''
+        disk['DiskCategory'] = ZCLOUD_DISK_TYPE.get(category, category)
+        disk['DiskSize'] = one['Size']
+        disk['InstanceId'] = attachment.get('InstanceId','')
+        disk['Device'] = attachment.get('Device','')
+        return disk
+
     @classmethod
     def describe_disk(cls, data):
+        ''' data中有instance_id时, 只返回挂载在该实例上的disk '''
         c = cls._get_client(data['region_id'])
-        disks = c.describe_volumes()
+        kwargs = {}
+        if data.get('instance_id'):
+            kwargs['Filters'] = [{'Name': 'attachment.instance-id', 'Values': [data['instance_id']]}]
+
         resp = list()
-        if not len(disks['Volumes']):
-            return resp
-        for one in disks['Volumes']:
-            disk = dict()
-            category = one.get('VolumeType','')
-            disk['DiskId'] = one.get('VolumeId','')
-            disk['DiskName'] = ''
-            disk['DiskType'] = ''
-            disk['DiskCategory'] = ZCLOUD_DISK_TYPE.get(category, category)
-            disk['DiskSize'] = one['Size']
-            disk['InstanceId'] = one.get('Attachments', [])[0].get('InstanceId','')
-            disk['Device'] = one.get('Attachments', [])[0].get('Device','')
-            resp.append(disk)
+        for page in c.get_paginator('describe_volumes').paginate(**kwargs):
+            resp.extend([cls._format_disk(one) for one in page['Volumes']])
+        return resp
+
+    # 一次获取整个地域的disk, 按挂载的实例分组 {InstanceId: [disk, ...]}
+    @classmethod
+    def describe_region_disks(cls, region_id):
+        resp = dict()
+        for disk in cls.describe_disk({'region_id': region_id}):
+            resp.setdefault(disk['InstanceId'], []).append(disk)
         return resp
 
 